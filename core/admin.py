@@ -1,12 +1,154 @@
-from django.contrib import admin
-from .models import Paciente, ProvedorIA, PromptIA, ExameOCT
+import io
+import os
+import json
+from datetime import datetime, timedelta
+from django.conf import settings
+from django.contrib import admin, messages
+from django.core.paginator import Paginator
+from django.db import connections, models
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path
+from django.utils import timezone
+from django.utils.functional import cached_property
+from .forms import ImportacaoPacientesForm
+from .importacao import ArquivoInvalido, ArquivoRejeitados, importar_pacientes, ler_csv, ler_hl7
+from .models import Paciente, ProvedorIA, PromptIA, ExameOCT, ChamadaIA
+from .telemetria import relatorio_chamadas
+
+class PaginadorEstimado(Paginator):
+    """
+    Paginator para tabelas grandes: no PostgreSQL evita o COUNT(*) completo
+    usando a estimativa de linhas do planejador quando ela passa de LIMITE.
+    Nos demais bancos, sem estimativa barata, a contagem é exata (um total
+    truncado tornaria inacessíveis as páginas além dele).
+    """
+    LIMITE = 10000
+
+    @cached_property
+    def count(self):
+        consulta = self.object_list.order_by()
+        if connections[consulta.db].vendor == 'postgresql':
+            estimativa = self._estimativa_postgres(consulta)
+            if estimativa > self.LIMITE:
+                return estimativa
+        return consulta.count()
+
+    @staticmethod
+    def _estimativa_postgres(consulta):
+        sql, params = consulta.query.sql_with_params()
+        with connections[consulta.db].cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plano = cursor.fetchone()[0]
+        if isinstance(plano, str):
+            plano = json.loads(plano)
+        return int(plano[0]['Plan']['Plan Rows'])
+
+class ConsultaTabelaGrande(models.QuerySet):
+    """
+    QuerySet das listagens do admin: os níveis de ano e mês do date_hierarchy
+    saem do MIN/MAX da coluna (índice) em vez de um DISTINCT sobre todas as
+    linhas. O nível de dias continua com DISTINCT, restrito ao mês filtrado.
+    """
+
+    def datetimes(self, field_name, kind, order='ASC', tzinfo=None):
+        if kind not in ('year', 'month'):
+            return super().datetimes(field_name, kind, order, tzinfo)
+
+        limites = self.aggregate(primeiro=models.Min(field_name), ultimo=models.Max(field_name))
+        if limites['primeiro'] is None:
+            return []
+        primeiro = timezone.localtime(limites['primeiro'])
+        ultimo = timezone.localtime(limites['ultimo'])
+
+        if kind == 'year':
+            periodos = [(ano, 1) for ano in range(primeiro.year, ultimo.year + 1)]
+        else:
+            periodos = [
+                divmod(mes, 12)
+                for mes in range(primeiro.year * 12 + primeiro.month - 1, ultimo.year * 12 + ultimo.month)
+            ]
+            periodos = [(ano, mes + 1) for ano, mes in periodos]
+
+        if order != 'ASC':
+            periodos.reverse()
+        return [timezone.make_aware(datetime(ano, mes, 1)) for ano, mes in periodos]
+
+class AdminTabelaGrande(admin.ModelAdmin):
+    """Listagem sem contagens exatas: paginação estimada e sem total/facetas"""
+    paginator = PaginadorEstimado
+    show_full_result_count = False
+    show_facets = admin.ShowFacets.NEVER
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        return ConsultaTabelaGrande(self.model, query=queryset.query.chain(), using=queryset.db)
 
 @admin.register(Paciente)
-class PacienteAdmin(admin.ModelAdmin):
+class PacienteAdmin(AdminTabelaGrande):
     list_display = ['nome', 'data_nascimento', 'prontuario', 'criado_em']
     list_filter = ['criado_em', 'data_nascimento']
-    search_fields = ['nome', 'prontuario']
+    # Prefixo do nome e prontuário exato usam os índices (também no autocomplete)
+    search_fields = ['^nome', '=prontuario']
+    date_hierarchy = 'criado_em'
     ordering = ['nome']
+    change_list_template = 'admin/core/paciente/change_list.html'
+
+    def get_urls(self):
+        urls = [
+            path('importar/', self.admin_site.admin_view(self.importar_view), name='core_paciente_importar'),
+        ]
+        return urls + super().get_urls()
+
+    def importar_view(self, request):
+        """Upload de CSV/HL7 para importação em massa de pacientes"""
+        if not self.has_add_permission(request) or not self.has_change_permission(request):
+            return redirect('admin:core_paciente_changelist')
+
+        form = ImportacaoPacientesForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            os.makedirs(settings.IMPORTACAO_REJEITADOS_DIR, exist_ok=True)
+            rejeitados = ArquivoRejeitados(os.path.join(
+                settings.IMPORTACAO_REJEITADOS_DIR,
+                f"rejeitados_{timezone.now().strftime('%Y%m%d_%H%M%S')}.csv"
+            ))
+
+            # Leitura em streaming do arquivo enviado (em disco se for grande)
+            encoding = form.cleaned_data['encoding']
+            arquivo = io.TextIOWrapper(form.cleaned_data['arquivo'].file, encoding=encoding, newline='')
+            try:
+                if form.cleaned_data['formato'] == 'hl7':
+                    registros = ler_hl7(arquivo)
+                else:
+                    registros = ler_csv(arquivo, form.cleaned_data['delimitador'] or ',')
+                resumo = importar_pacientes(registros, rejeitados)
+            except ArquivoInvalido as e:
+                messages.error(request, str(e))
+                return redirect('admin:core_paciente_importar')
+            except UnicodeDecodeError as e:
+                # Os lotes anteriores ao erro já foram gravados; reimportar é seguro (upsert)
+                form.add_error('encoding', (
+                    f"O arquivo não está em {dict(form.fields['encoding'].choices)[encoding]} "
+                    f"({e.reason}). Registros anteriores ao erro podem já ter sido "
+                    f"gravados; escolha a codificação correta e importe novamente."
+                ))
+            else:
+                messages.success(
+                    request,
+                    f"{resumo['lidos']} registros lidos, {resumo['gravados']} gravados, "
+                    f"{resumo['rejeitados']} rejeitados."
+                )
+                if resumo['rejeitados']:
+                    messages.warning(request, f"Linhas rejeitadas gravadas em: {rejeitados.caminho}")
+                return redirect('admin:core_paciente_changelist')
+
+        context = {
+            **self.admin_site.each_context(request),
+            'title': 'Importar pacientes',
+            'opts': self.model._meta,
+            'form': form,
+        }
+        return TemplateResponse(request, 'admin/core/paciente/importar.html', context)
 
 @admin.register(ProvedorIA)
 class ProvedorIAAdmin(admin.ModelAdmin):
@@ -23,9 +165,56 @@ class PromptIAAdmin(admin.ModelAdmin):
     list_editable = ['ativo']
 
 @admin.register(ExameOCT)
-class ExameOCTAdmin(admin.ModelAdmin):
-    list_display = ['paciente', 'usuario', 'data_exame', 'status']
-    list_filter = ['status', 'data_exame', 'provedor_ia']
-    search_fields = ['paciente__nome', 'usuario__username']
-    readonly_fields = ['data_exame', 'data_diagnostico', 'data_laudo']
+class ExameOCTAdmin(AdminTabelaGrande):
+    list_display = ['paciente', 'usuario', 'data_exame', 'status', 'prioridade']
+    list_filter = ['status', 'prioridade', 'origem', 'provedor_ia']
+    list_select_related = ['paciente', 'usuario']
+    search_fields = ['=paciente__prontuario', '^paciente__nome', '=usuario__username']
+    autocomplete_fields = ['paciente', 'usuario']
+    date_hierarchy = 'data_exame'
+    readonly_fields = ['data_exame', 'data_diagnostico', 'data_laudo', 'analise_iniciada_em', 'origem']
     ordering = ['-data_exame']
+
+@admin.register(ChamadaIA)
+class ChamadaIAAdmin(AdminTabelaGrande):
+    list_display = ['iniciado_em', 'provedor_nome', 'modelo', 'usuario', 'latencia_ms', 'tokens_entrada', 'tokens_saida', 'tokens_raciocinio', 'tentativas', 'resultado']
+    list_filter = ['resultado', 'provedor_nome', 'modelo']
+    list_select_related = ['usuario']
+    search_fields = ['usuario__username', 'versao_prompt']
+    date_hierarchy = 'iniciado_em'
+    ordering = ['-iniciado_em']
+    change_list_template = 'admin/core/chamadaia/change_list.html'
+
+    # Ledger append-only: somente leitura no admin
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    def get_urls(self):
+        urls = [
+            path('relatorio/', self.admin_site.admin_view(self.relatorio_view), name='core_chamadaia_relatorio'),
+        ]
+        return urls + super().get_urls()
+
+    def relatorio_view(self, request):
+        """Latência p50/p95/p99 e tokens por dia/provedor e por usuário"""
+        try:
+            dias = max(int(request.GET.get('dias', 30)), 1)
+        except ValueError:
+            dias = 30
+        dias = min(dias, settings.TELEMETRIA_RELATORIO_DIAS_MAX)
+
+        context = {
+            **self.admin_site.each_context(request),
+            'title': 'Relatório de chamadas de IA',
+            'opts': self.model._meta,
+            'dias': dias,
+            'dias_max': settings.TELEMETRIA_RELATORIO_DIAS_MAX,
+            **relatorio_chamadas(timezone.now() - timedelta(days=dias)),
+        }
+        return TemplateResponse(request, 'admin/core/chamadaia/relatorio.html', context)
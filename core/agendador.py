@@ -0,0 +1,200 @@
+"""
+Agendamento das análises de IA com fila justa ponderada (weighted fair queueing).
+
+Cada par (prioridade, usuário) é um fluxo. Uma solicitação recebe a marca
+virtual de término max(V, última marca do fluxo) + 1 / peso da prioridade,
+onde V é a menor marca ainda na fila. As vagas vão para as menores marcas:
+um exame urgente passa à frente de uma carga em lote, e um usuário com 200
+exames em lote não bloqueia os exames em lote de outro usuário.
+
+A fila e as vagas ficam no banco (SolicitacaoAnalise), então o limite de
+IA_CONCORRENCIA_MAXIMA análises simultâneas vale para todos os processos
+(workers web e watch_oct). A concessão é serializada por um SELECT ... FOR
+UPDATE na linha única de TravaAgendamento. Quem aguarda verifica a fila a
+cada AGENDAMENTO_INTERVALO segundos; uma vaga concedida expira após o prazo
+da análise caso o processo morra sem liberá-la. O processo dono de uma
+solicitação ainda na fila a renova (renovar()); sem renovação por ABANDONO
+ela é descartada.
+"""
+import time
+import logging
+from contextlib import contextmanager
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max, Min
+from django.utils import timezone
+from .models import SolicitacaoAnalise, TravaAgendamento
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# Solicitações não renovadas pelo processo dono há mais que isso são descartadas
+ABANDONO = timedelta(minutes=5)
+# Intervalo de renovação das solicitações em lote pelo processo dono
+RENOVACAO = ABANDONO / 5
+
+class FilaEsgotada(Exception):
+    """Nenhuma vaga liberada dentro do tempo máximo de espera"""
+    pass
+
+def _peso(prioridade):
+    return settings.AGENDAMENTO_PESOS[prioridade]
+
+def _janela_ativa():
+    # Quem aguarda e não verificou a fila nesse intervalo deixou de disputar vaga
+    return max(settings.AGENDAMENTO_INTERVALO * 4, 2)
+
+def _limpar(agora):
+    """Remove vagas expiradas e solicitações cujo processo dono parou de renovar"""
+    SolicitacaoAnalise.objects.filter(estado='executando', expira_em__lt=agora).delete()
+    SolicitacaoAnalise.objects.filter(estado='aguardando', renovada_em__lt=agora - ABANDONO).delete()
+
+def _travar():
+    """
+    Serializa, entre processos, o cálculo das marcas virtuais e a concessão de
+    vagas. Deve ser a primeira escrita da transação, para todos travarem na
+    mesma ordem.
+    """
+    TravaAgendamento.objects.select_for_update().get_or_create(id=1)
+
+def solicitar(exames, usuario, ativa=True):
+    """
+    Coloca os exames na fila, na ordem dada, com a prioridade de cada exame.
+    Com ativa=False (carga em lote), as solicitações só disputam vaga quando
+    aguardar_vaga() for chamado para elas.
+    """
+    agora = timezone.now()
+    usuario_id = getattr(usuario, 'id', None)
+
+    with transaction.atomic():
+        # Sem a trava, duas chamadas simultâneas calculariam V e as últimas
+        # marcas do fluxo sobre a mesma fila e emitiriam marcas repetidas
+        _travar()
+        _limpar(agora)
+        SolicitacaoAnalise.objects.filter(
+            exame__in=[e.id for e in exames], estado='aguardando'
+        ).delete()
+
+        fila = SolicitacaoAnalise.objects.all()
+        virtual = (
+            fila.filter(estado='aguardando').aggregate(v=Min('marca_final'))['v']
+            or fila.filter(estado='executando').aggregate(v=Max('marca_final'))['v']
+            or 0.0
+        )
+        ultimas = dict(
+            fila.filter(usuario_id=usuario_id).order_by()
+            .values_list('prioridade').annotate(ultima=Max('marca_final'))
+        )
+
+        solicitacoes = []
+        for exame in exames:
+            marca = max(virtual, ultimas.get(exame.prioridade, 0.0)) + 1.0 / _peso(exame.prioridade)
+            ultimas[exame.prioridade] = marca
+            solicitacoes.append(SolicitacaoAnalise(
+                exame=exame,
+                usuario_id=usuario_id,
+                prioridade=exame.prioridade,
+                marca_final=marca,
+                criada_em=agora,
+                renovada_em=agora,
+                visto_em=agora if ativa else None,
+            ))
+        return SolicitacaoAnalise.objects.bulk_create(solicitacoes)
+
+def _tentar_conceder(solicitacao):
+    agora = timezone.now()
+    with transaction.atomic():
+        # Uma concessão por vez: o COUNT abaixo não bloqueia linhas, e sem a
+        # trava dois processos poderiam ver a mesma vaga livre
+        _travar()
+        if not SolicitacaoAnalise.objects.filter(id=solicitacao.id).update(visto_em=agora, renovada_em=agora):
+            raise FilaEsgotada('Solicitação removida da fila')
+
+        ocupadas = SolicitacaoAnalise.objects.filter(estado='executando', expira_em__gte=agora).count()
+        livres = settings.IA_CONCORRENCIA_MAXIMA - ocupadas
+        if livres <= 0:
+            return False
+
+        primeiras = list(
+            SolicitacaoAnalise.objects.filter(
+                estado='aguardando', visto_em__gte=agora - timedelta(seconds=_janela_ativa())
+            ).order_by('marca_final', 'id').values_list('id', flat=True)[:livres]
+        )
+        if solicitacao.id not in primeiras:
+            return False
+
+        prazo = agora + timedelta(seconds=settings.IA_PRAZO_SEGUNDOS + 30)
+        return SolicitacaoAnalise.objects.filter(id=solicitacao.id, estado='aguardando').update(
+            estado='executando', expira_em=prazo
+        ) == 1
+
+def aguardar_vaga(solicitacao, espera=None):
+    """
+    Bloqueia até a solicitação receber uma vaga. Com espera (segundos), desiste
+    depois desse tempo: a solicitação sai da fila e FilaEsgotada é levantada.
+    """
+    inicio = time.monotonic()
+    while not _tentar_conceder(solicitacao):
+        if espera is not None and time.monotonic() - inicio >= espera:
+            liberar(solicitacao)
+            raise FilaEsgotada(f'Nenhuma vaga de análise em {espera:.0f} s')
+        time.sleep(settings.AGENDAMENTO_INTERVALO)
+
+    metrics.FILA_ESPERA_SEGUNDOS.labels(solicitacao.prioridade).observe(
+        (timezone.now() - solicitacao.criada_em).total_seconds()
+    )
+
+def renovar(ids):
+    """Sinal de vida do processo dono das solicitações (ids) ainda na fila"""
+    agora = timezone.now()
+    ids = list(ids)
+    for inicio in range(0, len(ids), 500):
+        SolicitacaoAnalise.objects.filter(id__in=ids[inicio:inicio + 500]).update(renovada_em=agora)
+
+def liberar(solicitacao):
+    """Libera a vaga (ou retira da fila)"""
+    SolicitacaoAnalise.objects.filter(id=solicitacao.id).delete()
+
+def cancelar(solicitacoes):
+    """Retira da fila solicitações que não chegaram a aguardar vaga"""
+    SolicitacaoAnalise.objects.filter(
+        id__in=[s.id for s in solicitacoes], estado='aguardando'
+    ).delete()
+
+@contextmanager
+def vaga(exame, usuario, espera=None):
+    """Executa o bloco ocupando uma vaga de análise para o exame"""
+    solicitacao, = solicitar([exame], usuario)
+    try:
+        aguardar_vaga(solicitacao, espera)
+        yield solicitacao
+    finally:
+        liberar(solicitacao)
+
+def situacao():
+    """Profundidade da fila, vagas em uso e espera mais antiga por prioridade"""
+    agora = timezone.now()
+    por_classe = {
+        (prioridade, estado): (total, mais_antiga)
+        for prioridade, estado, total, mais_antiga in (
+            SolicitacaoAnalise.objects.order_by()
+            .values_list('prioridade', 'estado')
+            .annotate(total=Count('id'), mais_antiga=Min('criada_em'))
+        )
+    }
+
+    classes = {}
+    for prioridade in settings.AGENDAMENTO_PESOS:
+        aguardando, mais_antiga = por_classe.get((prioridade, 'aguardando'), (0, None))
+        classes[prioridade] = {
+            'peso': _peso(prioridade),
+            'aguardando': aguardando,
+            'executando': por_classe.get((prioridade, 'executando'), (0, None))[0],
+            'espera_mais_antiga_segundos': round((agora - mais_antiga).total_seconds(), 1) if mais_antiga else 0,
+        }
+
+    return {
+        'concorrencia_maxima': settings.IA_CONCORRENCIA_MAXIMA,
+        'classes': classes,
+    }
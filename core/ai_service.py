@@ -1,20 +1,61 @@
+import io
 import os
+import time
+import hashlib
+import mimetypes
 import logging
 from django.conf import settings
-from google import genai
-from google.genai import types
+from django.utils import timezone
 from .models import ProvedorIA
+from .metrics import medir_analise
+from .telemetria import registrar_chamada
+from .resiliencia import CircuitoAberto, Prazo, erro_retentavel, executar_com_resiliencia
 
 logger = logging.getLogger(__name__)
 
-def get_gemini_client():
-    """Obtém cliente Gemini configurado"""
+MODELO_GEMINI = "gemini-2.5-pro"
+
+# Formatos de imagem aceitos pelo Gemini; TIFF e BMP são convertidos para PNG
+MIME_ACEITOS = {'image/jpeg', 'image/png', 'image/webp'}
+# Modos que o PNG grava sem conversão (inclusive tons de cinza de 16 bits)
+MODOS_PNG = {'1', 'L', 'LA', 'P', 'RGB', 'RGBA', 'I', 'I;16'}
+
+# O SDK do Gemini (google.genai e a pilha httpx/pydantic) custa centenas de ms
+# para importar: ele é carregado no primeiro uso, ou em aquecer() (core.inicializacao).
+
+def versao_prompt(prompt):
+    """Identificador curto e estável do texto do prompt"""
+    return hashlib.sha1(prompt.encode('utf-8')).hexdigest()[:12]
+
+def imagem_para_envio(image_path):
+    """
+    Retorna (bytes, mime_type) da imagem num formato aceito pelo provedor. Em
+    pilhas TIFF multi-frame vai o frame central, como no laudo.
+    """
+    mime_type = mimetypes.guess_type(image_path)[0]
+    if mime_type in MIME_ACEITOS:
+        with open(image_path, "rb") as f:
+            return f.read(), mime_type
+
+    from PIL import Image
+
+    with Image.open(image_path) as imagem:
+        imagem.seek(getattr(imagem, 'n_frames', 1) // 2)
+        if imagem.mode not in MODOS_PNG:
+            imagem = imagem.convert('RGB')
+        saida = io.BytesIO()
+        imagem.save(saida, 'PNG')
+    return saida.getvalue(), 'image/png'
+
+def get_gemini_client(provedor=None, timeout=None):
+    """Obtém cliente Gemini configurado, com timeout (segundos) repassado ao cliente HTTP"""
     try:
         # Buscar provedor Gemini ativo
-        provedor = ProvedorIA.objects.filter(
-            nome__icontains="gemini",
-            ativo=True
-        ).first()
+        if provedor is None:
+            provedor = ProvedorIA.objects.filter(
+                nome__icontains="gemini",
+                ativo=True
+            ).first()
         
         if not provedor:
             raise ValueError("Nenhum provedor Gemini ativo encontrado. Configure um provedor de IA.")
@@ -22,16 +63,23 @@ def get_gemini_client():
         if not provedor.api_key:
             raise ValueError("Chave da API não configurada no provedor Gemini.")
         
-        return genai.Client(api_key=provedor.api_key)
+        from google import genai
+        from google.genai import types
+
+        http_options = types.HttpOptions(timeout=int(timeout * 1000)) if timeout else None
+        return genai.Client(api_key=provedor.api_key, http_options=http_options)
         
     except Exception as e:
         logger.error(f"Erro ao configurar cliente Gemini: {str(e)}")
         raise ValueError(f"Erro ao configurar cliente Gemini: {str(e)}")
 
-def analyze_oct_image(image_path):
+@medir_analise
+def analyze_oct_image(image_path, exame=None, usuario=None):
     """
-    Analisa uma imagem OCT usando Gemini AI e retorna o diagnóstico
+    Analisa uma imagem OCT usando Gemini AI e retorna o diagnóstico.
+    Cada chamada ao provedor é registrada no ledger de telemetria (ChamadaIA).
     """
+    provedor = None
     try:
         # Buscar provedor Gemini ativo
         provedor = ProvedorIA.objects.filter(
@@ -102,23 +150,49 @@ def analyze_oct_image(image_path):
         """
         
         # Ler a imagem
-        with open(image_path, "rb") as f:
-            image_bytes = f.read()
+        image_bytes, mime_type = imagem_para_envio(image_path)
         
-        # Obter cliente Gemini
-        client = get_gemini_client()
+        chamada = {
+            'provedor': provedor,
+            'provedor_nome': provedor.nome,
+            'modelo': MODELO_GEMINI,
+            'versao_prompt': versao_prompt(prompt_template),
+            'usuario': usuario,
+            'exame': exame,
+            'bytes_enviados': len(image_bytes) + len(prompt_template.encode('utf-8')),
+        }
+        tentativas = 0
         
-        # Enviar para Gemini AI
-        response = client.models.generate_content(
-            model="gemini-2.5-pro",
-            contents=[
-                types.Part.from_bytes(
-                    data=image_bytes,
-                    mime_type="image/jpeg",
-                ),
-                prompt_template
-            ],
-        )
+        from google.genai import types
+
+        def enviar(restante):
+            # Cada tentativa é uma chamada ao provedor e gera seu próprio registro,
+            # com latência apenas da chamada (sem as esperas entre tentativas)
+            nonlocal tentativas
+            tentativas += 1
+            chamada['iniciado_em'] = timezone.now()
+            inicio = time.perf_counter()
+            try:
+                # Cliente com o tempo restante do prazo como timeout HTTP
+                client = get_gemini_client(provedor, timeout=restante)
+                response = client.models.generate_content(
+                    model=MODELO_GEMINI,
+                    contents=[
+                        types.Part.from_bytes(
+                            data=image_bytes,
+                            mime_type=mime_type,
+                        ),
+                        prompt_template
+                    ],
+                )
+            except Exception as e:
+                _registrar(chamada, inicio, tentativas=tentativas, erro=str(e))
+                raise
+            _registrar(chamada, inicio, response, 'sucesso' if response.text else 'vazio', tentativas=tentativas)
+            return response
+        
+        # Enviar para Gemini AI (prazo, novas tentativas e disjuntor)
+        response = executar_com_resiliencia(enviar, provedor, Prazo(settings.IA_PRAZO_SEGUNDOS))
         
         if response.text:
             logger.info(f"Análise OCT realizada com sucesso para imagem: {image_path}")
@@ -133,7 +207,8 @@ def analyze_oct_image(image_path):
             return {
                 'success': False,
                 'diagnostico': None,
-                'error': 'Resposta vazia da API de IA'
+                'error': 'Resposta vazia da API de IA',
+                'provedor_usado': provedor.nome
             }
             
     except Exception as e:
@@ -141,9 +216,35 @@ def analyze_oct_image(image_path):
         return {
             'success': False,
             'diagnostico': None,
-            'error': f'Erro na análise: {str(e)}'
+            'error': f'Erro na análise: {str(e)}',
+            'provedor_usado': provedor.nome if provedor else None,
+            # Falha transitória: o exame pode ser reenviado mais tarde
+            'retentavel': isinstance(e, CircuitoAberto) or erro_retentavel(e)
         }
 
+def _registrar(chamada, inicio, response=None, resultado='erro', tentativas=1, erro=''):
+    """
+    Completa os dados de uma tentativa com latência, uso de tokens e versão do
+    modelo; tentativas é o número da tentativa (1 na primeira chamada)
+    """
+    uso = getattr(response, 'usage_metadata', None)
+    tokens_resposta = getattr(uso, 'candidates_token_count', None)
+    tokens_raciocinio = getattr(uso, 'thoughts_token_count', None)
+    tokens_saida = None
+    if tokens_resposta is not None or tokens_raciocinio is not None:
+        tokens_saida = (tokens_resposta or 0) + (tokens_raciocinio or 0)
+    registrar_chamada(
+        **chamada,
+        latencia_ms=int((time.perf_counter() - inicio) * 1000),
+        versao_modelo=getattr(response, 'model_version', None) or '',
+        tokens_entrada=getattr(uso, 'prompt_token_count', None),
+        tokens_saida=tokens_saida,
+        tokens_raciocinio=tokens_raciocinio,
+        tentativas=tentativas,
+        resultado=resultado,
+        erro=erro,
+    )
+
 def create_oct_prompt(prompt_text=None):
     """
     Cria um prompt personalizado para análise OCT
@@ -0,0 +1,204 @@
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+from .models import ExameOCT, ProvedorIA
+from .ai_service import analyze_oct_image
+from . import agendador, cache_service
+
+logger = logging.getLogger(__name__)
+
+def executar_analise(exame, usuario=None, solicitacao=None, espera=None):
+    """
+    Analisa o exame com IA e atualiza diagnóstico e status.
+    A chamada ao provedor aguarda uma vaga no agendador (core.agendador);
+    `solicitacao` é a já enfileirada por enfileirar_analises, e `espera` o
+    tempo máximo na fila (None espera indefinidamente).
+    Retorna o dicionário de resultado de analyze_oct_image.
+    """
+    try:
+        # Obter caminho da imagem
+        image_path = exame.imagem.path
+
+        # Verificar se o arquivo existe
+        if not os.path.exists(image_path):
+            if solicitacao:
+                agendador.liberar(solicitacao)
+            exame.status = 'erro'
+            exame.save()
+            return {
+                'success': False,
+                'diagnostico': None,
+                'error': 'Arquivo de imagem não encontrado',
+                'arquivo_ausente': True
+            }
+
+        if solicitacao is None:
+            solicitacao, = agendador.solicitar([exame], usuario)
+
+        try:
+            agendador.aguardar_vaga(solicitacao, espera)
+        except agendador.FilaEsgotada as e:
+            # Continua 'pendente': o cliente pode tentar de novo mais tarde
+            return {
+                'success': False,
+                'diagnostico': None,
+                'error': f'Fila de análises cheia: {str(e)}',
+                'retentavel': True
+            }
+
+        try:
+            # Reivindica o exame: de duas análises simultâneas só uma passa
+            # daqui (duplo clique, exame da ingestão analisado também pela view)
+            iniciada_em = timezone.now()
+            if not ExameOCT.objects.filter(id=exame.id, status__in=('pendente', 'erro')).update(
+                status='analisando', analise_iniciada_em=iniciada_em
+            ):
+                return {
+                    'success': False,
+                    'diagnostico': None,
+                    'error': 'Este exame já está em análise ou foi analisado',
+                    'em_andamento': True
+                }
+            exame.status = 'analisando'
+            exame.analise_iniciada_em = iniciada_em
+            # update() não dispara post_save
+            cache_service.invalidar_exames([(exame.id, exame.usuario_id)])
+
+            # Buscar provedor Gemini ativo para salvar no exame
+            provedor = ProvedorIA.objects.filter(
+                nome__icontains="gemini",
+                ativo=True
+            ).first()
+
+            # Analisar com IA
+            resultado = analyze_oct_image(image_path, exame=exame, usuario=usuario)
+        finally:
+            agendador.liberar(solicitacao)
+
+        if resultado['success']:
+            # Salvar resultado
+            exame.diagnostico_ia = resultado['diagnostico']
+            exame.data_diagnostico = timezone.now()
+            exame.status = 'concluido'
+            exame.provedor_ia = provedor
+        elif resultado.get('retentavel'):
+            # Falha transitória do provedor: o exame volta para a fila
+            exame.status = 'pendente'
+        else:
+            # Erro na análise
+            exame.status = 'erro'
+        exame.save()
+        return resultado
+
+    except Exception as e:
+        # Erro inesperado
+        exame.status = 'erro'
+        exame.save()
+        return {
+            'success': False,
+            'diagnostico': None,
+            'error': f'Erro interno: {str(e)}'
+        }
+
+def recuperar_analises_interrompidas():
+    """
+    Volta para 'pendente' os exames em 'analisando' além do prazo da análise:
+    o processo que os analisava morreu (worker reiniciado, daemon encerrado).
+    Retorna a quantidade de exames recuperados.
+    """
+    limite = timezone.now() - timedelta(seconds=settings.IA_PRAZO_SEGUNDOS + 60)
+    recuperados = ExameOCT.objects.filter(status='analisando', analise_iniciada_em__lt=limite)
+    # Exames que já estavam em 'analisando' antes do registro do início
+    sem_inicio = ExameOCT.objects.filter(status='analisando', analise_iniciada_em__isnull=True)
+    interrompidos = recuperados | sem_inicio
+    afetados = list(interrompidos.values_list('id', 'usuario_id'))
+    total = interrompidos.filter(id__in=[exame_id for exame_id, _ in afetados]).update(
+        status='pendente', analise_iniciada_em=None
+    )
+    # update() não dispara post_save
+    cache_service.invalidar_exames(afetados)
+    if total:
+        logger.warning(f"{total} exame(s) com análise interrompida voltaram para 'pendente'")
+    return total
+
+# Análises disparadas fora de uma requisição (ex.: ingestão de pastas)
+_executor = None
+# Solicitações enfileiradas por este processo que ainda não têm thread
+_pendentes = {}
+_pendentes_lock = threading.Lock()
+_renovacao = None
+
+def enfileirar_analises(exames, usuario):
+    """
+    Coloca os exames na fila do agendador de uma vez (a carga inteira conta na
+    divisão justa) e agenda a análise em threads de segundo plano.
+    """
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.ANALISE_WORKERS, thread_name_prefix='analise')
+    for solicitacao in agendador.solicitar(exames, usuario, ativa=False):
+        with _pendentes_lock:
+            _pendentes[solicitacao.id] = (solicitacao, usuario)
+        _executor.submit(_analisar_em_segundo_plano)
+    _garantir_renovacao()
+
+def _garantir_renovacao():
+    """Thread que mantém vivas na fila as solicitações ainda sem thread"""
+    global _renovacao
+    if _renovacao is None or not _renovacao.is_alive():
+        _renovacao = threading.Thread(target=_renovar_pendentes, name='analise-renovacao', daemon=True)
+        _renovacao.start()
+
+def _renovar_pendentes():
+    while True:
+        time.sleep(agendador.RENOVACAO.total_seconds())
+        with _pendentes_lock:
+            ids = list(_pendentes)
+        if not ids:
+            continue
+        close_old_connections()
+        try:
+            agendador.renovar(ids)
+        except Exception as e:
+            logger.error(f"Erro ao renovar {len(ids)} solicitação(ões) de análise: {str(e)}")
+
+def aguardar_analises():
+    """Aguarda as análises em andamento; as ainda não iniciadas são descartadas"""
+    if _executor is not None:
+        _executor.shutdown(wait=True, cancel_futures=True)
+        with _pendentes_lock:
+            agendador.cancelar([solicitacao for solicitacao, _ in _pendentes.values()])
+            _pendentes.clear()
+
+def _proxima_pendente():
+    # A thread livre assume a solicitação de menor marca, não a mais antiga:
+    # assim a ordem justa da fila vale também entre cargas deste processo
+    with _pendentes_lock:
+        if not _pendentes:
+            return None, None
+        chave = min(_pendentes, key=lambda i: (_pendentes[i][0].marca_final, i))
+        return _pendentes.pop(chave)
+
+def _analisar_em_segundo_plano():
+    solicitacao, usuario = _proxima_pendente()
+    if solicitacao is None:
+        return
+    close_old_connections()
+    try:
+        exame = ExameOCT.objects.select_related('paciente').filter(id=solicitacao.exame_id).first()
+        if exame is None or exame.diagnostico_ia:
+            agendador.liberar(solicitacao)
+            return
+        resultado = executar_analise(exame, usuario, solicitacao=solicitacao)
+        if not resultado['success']:
+            logger.error(f"Análise do exame {exame.id} falhou: {resultado['error']}")
+    except Exception as e:
+        logger.error(f"Erro na análise em segundo plano do exame {solicitacao.exame_id}: {str(e)}")
+    finally:
+        close_old_connections()
@@ -0,0 +1,117 @@
+"""
+Camada fria para scans e laudos antigos.
+
+O comando arquivar_midia comprime (gzip) os blobs de exames mais antigos que
+ARQUIVO_IDADE_DIAS para ARQUIVO_FRIO_DIR (disco barato, montagem de rede ou
+de object store), registra o local em ArquivoFrio e apaga a cópia do disco
+quente. Os nomes nos campos imagem/laudo_pdf não mudam: quando um arquivo
+arquivado é acessado, o storage (core.storage) o restaura para o disco
+quente, conferindo o SHA-256 contido no próprio nome, e a cópia restaurada
+fica lá até ARQUIVO_CACHE_DIAS sem nova restauração.
+"""
+import os
+import gzip
+import zlib
+import shutil
+import hashlib
+import logging
+import tempfile
+from django.conf import settings
+from django.utils import timezone
+from .models import ArquivoFrio
+from .storage import NOME_BLOB_RE
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+TAMANHO_BLOCO = 1024 * 1024
+
+class RestauracaoFalhou(OSError):
+    """Cópia fria ausente, truncada ou com conteúdo diferente do hash do nome"""
+    pass
+
+def caminho_frio(chave):
+    return os.path.join(settings.ARQUIVO_FRIO_DIR, *chave.split('/'))
+
+def arquivar(storage, nome):
+    """
+    Copia o blob para a camada fria (se ainda não estiver lá) e remove a cópia
+    quente. Retorna o ArquivoFrio.
+    """
+    origem = storage.caminho_quente(nome)
+    registro = ArquivoFrio.objects.filter(nome=nome).first()
+
+    if registro is None or not os.path.exists(caminho_frio(registro.caminho_frio)):
+        chave = f"{nome}.gz"
+        destino = caminho_frio(chave)
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+
+        fd, temporario = tempfile.mkstemp(dir=os.path.dirname(destino), prefix='.arquivando-')
+        try:
+            with open(origem, 'rb') as entrada, os.fdopen(fd, 'wb') as bruto:
+                with gzip.GzipFile(fileobj=bruto, mode='wb', compresslevel=6, mtime=0) as saida:
+                    shutil.copyfileobj(entrada, saida, TAMANHO_BLOCO)
+                bruto.flush()
+                os.fsync(bruto.fileno())
+            os.replace(temporario, destino)
+        except BaseException:
+            if os.path.exists(temporario):
+                os.unlink(temporario)
+            raise
+
+        registro, _ = ArquivoFrio.objects.update_or_create(nome=nome, defaults={
+            'caminho_frio': chave,
+            'tamanho': os.path.getsize(origem),
+            'tamanho_comprimido': os.path.getsize(destino),
+        })
+
+    # Só depois de a cópia fria estar gravada e registrada
+    os.unlink(origem)
+    return registro
+
+def restaurar(storage, nome):
+    """
+    Recria a cópia quente de um blob arquivado. Retorna False se o nome não
+    estiver na camada fria.
+    """
+    registro = ArquivoFrio.objects.filter(nome=nome).first()
+    if registro is None:
+        return False
+
+    esperado = NOME_BLOB_RE.match(nome).group('hash')
+    temporario = storage._temporario()
+    sha256 = hashlib.sha256()
+    try:
+        with gzip.open(caminho_frio(registro.caminho_frio), 'rb') as entrada, open(temporario, 'wb') as saida:
+            for bloco in iter(lambda: entrada.read(TAMANHO_BLOCO), b''):
+                sha256.update(bloco)
+                saida.write(bloco)
+        if sha256.hexdigest() != esperado:
+            raise RestauracaoFalhou(f"Arquivo frio corrompido: {registro.caminho_frio}")
+    except (OSError, EOFError, zlib.error) as e:
+        os.unlink(temporario)
+        if isinstance(e, RestauracaoFalhou):
+            raise
+        raise RestauracaoFalhou(f"Arquivo frio ilegível: {registro.caminho_frio}: {e}") from e
+    except BaseException:
+        os.unlink(temporario)
+        raise
+
+    storage._instalar(temporario, nome)
+    ArquivoFrio.objects.filter(id=registro.id).update(restaurado_em=timezone.now())
+    metrics.ARQUIVO_RESTAURACOES.inc()
+    logger.info(f"{nome} restaurado da camada fria")
+    return True
+
+def disponivel(nome):
+    """Indica se o blob tem cópia na camada fria"""
+    chave = ArquivoFrio.objects.filter(nome=nome).values_list('caminho_frio', flat=True).first()
+    return chave is not None and os.path.exists(caminho_frio(chave))
+
+def remover(registro):
+    """Apaga o arquivo frio e o registro (blob sem referências)"""
+    try:
+        os.unlink(caminho_frio(registro.caminho_frio))
+    except FileNotFoundError:
+        pass
+    registro.delete()
@@ -0,0 +1,83 @@
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.shortcuts import get_object_or_404
+from .models import Paciente, ExameOCT
+
+# Chaves do cache
+CHAVE_CONTAGENS = 'core:contagens'
+CHAVE_VERSAO_PACIENTES = 'core:pacientes:versao'
+
+# Nomes dos fragmentos usados nos templates ({% cache %})
+FRAGMENTO_EXAMES_RECENTES = 'exames_recentes'
+FRAGMENTO_PACIENTES = 'pacientes'
+
+def chave_exame(exame_id):
+    """Chave do exame cacheado na página de análise"""
+    return f'core:exame:{exame_id}'
+
+def chave_imagens_laudo(exame_id, nome_imagem):
+    """Chave das imagens já preparadas para o laudo; muda com o arquivo e com os parâmetros"""
+    return (
+        f'core:laudo_imagens:{exame_id}:{nome_imagem}:'
+        f'{settings.LAUDO_IMAGEM_DPI}:{settings.LAUDO_ORCAMENTO_IMAGENS}:{settings.LAUDO_CORTES_CHAVE}'
+    )
+
+def obter_contagens():
+    """Retorna as contagens do painel inicial, consultando o banco só quando necessário"""
+    contagens = cache.get(CHAVE_CONTAGENS)
+    if contagens is None:
+        contagens = {
+            'pacientes_count': Paciente.objects.count(),
+            'exames_count': ExameOCT.objects.count(),
+        }
+        cache.set(CHAVE_CONTAGENS, contagens, settings.OCT_CACHE_TIMEOUT)
+    return contagens
+
+def obter_exame(exame_id):
+    """Retorna o exame com paciente, usuário e provedor já carregados, via cache"""
+    chave = chave_exame(exame_id)
+    exame = cache.get(chave)
+    if exame is None:
+        exame = get_object_or_404(
+            ExameOCT.objects.select_related('paciente', 'usuario', 'provedor_ia'),
+            id=exame_id
+        )
+        cache.set(chave, exame, settings.OCT_CACHE_TIMEOUT)
+    return exame
+
+def versao_pacientes():
+    """Versão atual da lista de pacientes, usada na chave dos fragmentos paginados"""
+    versao = cache.get(CHAVE_VERSAO_PACIENTES)
+    if versao is None:
+        # Partir do relógio evita reaproveitar fragmentos de uma versão já descartada pelo LRU
+        cache.add(CHAVE_VERSAO_PACIENTES, time.time_ns(), None)
+        versao = cache.get(CHAVE_VERSAO_PACIENTES)
+    return versao
+
+def invalidar_contagens():
+    cache.delete(CHAVE_CONTAGENS)
+
+def invalidar_exames_recentes(usuario_id):
+    cache.delete(make_template_fragment_key(FRAGMENTO_EXAMES_RECENTES, [usuario_id]))
+
+def invalidar_exame(exame_id):
+    cache.delete(chave_exame(exame_id))
+
+def invalidar_exames(exames):
+    """Invalida exames alterados sem post_save (update/bulk_*), dados como pares (id, usuario_id)"""
+    for exame_id, usuario_id in exames:
+        invalidar_exame(exame_id)
+        invalidar_exames_recentes(usuario_id)
+
+def invalidar_pacientes():
+    """
+    Invalida todas as páginas da lista de pacientes. Como qualquer alteração pode
+    deslocar a ordenação entre páginas, a versão é incrementada em vez de apagar
+    página a página; os fragmentos antigos expiram pelo TTL/LRU.
+    """
+    try:
+        cache.incr(CHAVE_VERSAO_PACIENTES)
+    except ValueError:
+        cache.set(CHAVE_VERSAO_PACIENTES, time.time_ns(), None)
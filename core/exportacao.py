@@ -0,0 +1,132 @@
+"""
+Exportação de exames e diagnósticos para análises de pesquisa e qualidade.
+
+As linhas são lidas com values_list().iterator(chunk_size=...), sem instanciar
+models, e escritas à medida que chegam: a exportação começa imediatamente e
+usa memória constante, qualquer que seja o número de exames.
+"""
+import csv
+import hmac
+import json
+import hashlib
+from datetime import date, datetime
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from .models import ExameOCT
+
+# nome da coluna: (campo no ORM, identifica o paciente)
+COLUNAS = {
+    'exame_id': ('id', False),
+    'data_exame': ('data_exame', False),
+    'status': ('status', False),
+    'paciente_id': ('paciente_id', True),
+    'paciente_nome': ('paciente__nome', True),
+    'paciente_prontuario': ('paciente__prontuario', True),
+    'paciente_data_nascimento': ('paciente__data_nascimento', True),
+    'provedor': ('provedor_ia__nome', False),
+    'usuario': ('usuario__username', False),
+    'data_diagnostico': ('data_diagnostico', False),
+    'diagnostico': ('diagnostico_ia', False),
+    'data_laudo': ('data_laudo', False),
+}
+
+COLUNAS_PADRAO = [
+    'exame_id', 'data_exame', 'status', 'paciente_id', 'paciente_prontuario',
+    'provedor', 'usuario', 'data_diagnostico', 'diagnostico',
+]
+
+def pseudonimo(valor):
+    """Pseudônimo estável (HMAC-SHA256) de um identificador de paciente"""
+    if valor is None:
+        return None
+    chave = settings.EXPORTACAO_CHAVE_PSEUDONIMO.encode('utf-8')
+    return hmac.new(chave, str(valor).encode('utf-8'), hashlib.sha256).hexdigest()[:20]
+
+def _pseudonimizar(coluna, valor):
+    if coluna == 'paciente_nome':
+        return None
+    if coluna == 'paciente_data_nascimento':
+        return valor.year if valor else None
+    return pseudonimo(valor)
+
+def interpretar_parametros(parametros):
+    """
+    Converte parâmetros (GET ou opções do comando) em colunas e filtros.
+    Levanta ValueError com mensagem legível em caso de valor inválido.
+    """
+    colunas = [c.strip() for c in (parametros.get('colunas') or '').split(',') if c.strip()] or COLUNAS_PADRAO
+    desconhecidas = [c for c in colunas if c not in COLUNAS]
+    if desconhecidas:
+        raise ValueError(f"Colunas desconhecidas: {', '.join(desconhecidas)}")
+
+    filtros = {}
+    for parametro, lookup in (('data_inicio', 'data_exame__date__gte'), ('data_fim', 'data_exame__date__lte')):
+        if parametros.get(parametro):
+            data = parse_date(parametros[parametro])
+            if data is None:
+                raise ValueError(f"Data inválida em {parametro}: {parametros[parametro]}")
+            filtros[lookup] = data
+
+    if parametros.get('status'):
+        status = parametros['status'].split(',')
+        validos = {s for s, _ in ExameOCT.STATUS_CHOICES}
+        if not set(status) <= validos:
+            raise ValueError(f"Status inválido. Use: {', '.join(sorted(validos))}")
+        filtros['status__in'] = status
+
+    if parametros.get('provedor'):
+        filtros['provedor_ia__nome__iexact'] = parametros['provedor']
+
+    if parametros.get('usuario'):
+        filtros['usuario__username'] = parametros['usuario']
+
+    return colunas, filtros
+
+def linhas_exportacao(colunas, filtros, pseudonimizar=False):
+    """Gera as linhas (tuplas) da exportação, na ordem das colunas"""
+    campos = [COLUNAS[c][0] for c in colunas]
+    transformar = [
+        (i, c) for i, c in enumerate(colunas) if pseudonimizar and COLUNAS[c][1]
+    ]
+
+    registros = (
+        ExameOCT.objects.filter(**filtros)
+        .order_by('id')
+        .values_list(*campos)
+        .iterator(chunk_size=settings.EXPORTACAO_CHUNK)
+    )
+    for registro in registros:
+        if transformar:
+            registro = list(registro)
+            for i, coluna in transformar:
+                registro[i] = _pseudonimizar(coluna, registro[i])
+        yield registro
+
+def formatar_valor(valor):
+    if isinstance(valor, datetime):
+        return timezone.localtime(valor).isoformat()
+    if isinstance(valor, date):
+        return valor.isoformat()
+    return valor
+
+class _Eco:
+    """Pseudo-arquivo: csv.writer devolve a linha em vez de armazená-la"""
+
+    def write(self, valor):
+        return valor
+
+def gerar_csv(colunas, linhas):
+    escritor = csv.writer(_Eco())
+    yield escritor.writerow(colunas)
+    for linha in linhas:
+        yield escritor.writerow([formatar_valor(v) for v in linha])
+
+def gerar_jsonl(colunas, linhas):
+    for linha in linhas:
+        yield json.dumps(dict(zip(colunas, map(formatar_valor, linha))), ensure_ascii=False) + '\n'
+
+FORMATOS = {
+    'csv': (gerar_csv, 'text/csv; charset=utf-8', 'csv'),
+    'jsonl': (gerar_jsonl, 'application/x-ndjson; charset=utf-8', 'jsonl'),
+}
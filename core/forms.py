@@ -34,8 +34,22 @@ class PacienteForm(forms.ModelForm):
 class ExameOCTForm(forms.ModelForm):
     class Meta:
         model = ExameOCT
-        fields = ['paciente', 'imagem']
+        fields = ['paciente', 'imagem', 'prioridade']
         widgets = {
             'paciente': forms.Select(attrs={'class': 'form-control'}),
+            'prioridade': forms.Select(attrs={'class': 'form-control'}),
             'imagem': forms.FileInput(attrs={'class': 'form-control', 'accept': 'image/*'}),
-        }
\ No newline at end of file
+        }
+
+class ImportacaoPacientesForm(forms.Form):
+    arquivo = forms.FileField(label="Arquivo")
+    formato = forms.ChoiceField(
+        label="Formato",
+        choices=[('csv', 'CSV (nome, data_nascimento, prontuario)'), ('hl7', 'HL7 ADT (segmentos PID)')]
+    )
+    delimitador = forms.CharField(label="Delimitador do CSV", initial=',', max_length=1, required=False)
+    encoding = forms.ChoiceField(
+        label="Codificação",
+        choices=[('utf-8-sig', 'UTF-8'), ('cp1252', 'Windows-1252'), ('latin-1', 'ISO-8859-1 (Latin-1)')],
+        initial='utf-8-sig'
+    )
@@ -0,0 +1,228 @@
+"""
+Importação em massa de pacientes a partir de CSV ou mensagens HL7 ADT.
+
+Os arquivos são lidos linha a linha e gravados em lotes com
+bulk_create(update_conflicts=True) sobre o prontuário, um lote por transação,
+de modo que o uso de memória não cresce com o tamanho do arquivo.
+"""
+import csv
+import logging
+from datetime import datetime
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .models import Paciente, ExameOCT
+from . import cache_service
+
+logger = logging.getLogger(__name__)
+
+FORMATOS_DATA = ('%Y-%m-%d', '%d/%m/%Y', '%Y%m%d')
+
+COLUNAS_REJEITADOS = ['linha', 'nome', 'data_nascimento', 'prontuario', 'erro']
+
+COLUNAS_OBRIGATORIAS = ('nome', 'data_nascimento')
+
+class LinhaInvalida(ValueError):
+    pass
+
+class ArquivoInvalido(ValueError):
+    """O arquivo inteiro não pode ser importado (ex.: cabeçalho sem as colunas obrigatórias)"""
+    pass
+
+def ler_csv(arquivo, delimitador=','):
+    """
+    Retorna um gerador de (número da linha, registro) de um CSV com cabeçalho
+    nome, data_nascimento[, prontuario]. O cabeçalho é lido já na chamada:
+    sem as colunas obrigatórias, levanta ArquivoInvalido antes de qualquer linha.
+    """
+    leitor = csv.DictReader(arquivo, delimiter=delimitador)
+    leitor.fieldnames = [(campo or '').strip().lower() for campo in leitor.fieldnames or []]
+    faltando = [coluna for coluna in COLUNAS_OBRIGATORIAS if coluna not in leitor.fieldnames]
+    if faltando:
+        raise ArquivoInvalido(
+            f"Cabeçalho sem a(s) coluna(s) {', '.join(faltando)} "
+            f"(encontradas: {', '.join(leitor.fieldnames) or 'nenhuma'}); confira o delimitador"
+        )
+    return _linhas_csv(leitor)
+
+def _linhas_csv(leitor):
+    for registro in leitor:
+        yield leitor.line_num, registro
+
+def ler_hl7(arquivo, tamanho_bloco=64 * 1024):
+    """
+    Gera (número da mensagem, registro) a partir dos segmentos PID de mensagens
+    HL7 v2 (ADT). Segmentos podem estar separados por CR, LF ou CRLF.
+    """
+    mensagem = 0
+    resto = ''
+    while True:
+        bloco = arquivo.read(tamanho_bloco)
+        segmentos = (resto + bloco).replace('\r\n', '\r').replace('\n', '\r').split('\r')
+        resto = segmentos.pop() if bloco else ''
+        for segmento in segmentos:
+            if segmento.startswith('MSH'):
+                mensagem += 1
+            elif segmento.startswith('PID'):
+                yield mensagem, _registro_pid(segmento)
+        if not bloco:
+            break
+
+def _registro_pid(segmento):
+    campos = segmento.split('|')
+
+    def campo(indice):
+        # Primeira repetição (~) do campo
+        return campos[indice].split('~')[0] if len(campos) > indice else ''
+
+    # PID-5: sobrenome^nome^nome do meio
+    partes_nome = campo(5).split('^')
+    nome = ' '.join(p for p in partes_nome[1:3] + partes_nome[:1] if p)
+
+    return {
+        'nome': nome,
+        'data_nascimento': campo(7)[:8],
+        'prontuario': campo(3).split('^')[0],
+    }
+
+def validar(registro):
+    """Normaliza e valida um registro, retornando os campos do Paciente"""
+    nome = (registro.get('nome') or '').strip()
+    prontuario = (registro.get('prontuario') or '').strip() or None
+    data_texto = (registro.get('data_nascimento') or '').strip()
+
+    if not nome:
+        raise LinhaInvalida('Nome ausente')
+    if len(nome) > 200:
+        raise LinhaInvalida('Nome com mais de 200 caracteres')
+    if prontuario and len(prontuario) > 50:
+        raise LinhaInvalida('Prontuário com mais de 50 caracteres')
+
+    for formato in FORMATOS_DATA:
+        try:
+            data_nascimento = datetime.strptime(data_texto, formato).date()
+            break
+        except ValueError:
+            continue
+    else:
+        raise LinhaInvalida(f'Data de nascimento inválida: {data_texto!r}')
+
+    if data_nascimento > timezone.localdate():
+        raise LinhaInvalida('Data de nascimento no futuro')
+
+    return {'nome': nome, 'data_nascimento': data_nascimento, 'prontuario': prontuario}
+
+class ArquivoRejeitados:
+    """CSV com as linhas rejeitadas, criado apenas se houver rejeição"""
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self.total = 0
+        self._arquivo = None
+        self._escritor = None
+
+    def escrever(self, linha, registro, erro):
+        if self._escritor is None:
+            self._arquivo = open(self.caminho, 'w', newline='', encoding='utf-8')
+            self._escritor = csv.writer(self._arquivo)
+            self._escritor.writerow(COLUNAS_REJEITADOS)
+        self._escritor.writerow([
+            linha,
+            registro.get('nome', ''),
+            registro.get('data_nascimento', ''),
+            registro.get('prontuario', ''),
+            erro,
+        ])
+        self.total += 1
+
+    def fechar(self):
+        if self._arquivo:
+            self._arquivo.close()
+
+def importar_pacientes(registros, rejeitados, tamanho_lote=None):
+    """
+    Valida e grava os registros (iterável de (linha, dict)). Pacientes com
+    prontuário já existente são atualizados; sem prontuário, inseridos, a não
+    ser que já exista paciente sem prontuário com o mesmo nome e nascimento.
+    Reimportar o mesmo arquivo, portanto, não duplica cadastros.
+    Retorna um resumo com as contagens (lidos = gravados + rejeitados).
+    """
+    tamanho_lote = tamanho_lote or settings.IMPORTACAO_TAMANHO_LOTE
+    resumo = {'lidos': 0, 'gravados': 0, 'rejeitados': 0}
+
+    # Dentro do lote, o último registro de cada prontuário prevalece: o
+    # ON CONFLICT não pode atualizar a mesma linha duas vezes no mesmo comando.
+    # O registro substituído é rejeitado, para as contagens fecharem.
+    por_prontuario = {}
+    # Sem prontuário não há chave para o upsert: nome + data de nascimento de um
+    # paciente já cadastrado sem prontuário indicam reimportação, e a linha é rejeitada
+    sem_prontuario = {}
+
+    def gravar():
+        if sem_prontuario:
+            existentes = set(
+                Paciente.objects.filter(
+                    prontuario__isnull=True,
+                    nome__in={nome for nome, _ in sem_prontuario},
+                    data_nascimento__in={data for _, data in sem_prontuario},
+                ).values_list('nome', 'data_nascimento')
+            )
+            for chave in existentes & sem_prontuario.keys():
+                rejeitados.escrever(*sem_prontuario.pop(chave)[:2], 'Paciente sem prontuário já cadastrado')
+
+        lote = [paciente for _, _, paciente in [*por_prontuario.values(), *sem_prontuario.values()]]
+        if not lote:
+            return
+        with transaction.atomic():
+            Paciente.objects.bulk_create(
+                lote,
+                update_conflicts=True,
+                unique_fields=['prontuario'],
+                update_fields=['nome', 'data_nascimento'],
+            )
+        # Exames cacheados exibem nome/nascimento dos pacientes atualizados
+        cache_service.invalidar_exames(
+            ExameOCT.objects.filter(paciente__prontuario__in=list(por_prontuario)).values_list('id', 'usuario_id')
+        )
+        resumo['gravados'] += len(lote)
+        por_prontuario.clear()
+        sem_prontuario.clear()
+
+    try:
+        for linha, registro in registros:
+            resumo['lidos'] += 1
+            try:
+                dados = validar(registro)
+            except LinhaInvalida as e:
+                rejeitados.escrever(linha, registro, str(e))
+                continue
+
+            paciente = Paciente(**dados)
+            if paciente.prontuario:
+                anterior = por_prontuario.pop(paciente.prontuario, None)
+                if anterior is not None:
+                    rejeitados.escrever(*anterior[:2], f'Prontuário repetido na linha {linha}')
+                por_prontuario[paciente.prontuario] = (linha, registro, paciente)
+            else:
+                chave = (paciente.nome, paciente.data_nascimento)
+                if chave in sem_prontuario:
+                    rejeitados.escrever(
+                        linha, registro, f'Paciente sem prontuário repetido na linha {sem_prontuario[chave][0]}'
+                    )
+                    continue
+                sem_prontuario[chave] = (linha, registro, paciente)
+
+            if len(por_prontuario) + len(sem_prontuario) >= tamanho_lote:
+                gravar()
+
+        gravar()
+    finally:
+        rejeitados.fechar()
+        resumo['rejeitados'] = rejeitados.total
+        if resumo['gravados']:
+            # bulk_create não dispara post_save
+            cache_service.invalidar_pacientes()
+            cache_service.invalidar_contagens()
+
+    logger.info(f"Importação de pacientes: {resumo}")
+    return resumo
@@ -0,0 +1,189 @@
+"""
+Ingestão de exportações de aparelhos OCT gravadas em pastas monitoradas.
+
+Um arquivo só é ingerido depois que o inotify informa que ele foi fechado após
+a escrita ou, no modo polling (e em compartilhamentos de rede, onde o inotify
+não vê escritas remotas), depois de ficar INGESTAO_ESTABILIDADE segundos sem
+mudar de tamanho ou data de modificação. O paciente é identificado pelo
+prontuário no nome do arquivo (INGESTAO_PADRAO_PRONTUARIO) ou, na falta dele,
+pelo ImageDescription do EXIF.
+Arquivos ingeridos entram no storage endereçado por conteúdo por hardlink (sem
+cópia, no mesmo volume) e o original é removido após a gravação no banco; os
+não identificados vão para a subpasta INGESTAO_PASTA_NAO_IDENTIFICADOS.
+"""
+import os
+import re
+import time
+import shutil
+import logging
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image
+from .models import Paciente, ExameOCT
+from . import cache_service
+
+logger = logging.getLogger(__name__)
+
+EXTENSOES = {'.jpg', '.jpeg', '.png', '.tif', '.tiff', '.bmp'}
+
+# Sufixos de arquivos temporários usados por cópias em andamento
+SUFIXOS_TEMPORARIOS = ('.part', '.tmp', '.crdownload', '.filepart', '.partial')
+
+EXIF_IMAGE_DESCRIPTION = 0x010E
+
+def candidato(nome):
+    """Indica se o nome de arquivo é uma exportação a ingerir"""
+    nome_lower = nome.lower()
+    return (
+        not nome.startswith('.')
+        and not nome_lower.endswith(SUFIXOS_TEMPORARIOS)
+        and os.path.splitext(nome_lower)[1] in EXTENSOES
+    )
+
+def extrair_prontuario(caminho):
+    """Prontuário a partir do nome do arquivo ou dos metadados EXIF"""
+    match = re.search(settings.INGESTAO_PADRAO_PRONTUARIO, os.path.basename(caminho))
+    if match:
+        return match.group('prontuario')
+
+    try:
+        with Image.open(caminho) as imagem:
+            descricao = imagem.getexif().get(EXIF_IMAGE_DESCRIPTION)
+    except Exception:
+        return None
+
+    if isinstance(descricao, str):
+        descricao = descricao.strip('\x00 ')
+        if descricao and len(descricao) <= 50:
+            return descricao
+    return None
+
+class MonitorEstabilidade:
+    """Acompanha tamanho/mtime dos arquivos até considerá-los completos"""
+
+    def __init__(self, estabilidade):
+        self.estabilidade = estabilidade
+        self._vistos = {}
+        self._fechados = set()
+
+    def marcar_fechado(self, caminho):
+        """Arquivo fechado após escrita (inotify): pronto sem aguardar a estabilidade"""
+        self._fechados.add(caminho)
+
+    def prontos(self, diretorios):
+        agora = time.time()
+        presentes = set()
+        prontos = []
+
+        for diretorio in diretorios:
+            try:
+                entradas = list(os.scandir(diretorio))
+            except FileNotFoundError:
+                logger.error(f"Pasta monitorada não encontrada: {diretorio}")
+                continue
+
+            for entrada in entradas:
+                if not entrada.is_file() or not candidato(entrada.name):
+                    continue
+                try:
+                    stat = entrada.stat()
+                except FileNotFoundError:
+                    continue
+
+                assinatura = (stat.st_size, stat.st_mtime_ns)
+                presentes.add(entrada.path)
+                anterior = self._vistos.get(entrada.path)
+                self._vistos[entrada.path] = assinatura
+
+                if stat.st_size == 0:
+                    continue
+                # Na primeira varredura (ex.: após reinício) basta o arquivo já estar parado
+                if entrada.path in self._fechados or (
+                    anterior in (None, assinatura) and agora - stat.st_mtime >= self.estabilidade
+                ):
+                    prontos.append(entrada.path)
+
+        # Esquecer arquivos que sumiram (movidos ou apagados)
+        for caminho in set(self._vistos) - presentes:
+            del self._vistos[caminho]
+        self._fechados &= presentes
+
+        return prontos
+
+def _mover(origem, destino):
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+    # Rename quando no mesmo sistema de arquivos; cópia + remoção entre volumes
+    shutil.move(origem, destino)
+
+def _quarentena(caminho):
+    destino_dir = os.path.join(os.path.dirname(caminho), settings.INGESTAO_PASTA_NAO_IDENTIFICADOS)
+    destino = os.path.join(destino_dir, os.path.basename(caminho))
+    if os.path.exists(destino):
+        base, ext = os.path.splitext(destino)
+        destino = f"{base}_{int(time.time())}{ext}"
+    _mover(caminho, destino)
+    logger.warning(f"Arquivo sem paciente identificado movido para {destino}")
+
+def ingerir_lote(caminhos, usuario):
+    """
+    Cria os ExameOCT dos arquivos prontos em um único bulk_create. Cada arquivo
+    é vinculado ao seu blob no storage e só sai da pasta de origem depois que a
+    gravação no banco for confirmada; se ela falhar, os arquivos permanecem onde
+    estavam e os blobs sem referência ficam para o gc_midia. Arquivo com o mesmo
+    conteúdo de um exame já ingerido para o paciente é só removido da pasta.
+    """
+    prontuarios = {caminho: extrair_prontuario(caminho) for caminho in caminhos}
+    pacientes = Paciente.objects.in_bulk(
+        {p for p in prontuarios.values() if p}, field_name='prontuario'
+    )
+
+    novos = {}
+    vinculados = []
+    campo_imagem = ExameOCT._meta.get_field('imagem')
+
+    for caminho, prontuario in prontuarios.items():
+        paciente = pacientes.get(prontuario)
+        if paciente is None:
+            _quarentena(caminho)
+            continue
+
+        # Exportações em massa do aparelho: menor peso na fila de análises
+        exame = ExameOCT(paciente=paciente, usuario=usuario, prioridade='lote', origem='pasta')
+        exame.imagem.name = default_storage.vincular_arquivo(
+            caminho, campo_imagem.generate_filename(exame, os.path.basename(caminho))
+        )
+        vinculados.append(caminho)
+        novos.setdefault((paciente.id, exame.imagem.name), exame)
+
+    if not vinculados:
+        return []
+
+    # Paciente + nome do blob (SHA-256 do conteúdo) é a chave de idempotência:
+    # se o processo morreu entre o commit e a remoção dos originais, a próxima
+    # varredura encontra os mesmos arquivos e não cria exames em dobro
+    ja_ingeridos = set(
+        ExameOCT.objects.filter(origem='pasta', imagem__in=[nome for _, nome in novos])
+        .values_list('paciente_id', 'imagem')
+    )
+    exames = [exame for chave, exame in novos.items() if chave not in ja_ingeridos]
+    if len(exames) < len(vinculados):
+        logger.info(f"{len(vinculados) - len(exames)} arquivo(s) já ingerido(s) removido(s) da pasta monitorada")
+
+    criados = []
+    if exames:
+        with transaction.atomic():
+            criados = ExameOCT.objects.bulk_create(exames)
+
+    for caminho in vinculados:
+        os.unlink(caminho)
+
+    if not criados:
+        return []
+
+    # bulk_create não dispara post_save
+    cache_service.invalidar_contagens()
+    cache_service.invalidar_exames_recentes(usuario.id)
+
+    logger.info(f"{len(criados)} exame(s) OCT ingerido(s) da pasta monitorada")
+    return criados
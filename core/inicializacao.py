@@ -0,0 +1,90 @@
+"""
+Tempo de inicialização dos processos.
+
+O SDK do Gemini e o ReportLab são importados sob demanda (ai_service e
+pdf_service só carregam na primeira análise ou no primeiro laudo). aquecer()
+antecipa essas importações; o gunicorn.conf.py a chama em segundo plano logo
+após o fork de cada worker quando PREAQUECER_SDKS está ativo.
+
+medir_partida() é executada em um processo novo pelo comando
+benchmark_inicializacao e mede o tempo até a primeira resposta.
+"""
+import io
+import os
+import sys
+import json
+import time
+import logging
+import importlib
+
+logger = logging.getLogger(__name__)
+
+# Módulos carregados sob demanda que não devem ser importados na partida
+MODULOS_SOB_DEMANDA = ('google.genai', 'reportlab')
+
+MODULOS_AQUECIMENTO = (
+    'google.genai',
+    'google.genai.types',
+    'google.genai.errors',
+    'httpx',
+    'core.ai_service',
+    'core.pdf_service',
+)
+
+def aquecer():
+    """Importa os SDKs carregados sob demanda e inicializa os estilos do ReportLab"""
+    inicio = time.perf_counter()
+    for modulo in MODULOS_AQUECIMENTO:
+        importlib.import_module(modulo)
+
+    from reportlab.lib.styles import getSampleStyleSheet
+    getSampleStyleSheet()
+
+    logger.info(f"SDKs pré-carregados em {(time.perf_counter() - inicio) * 1000:.0f} ms")
+
+def carregados_sob_demanda():
+    """Módulos sob demanda já presentes em sys.modules"""
+    return [m for m in MODULOS_SOB_DEMANDA if m in sys.modules]
+
+def medir_partida(caminho):
+    """
+    Carrega a aplicação WSGI, atende uma requisição GET em `caminho` e imprime
+    (JSON) os tempos em ms desde o início do script.
+    """
+    inicio = time.perf_counter()
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'oct_system.settings')
+
+    from django.core.wsgi import get_wsgi_application
+    aplicacao = get_wsgi_application()
+    carregada = time.perf_counter()
+
+    status = []
+    environ = {
+        'REQUEST_METHOD': 'GET',
+        'PATH_INFO': caminho,
+        'QUERY_STRING': '',
+        'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '80',
+        'HTTP_HOST': 'localhost',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'wsgi.input': io.BytesIO(),
+        'wsgi.errors': sys.stderr,
+        'wsgi.url_scheme': 'http',
+        'wsgi.version': (1, 0),
+        'wsgi.multithread': False,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    resposta = aplicacao(environ, lambda s, cabecalhos, exc_info=None: status.append(s))
+    for _ in resposta:
+        pass
+    if hasattr(resposta, 'close'):
+        resposta.close()
+    respondida = time.perf_counter()
+
+    print(json.dumps({
+        'aplicacao_ms': (carregada - inicio) * 1000,
+        'primeira_resposta_ms': (respondida - inicio) * 1000,
+        'status': status[0] if status else '',
+        'sob_demanda_carregados': carregados_sob_demanda(),
+    }))
@@ -0,0 +1,83 @@
+import os
+from datetime import timedelta
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from core.models import ArquivoFrio, ExameOCT
+from core.storage import ArmazenamentoConteudo
+from core import arquivo_frio
+
+CAMPOS = ('imagem', 'laudo_pdf')
+
+
+class Command(BaseCommand):
+    help = "Move scans e laudos de exames antigos para a camada fria (compactados)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--idade-dias', type=int, default=None,
+            help="Arquiva exames mais antigos que isso (padrão: ARQUIVO_IDADE_DIAS)"
+        )
+        parser.add_argument('--limite', type=int, default=None, help="Máximo de arquivos arquivados nesta execução")
+        parser.add_argument('--dry-run', action='store_true', help="Apenas lista o que seria arquivado")
+
+    def handle(self, *args, **options):
+        if not isinstance(default_storage, ArmazenamentoConteudo):
+            raise CommandError("O storage padrão não é o ArmazenamentoConteudo")
+
+        agora = timezone.now()
+        idade_dias = options['idade_dias'] if options['idade_dias'] is not None else settings.ARQUIVO_IDADE_DIAS
+        corte = agora - timedelta(days=idade_dias)
+        # Cópias restauradas há mais que isso voltam a ficar só na camada fria
+        cache_expirado = agora - timedelta(days=settings.ARQUIVO_CACHE_DIAS)
+
+        # Um blob compartilhado com um exame recente continua no disco
+        recentes = set()
+        for campos in ExameOCT.objects.filter(data_exame__gte=corte).values_list(*CAMPOS).iterator(chunk_size=5000):
+            recentes.update(nome for nome in campos if nome)
+        arquivados = dict(ArquivoFrio.objects.values_list('nome', 'restaurado_em'))
+
+        resumo = {'arquivados': 0, 'liberados': 0, 'bytes': 0, 'legados': 0}
+        for nome in self._candidatos(corte, recentes):
+            if not default_storage.eh_blob(nome):
+                # Nome anterior ao storage por conteúdo: rodar migrar_midia antes
+                resumo['legados'] += 1
+                continue
+
+            caminho = default_storage.caminho_quente(nome)
+            if not os.path.exists(caminho):
+                continue
+            if arquivados.get(nome) and arquivados[nome] >= cache_expirado:
+                continue
+
+            if options['limite'] is not None and resumo['arquivados'] + resumo['liberados'] >= options['limite']:
+                break
+
+            tamanho = os.path.getsize(caminho)
+            if options['dry_run']:
+                self.stdout.write(nome)
+            else:
+                arquivo_frio.arquivar(default_storage, nome)
+            resumo['liberados' if nome in arquivados else 'arquivados'] += 1
+            resumo['bytes'] += tamanho
+
+        acao = "seriam" if options['dry_run'] else "foram"
+        self.stdout.write(self.style.SUCCESS(
+            f"{resumo['arquivados']} arquivo(s) {acao} arquivado(s) e {resumo['liberados']} cópia(s) "
+            f"restaurada(s) {acao} liberada(s), {resumo['bytes'] / 1024 / 1024:.1f} MB"
+        ))
+        if resumo['legados']:
+            self.stdout.write(self.style.WARNING(
+                f"{resumo['legados']} arquivo(s) fora do storage por conteúdo ignorado(s); rode migrar_midia"
+            ))
+
+    def _candidatos(self, corte, recentes):
+        """Nomes (sem repetição) dos arquivos de exames anteriores ao corte, dos mais antigos"""
+        vistos = set(recentes)
+        antigos = ExameOCT.objects.filter(data_exame__lt=corte).order_by('data_exame').values_list(*CAMPOS)
+        for campos in antigos.iterator(chunk_size=5000):
+            for nome in campos:
+                if nome and nome not in vistos:
+                    vistos.add(nome)
+                    yield nome
@@ -0,0 +1,85 @@
+import sys
+import json
+import time
+import statistics
+import subprocess
+from collections import defaultdict
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+SCRIPT = "from core.inicializacao import medir_partida; medir_partida({caminho!r})"
+
+
+class Command(BaseCommand):
+    help = "Mede a inicialização a frio (importações e primeira resposta) e compara com o orçamento"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeticoes', type=int, default=5, help="Processos medidos (usa a mediana)")
+        parser.add_argument('--caminho', default='/accounts/login/', help="URL da primeira requisição")
+        parser.add_argument(
+            '--orcamento-ms', type=float, default=None,
+            help="Tempo máximo até a primeira resposta (padrão: INICIALIZACAO_ORCAMENTO_MS)"
+        )
+        parser.add_argument('--top', type=int, default=15, help="Pacotes listados no detalhamento de importação")
+
+    def handle(self, *args, **options):
+        orcamento = options['orcamento_ms'] or settings.INICIALIZACAO_ORCAMENTO_MS
+        script = SCRIPT.format(caminho=options['caminho'])
+
+        self._detalhar_importacoes(script, options['top'])
+
+        medicoes = []
+        for _ in range(options['repeticoes']):
+            inicio = time.perf_counter()
+            resultado = self._executar([sys.executable, '-c', script])
+            resultado['total_ms'] = (time.perf_counter() - inicio) * 1000
+            medicoes.append(resultado)
+
+        self.stdout.write(f"\nInicialização a frio (mediana de {len(medicoes)} processo(s)):")
+        for chave, rotulo in (
+            ('aplicacao_ms', 'Aplicação WSGI carregada'),
+            ('primeira_resposta_ms', 'Primeira resposta'),
+            ('total_ms', 'Processo (com o interpretador)'),
+        ):
+            self.stdout.write(f"  {rotulo:<32} {statistics.median(m[chave] for m in medicoes):8.1f} ms")
+        self.stdout.write(f"  {'Status da resposta':<32} {medicoes[0]['status']}")
+
+        falhas = []
+        mediana = statistics.median(m['total_ms'] for m in medicoes)
+        if mediana > orcamento:
+            falhas.append(f"primeira resposta em {mediana:.0f} ms, acima do orçamento de {orcamento:.0f} ms")
+        carregados = sorted({m for r in medicoes for m in r['sob_demanda_carregados']})
+        if carregados:
+            falhas.append(f"módulos sob demanda importados na partida: {', '.join(carregados)}")
+
+        if falhas:
+            raise CommandError('; '.join(falhas))
+        self.stdout.write(self.style.SUCCESS(f"\nDentro do orçamento de {orcamento:.0f} ms"))
+
+    def _executar(self, comando):
+        processo = subprocess.run(comando, cwd=settings.BASE_DIR, capture_output=True, text=True)
+        if processo.returncode != 0:
+            raise CommandError(f"Falha ao iniciar a aplicação:\n{processo.stderr}")
+        return json.loads(processo.stdout.strip().splitlines()[-1])
+
+    def _detalhar_importacoes(self, script, top):
+        """Tempo próprio de importação (-X importtime) somado por pacote raiz"""
+        processo = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', script],
+            cwd=settings.BASE_DIR, capture_output=True, text=True,
+        )
+        por_pacote = defaultdict(int)
+        total = 0
+        for linha in processo.stderr.splitlines():
+            if not linha.startswith('import time:'):
+                continue
+            partes = linha[len('import time:'):].split('|')
+            if len(partes) != 3 or not partes[0].strip().isdigit():
+                continue
+            proprio = int(partes[0])
+            por_pacote[partes[2].strip().split('.')[0]] += proprio
+            total += proprio
+
+        self.stdout.write(f"Importações: {total / 1000:.1f} ms no total")
+        for pacote, microssegundos in sorted(por_pacote.items(), key=lambda i: i[1], reverse=True)[:top]:
+            self.stdout.write(f"  {pacote:<32} {microssegundos / 1000:8.1f} ms")
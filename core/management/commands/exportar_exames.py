@@ -0,0 +1,78 @@
+import sys
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from core import exportacao
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+
+class Command(BaseCommand):
+    help = "Exporta exames OCT com pacientes, provedores e diagnósticos em streaming"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--saida', help="Arquivo de saída (padrão: saída padrão; obrigatório para parquet)")
+        parser.add_argument('--formato', choices=['csv', 'jsonl', 'parquet'], default='csv')
+        parser.add_argument(
+            '--colunas',
+            help=f"Colunas separadas por vírgula. Disponíveis: {', '.join(exportacao.COLUNAS)}"
+        )
+        parser.add_argument('--data-inicio', help="Data do exame inicial (AAAA-MM-DD)")
+        parser.add_argument('--data-fim', help="Data do exame final (AAAA-MM-DD)")
+        parser.add_argument('--status', help="Status separados por vírgula")
+        parser.add_argument('--provedor', help="Nome do provedor de IA")
+        parser.add_argument('--usuario', help="Username do responsável pelo exame")
+        parser.add_argument(
+            '--pseudonimizar', action='store_true',
+            help="Substitui identificadores do paciente por pseudônimos (HMAC) e omite o nome"
+        )
+
+    def handle(self, *args, **options):
+        try:
+            colunas, filtros = exportacao.interpretar_parametros(options)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        linhas = exportacao.linhas_exportacao(colunas, filtros, options['pseudonimizar'])
+
+        if options['formato'] == 'parquet':
+            total = self._parquet(colunas, linhas, options['saida'])
+        else:
+            gerar = exportacao.FORMATOS[options['formato']][0]
+            saida = open(options['saida'], 'w', newline='', encoding='utf-8') if options['saida'] else sys.stdout
+            total = -1 if options['formato'] == 'csv' else 0
+            try:
+                for trecho in gerar(colunas, linhas):
+                    saida.write(trecho)
+                    total += 1
+            finally:
+                if saida is not sys.stdout:
+                    saida.close()
+
+        if options['saida']:
+            self.stdout.write(self.style.SUCCESS(f"{total} exame(s) exportado(s) para {options['saida']}"))
+
+    def _parquet(self, colunas, linhas, caminho):
+        """Grava em Parquet um row group por lote, com colunas em texto"""
+        if pa is None:
+            raise CommandError("Formato parquet requer o pacote pyarrow")
+        if not caminho:
+            raise CommandError("Informe --saida para o formato parquet")
+
+        schema = pa.schema([(coluna, pa.string()) for coluna in colunas])
+        total = 0
+        lote = []
+        with pq.ParquetWriter(caminho, schema) as escritor:
+            for linha in linhas:
+                lote.append([None if v is None else str(exportacao.formatar_valor(v)) for v in linha])
+                if len(lote) >= settings.EXPORTACAO_CHUNK:
+                    escritor.write_table(pa.Table.from_pylist([dict(zip(colunas, l)) for l in lote], schema))
+                    total += len(lote)
+                    lote = []
+            if lote:
+                escritor.write_table(pa.Table.from_pylist([dict(zip(colunas, l)) for l in lote], schema))
+                total += len(lote)
+        return total
@@ -0,0 +1,101 @@
+import os
+import time
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from core.models import ArquivoFrio, ExameOCT
+from core.storage import ArmazenamentoConteudo, PASTA_TEMPORARIA
+from core import arquivo_frio, upload_service
+
+
+def referenciado(nome):
+    """Consulta pontual, logo antes da remoção: a lista inicial pode estar defasada"""
+    return ExameOCT.objects.filter(Q(imagem=nome) | Q(laudo_pdf=nome)).exists()
+
+
+def nomes_referenciados():
+    """Nomes de arquivo apontados por algum exame (imagem ou laudo)"""
+    referenciados = set()
+    for imagem, laudo in ExameOCT.objects.values_list('imagem', 'laudo_pdf').iterator(chunk_size=5000):
+        referenciados.update(nome for nome in (imagem, laudo) if nome)
+    return referenciados
+
+
+class Command(BaseCommand):
+    help = "Remove blobs de mídia que nenhum exame referencia (inclusive na camada fria), temporários e uploads abandonados"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--idade-minima', type=float, default=24,
+            help="Só remove arquivos sem modificação há pelo menos estas horas (padrão: 24)"
+        )
+        parser.add_argument('--dry-run', action='store_true', help="Apenas lista o que seria removido")
+
+    def handle(self, *args, **options):
+        if not isinstance(default_storage, ArmazenamentoConteudo):
+            raise CommandError("O storage padrão não é o ArmazenamentoConteudo")
+
+        # A carência evita apagar um blob gravado por um upload cujo exame
+        # ainda não foi salvo no banco
+        limite = time.time() - options['idade_minima'] * 3600
+        if not options['dry_run']:
+            expirados = upload_service.expirar()
+            if expirados:
+                self.stdout.write(f"{expirados} upload(s) resumível(is) expirado(s) removido(s)")
+        referenciados = nomes_referenciados()
+        raiz = default_storage.location
+
+        removidos = 0
+        liberados = 0
+        for pasta, subpastas, arquivos in os.walk(raiz):
+            relativa = os.path.relpath(pasta, raiz).replace(os.sep, '/')
+            temporaria = relativa == PASTA_TEMPORARIA
+
+            for arquivo in arquivos:
+                nome = f"{relativa}/{arquivo}"
+                if not temporaria and (not default_storage.eh_blob(nome) or nome in referenciados):
+                    continue
+
+                caminho = os.path.join(pasta, arquivo)
+                try:
+                    stat = os.stat(caminho)
+                except FileNotFoundError:
+                    continue
+                if stat.st_mtime > limite:
+                    continue
+                if not temporaria and referenciado(nome):
+                    # Passou a ser usado por um exame gravado durante a varredura
+                    continue
+
+                if options['dry_run']:
+                    self.stdout.write(nome)
+                else:
+                    try:
+                        # Reaproveitado (mtime renovado) desde o primeiro stat
+                        if os.stat(caminho).st_mtime > limite:
+                            continue
+                        os.unlink(caminho)
+                    except FileNotFoundError:
+                        continue
+                removidos += 1
+                liberados += stat.st_size
+
+        # Cópias na camada fria de blobs que nenhum exame referencia mais
+        frios = [
+            registro for registro in ArquivoFrio.objects.iterator(chunk_size=5000)
+            if registro.nome not in referenciados and registro.arquivado_em.timestamp() <= limite
+        ]
+        for registro in frios:
+            if referenciado(registro.nome):
+                continue
+            if options['dry_run']:
+                self.stdout.write(f"{registro.nome} (camada fria)")
+            else:
+                arquivo_frio.remover(registro)
+            removidos += 1
+            liberados += registro.tamanho_comprimido
+
+        acao = "seriam removido(s)" if options['dry_run'] else "removido(s)"
+        self.stdout.write(self.style.SUCCESS(
+            f"{removidos} arquivo(s) {acao}, {liberados / 1024 / 1024:.1f} MB"
+        ))
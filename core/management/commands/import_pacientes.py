@@ -0,0 +1,51 @@
+import os
+from django.core.management.base import BaseCommand, CommandError
+from core.importacao import ArquivoInvalido, ArquivoRejeitados, importar_pacientes, ler_csv, ler_hl7
+
+
+class Command(BaseCommand):
+    help = "Importa pacientes de um arquivo CSV ou HL7 ADT, atualizando os já existentes pelo prontuário"
+
+    def add_arguments(self, parser):
+        parser.add_argument('arquivo', help="Caminho do arquivo a importar")
+        parser.add_argument(
+            '--formato', choices=['csv', 'hl7'],
+            help="Formato do arquivo (padrão: deduzido pela extensão)"
+        )
+        parser.add_argument('--delimitador', default=',', help="Delimitador do CSV (padrão: ,)")
+        parser.add_argument('--encoding', default='utf-8-sig', help="Codificação do arquivo (padrão: utf-8-sig)")
+        parser.add_argument('--lote', type=int, help="Registros por lote/transação")
+        parser.add_argument(
+            '--rejeitados',
+            help="CSV de saída com as linhas rejeitadas (padrão: <arquivo>.rejeitados.csv)"
+        )
+
+    def handle(self, *args, **options):
+        caminho = options['arquivo']
+        if not os.path.isfile(caminho):
+            raise CommandError(f"Arquivo não encontrado: {caminho}")
+
+        formato = options['formato'] or ('hl7' if caminho.lower().endswith(('.hl7', '.txt')) else 'csv')
+        rejeitados = ArquivoRejeitados(options['rejeitados'] or f"{caminho}.rejeitados.csv")
+
+        with open(caminho, encoding=options['encoding'], newline='') as arquivo:
+            try:
+                if formato == 'hl7':
+                    registros = ler_hl7(arquivo)
+                else:
+                    registros = ler_csv(arquivo, options['delimitador'])
+                resumo = importar_pacientes(registros, rejeitados, options['lote'])
+            except ArquivoInvalido as e:
+                raise CommandError(str(e))
+            except UnicodeDecodeError as e:
+                raise CommandError(
+                    f"O arquivo não está em {options['encoding']} ({e.reason}); "
+                    f"os lotes anteriores ao erro já foram gravados. Use --encoding e importe novamente."
+                )
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{resumo['lidos']} registros lidos, {resumo['gravados']} gravados, "
+            f"{resumo['rejeitados']} rejeitados."
+        ))
+        if resumo['rejeitados']:
+            self.stdout.write(self.style.WARNING(f"Linhas rejeitadas em: {rejeitados.caminho}"))
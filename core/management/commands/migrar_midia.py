@@ -0,0 +1,98 @@
+import os
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from core.models import ExameOCT
+from core.storage import ArmazenamentoConteudo
+from core import cache_service
+
+CAMPOS = ('imagem', 'laudo_pdf')
+
+
+class Command(BaseCommand):
+    help = "Move os arquivos de mídia existentes para o armazenamento endereçado por conteúdo"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=500, help="Exames atualizados por transação")
+        parser.add_argument('--dry-run', action='store_true', help="Apenas conta os arquivos a migrar")
+
+    def handle(self, *args, **options):
+        if not isinstance(default_storage, ArmazenamentoConteudo):
+            raise CommandError("O storage padrão não é o ArmazenamentoConteudo")
+
+        self.resumo = {'migrados': 0, 'deduplicados': 0, 'ausentes': 0}
+        self.blobs = set()
+        # nome antigo -> blob, para arquivos apontados por mais de um exame
+        self.convertidos = {}
+        # originais a remover quando o lote for gravado
+        self.originais = []
+
+        pendentes = (
+            ExameOCT.objects.only('id', *CAMPOS)
+            .order_by('id')
+            .iterator(chunk_size=options['lote'])
+        )
+
+        lote = []
+        for exame in pendentes:
+            if self._converter(exame, options['dry_run']):
+                lote.append(exame)
+            if len(lote) >= options['lote']:
+                self._gravar(lote, options['dry_run'])
+                lote = []
+        self._gravar(lote, options['dry_run'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{self.resumo['migrados']} arquivo(s) migrado(s), "
+            f"{self.resumo['deduplicados']} duplicado(s), "
+            f"{self.resumo['ausentes']} ausente(s) em disco"
+        ))
+
+    def _converter(self, exame, dry_run):
+        alterado = False
+        for campo in CAMPOS:
+            arquivo = getattr(exame, campo)
+            if not arquivo or default_storage.eh_blob(arquivo.name):
+                continue
+
+            if arquivo.name in self.convertidos:
+                arquivo.name = self.convertidos[arquivo.name]
+                alterado = True
+                continue
+
+            caminho = default_storage.path(arquivo.name)
+            if not os.path.exists(caminho):
+                self.stderr.write(f"Exame {exame.id}: {arquivo.name} não encontrado")
+                self.resumo['ausentes'] += 1
+                continue
+
+            if dry_run:
+                self.resumo['migrados'] += 1
+                continue
+
+            # Hardlink: o original só é removido depois de gravado no banco
+            blob = default_storage.vincular_arquivo(caminho, arquivo.name)
+            self.resumo['deduplicados' if blob in self.blobs else 'migrados'] += 1
+            self.blobs.add(blob)
+            self.convertidos[arquivo.name] = blob
+            self.originais.append(caminho)
+            arquivo.name = blob
+            alterado = True
+        return alterado
+
+    def _gravar(self, lote, dry_run):
+        if not lote or dry_run:
+            return
+
+        with transaction.atomic():
+            ExameOCT.objects.bulk_update(lote, CAMPOS)
+
+        for caminho in self.originais:
+            try:
+                os.unlink(caminho)
+            except FileNotFoundError:
+                pass
+        self.originais = []
+
+        for exame in lote:
+            cache_service.invalidar_exame(exame.id)
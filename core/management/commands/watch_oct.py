@@ -0,0 +1,115 @@
+import os
+import time
+import logging
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from core.analise import aguardar_analises, enfileirar_analises, recuperar_analises_interrompidas
+from core.ingestao import MonitorEstabilidade, candidato, ingerir_lote
+from core.models import ExameOCT
+
+try:
+    from inotify_simple import INotify, flags
+except ImportError:
+    INotify = None
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Monitora pastas de exportação dos aparelhos OCT e cria os exames automaticamente"
+
+    def add_arguments(self, parser):
+        parser.add_argument('diretorios', nargs='+', help="Pastas monitoradas")
+        parser.add_argument('--usuario', required=True, help="Usuário registrado como responsável pelos exames")
+        parser.add_argument('--intervalo', type=float, default=5, help="Segundos entre varreduras (padrão: 5)")
+        parser.add_argument('--lote', type=int, default=50, help="Máximo de arquivos por lote (padrão: 50)")
+        parser.add_argument('--polling', action='store_true', help="Não usar inotify, apenas varreduras periódicas")
+        parser.add_argument('--sem-analise', action='store_true', help="Não enfileirar a análise de IA")
+        parser.add_argument('--uma-vez', action='store_true', help="Processa os arquivos prontos e encerra")
+
+    def handle(self, *args, **options):
+        try:
+            usuario = User.objects.get(username=options['usuario'])
+        except User.DoesNotExist:
+            raise CommandError(f"Usuário não encontrado: {options['usuario']}")
+
+        diretorios = [os.path.abspath(d) for d in options['diretorios']]
+        for diretorio in diretorios:
+            if not os.path.isdir(diretorio):
+                raise CommandError(f"Pasta não encontrada: {diretorio}")
+
+        analisar = not options['sem_analise']
+        monitor = MonitorEstabilidade(settings.INGESTAO_ESTABILIDADE)
+        inotify = self._iniciar_inotify(diretorios, options['polling'])
+
+        # Análises que este ou outro processo deixou em 'analisando' ao morrer
+        recuperar_analises_interrompidas()
+
+        if analisar:
+            # Após reinício: exames ingeridos anteriormente (só os da pasta) e ainda não analisados
+            pendentes = list(ExameOCT.objects.filter(
+                usuario=usuario, origem='pasta', status='pendente', diagnostico_ia__isnull=True
+            ))
+            if pendentes:
+                self.stdout.write(f"Reenfileirando {len(pendentes)} exame(s) pendente(s)")
+                enfileirar_analises(pendentes, usuario)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Monitorando {', '.join(diretorios)} ({'inotify' if inotify else 'polling'})"
+        ))
+
+        ultima_recuperacao = time.monotonic()
+        try:
+            while True:
+                if time.monotonic() - ultima_recuperacao >= settings.IA_PRAZO_SEGUNDOS:
+                    recuperar_analises_interrompidas()
+                    ultima_recuperacao = time.monotonic()
+
+                prontos = monitor.prontos(diretorios)
+                for inicio in range(0, len(prontos), options['lote']):
+                    lote = prontos[inicio:inicio + options['lote']]
+                    try:
+                        criados = ingerir_lote(lote, usuario)
+                    except Exception as e:
+                        logger.error(f"Erro ao ingerir lote de {len(lote)} arquivo(s): {str(e)}")
+                        continue
+                    if criados:
+                        self.stdout.write(f"{len(criados)} exame(s) criado(s)")
+                        if analisar:
+                            enfileirar_analises(criados, usuario)
+
+                if options['uma_vez']:
+                    break
+                self._aguardar(inotify, monitor, options['intervalo'])
+        except KeyboardInterrupt:
+            self.stdout.write("Encerrando...")
+        finally:
+            if inotify:
+                inotify.close()
+            # Análises não iniciadas ficam 'pendente' e são retomadas no próximo início
+            aguardar_analises()
+
+    def _iniciar_inotify(self, diretorios, polling):
+        if polling:
+            return None
+        if INotify is None:
+            self.stdout.write(self.style.WARNING("inotify_simple não instalado; usando polling"))
+            return None
+
+        inotify = INotify()
+        self._watches = {}
+        for diretorio in diretorios:
+            wd = inotify.add_watch(diretorio, flags.CLOSE_WRITE | flags.MOVED_TO)
+            self._watches[wd] = diretorio
+        return inotify
+
+    def _aguardar(self, inotify, monitor, intervalo):
+        if inotify is None:
+            time.sleep(intervalo)
+            return
+
+        # Acorda com eventos; a varredura periódica cobre escritas remotas (SMB/NFS)
+        for evento in inotify.read(timeout=int(intervalo * 1000)):
+            if evento.name and candidato(evento.name):
+                monitor.marcar_fechado(os.path.join(self._watches[evento.wd], evento.name))
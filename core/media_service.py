@@ -0,0 +1,133 @@
+import os
+import re
+import mimetypes
+from urllib.parse import quote
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe, quote_etag
+
+TAMANHO_BLOCO = 64 * 1024
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+def calcular_etag(stat):
+    """ETag a partir de tamanho e data de modificação, sem ler o arquivo"""
+    return quote_etag(f'{stat.st_mtime_ns:x}-{stat.st_size:x}')
+
+def servir_arquivo(request, arquivo, as_attachment=False, filename=None):
+    """
+    Entrega um arquivo de mídia já autorizado pela view.
+
+    Com MEDIA_ACCEL_MODE configurado a transferência é delegada ao proxy
+    (X-Accel-Redirect no nginx, X-Sendfile no Apache/lighttpd). Sem proxy, o
+    arquivo é enviado em streaming com ETag, Last-Modified, 304 e Range.
+    """
+    caminho = arquivo.path
+    if not os.path.exists(caminho):
+        return HttpResponse('Arquivo não encontrado', status=404)
+
+    filename = filename or os.path.basename(arquivo.name)
+    content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+    modo = settings.MEDIA_ACCEL_MODE
+    if modo:
+        response = HttpResponse(content_type=content_type)
+        if modo == 'nginx':
+            response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_PREFIX + quote(arquivo.name)
+        else:
+            response['X-Sendfile'] = caminho
+        _definir_disposicao(response, as_attachment, filename)
+        return response
+
+    stat = os.stat(caminho)
+    etag = calcular_etag(stat)
+    last_modified = int(stat.st_mtime)
+
+    # If-None-Match / If-Modified-Since
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        # O 304 repete os validadores e o Cache-Control (RFC 9110, 15.4.5)
+        _definir_validadores(response, etag, last_modified)
+        return response
+
+    intervalo = _interpretar_range(request, stat.st_size, etag, last_modified)
+    if intervalo == 'invalido':
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{stat.st_size}'
+        return response
+
+    if intervalo:
+        inicio, fim = intervalo
+        response = StreamingHttpResponse(
+            _ler_intervalo(caminho, inicio, fim),
+            status=206,
+            content_type=content_type
+        )
+        response['Content-Length'] = str(fim - inicio + 1)
+        response['Content-Range'] = f'bytes {inicio}-{fim}/{stat.st_size}'
+    else:
+        # FileResponse usa wsgi.file_wrapper (sendfile) quando disponível
+        response = FileResponse(open(caminho, 'rb'), content_type=content_type)
+        response['Content-Length'] = str(stat.st_size)
+
+    response['Accept-Ranges'] = 'bytes'
+    _definir_validadores(response, etag, last_modified)
+    _definir_disposicao(response, as_attachment, filename)
+    return response
+
+def _definir_validadores(response, etag, last_modified):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = 'private, max-age=0, must-revalidate'
+
+def _definir_disposicao(response, as_attachment, filename):
+    # Escapa aspas e usa filename* (RFC 5987) para nomes fora do ASCII
+    response['Content-Disposition'] = content_disposition_header(as_attachment, filename)
+
+def _interpretar_range(request, tamanho, etag, last_modified):
+    """
+    Retorna (inicio, fim) para um único intervalo válido, None para enviar o
+    arquivo inteiro ou 'invalido' para responder 416. Múltiplos intervalos e
+    If-Range divergente caem no envio completo.
+    """
+    cabecalho = request.headers.get('Range')
+    if not cabecalho or request.method not in ('GET', 'HEAD'):
+        return None
+
+    if_range = request.headers.get('If-Range')
+    if if_range and if_range != etag:
+        data = parse_http_date_safe(if_range)
+        if data is None or data < last_modified:
+            return None
+
+    match = RANGE_RE.match(cabecalho.strip())
+    if not match:
+        return None
+
+    inicio, fim = match.groups()
+    if not inicio and not fim:
+        return None
+    if not inicio:
+        # Sufixo: últimos N bytes
+        sufixo = int(fim)
+        if sufixo == 0:
+            return 'invalido'
+        return max(tamanho - sufixo, 0), tamanho - 1
+
+    inicio = int(inicio)
+    fim = min(int(fim), tamanho - 1) if fim else tamanho - 1
+    if inicio >= tamanho or inicio > fim:
+        return 'invalido'
+    return inicio, fim
+
+def _ler_intervalo(caminho, inicio, fim):
+    with open(caminho, 'rb') as f:
+        f.seek(inicio)
+        restante = fim - inicio + 1
+        while restante > 0:
+            bloco = f.read(min(TAMANHO_BLOCO, restante))
+            if not bloco:
+                break
+            restante -= len(bloco)
+            yield bloco
@@ -0,0 +1,159 @@
+"""
+Métricas no formato de texto do Prometheus.
+
+Com vários processos (gunicorn), defina PROMETHEUS_MULTIPROC_DIR apontando para
+um diretório vazio e gravável antes de iniciar os workers; cada processo grava
+seus valores em arquivos mmap e /metrics agrega todos na coleta.
+"""
+import os
+import time
+from functools import wraps
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+)
+from prometheus_client.core import GaugeMetricFamily
+
+ANALISE_SEGUNDOS = Histogram(
+    'oct_analise_ia_segundos',
+    'Duração da análise de imagem OCT pela IA',
+    ['provedor', 'resultado'],
+    buckets=(1, 2.5, 5, 10, 15, 20, 30, 45, 60, 90, 120, 180),
+)
+
+ANALISE_ERROS = Counter(
+    'oct_analise_ia_erros_total',
+    'Análises de IA que falharam, por provedor',
+    ['provedor'],
+)
+
+ANALISE_RETENTATIVAS = Counter(
+    'oct_analise_ia_retentativas_total',
+    'Novas tentativas após erro transitório do provedor',
+    ['provedor'],
+)
+
+CIRCUITO_ABERTO = Gauge(
+    'oct_circuito_ia_aberto',
+    'Disjuntor do provedor aberto (1) ou não (0)',
+    ['provedor'],
+    # Só processos vivos: o arquivo de um worker encerrado não mantém o disjuntor aberto
+    multiprocess_mode='livemax',
+)
+
+FILA_ESPERA_SEGUNDOS = Histogram(
+    'oct_fila_analises_espera_segundos',
+    'Tempo na fila do agendador até a análise receber uma vaga',
+    ['prioridade'],
+    buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 900, 1800, 3600),
+)
+
+LAUDO_PDF_SEGUNDOS = Histogram(
+    'oct_laudo_pdf_segundos',
+    'Tempo de geração do laudo PDF',
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10),
+)
+
+LAUDO_PDF_BYTES = Histogram(
+    'oct_laudo_pdf_bytes',
+    'Tamanho do laudo PDF gerado',
+    buckets=(50e3, 100e3, 250e3, 500e3, 750e3, 1e6, 2e6, 5e6),
+)
+
+UPLOAD_BYTES = Histogram(
+    'oct_upload_bytes',
+    'Tamanho das imagens OCT enviadas',
+    buckets=(100e3, 250e3, 500e3, 1e6, 2.5e6, 5e6, 10e6, 25e6, 50e6, 100e6),
+)
+
+ARQUIVO_RESTAURACOES = Counter(
+    'oct_arquivo_frio_restauracoes_total',
+    'Blobs de mídia restaurados da camada fria para o disco',
+)
+
+ARQUIVO_RESTAURACOES_FALHAS = Counter(
+    'oct_arquivo_frio_restauracoes_falhas_total',
+    'Restaurações da camada fria que falharam (cópia ausente ou corrompida)',
+)
+
+REQUISICAO_SEGUNDOS = Histogram(
+    'oct_requisicao_segundos',
+    'Duração das requisições por view',
+    ['view', 'metodo', 'status'],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+
+def medir_analise(func):
+    """Registra duração e falhas de uma função que retorna o dicionário de resultado da análise"""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        inicio = time.perf_counter()
+        resultado = func(*args, **kwargs)
+        provedor = resultado.get('provedor_usado') or 'nenhum'
+        ANALISE_SEGUNDOS.labels(
+            provedor, 'sucesso' if resultado['success'] else 'erro'
+        ).observe(time.perf_counter() - inicio)
+        if not resultado['success']:
+            ANALISE_ERROS.labels(provedor).inc()
+        return resultado
+    return wrapper
+
+def medir_laudo_pdf(func):
+    """Registra o tempo de geração e o tamanho do laudo (BytesIO retornado)"""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with LAUDO_PDF_SEGUNDOS.time():
+            buffer = func(*args, **kwargs)
+        LAUDO_PDF_BYTES.observe(buffer.getbuffer().nbytes)
+        return buffer
+    return wrapper
+
+class ExamesPorStatusCollector:
+    """Gauge de exames por status, consultado no banco a cada coleta"""
+
+    def collect(self):
+        from django.db.models import Count
+        from .models import ExameOCT
+
+        gauge = GaugeMetricFamily('oct_exames', 'Exames OCT por status', labels=['status'])
+        totais = dict(
+            ExameOCT.objects.order_by().values_list('status').annotate(total=Count('id'))
+        )
+        for status, _ in ExameOCT.STATUS_CHOICES:
+            gauge.add_metric([status], totais.get(status, 0))
+        yield gauge
+
+class FilaAnalisesCollector:
+    """Gauge de solicitações na fila de análises por prioridade e estado"""
+
+    def collect(self):
+        from django.db.models import Count
+        from .models import ExameOCT, SolicitacaoAnalise
+
+        gauge = GaugeMetricFamily(
+            'oct_fila_analises', 'Solicitações de análise na fila por prioridade e estado',
+            labels=['prioridade', 'estado'],
+        )
+        totais = {
+            (prioridade, estado): total
+            for prioridade, estado, total in (
+                SolicitacaoAnalise.objects.order_by().values_list('prioridade', 'estado').annotate(total=Count('id'))
+            )
+        }
+        for prioridade, _ in ExameOCT.PRIORIDADE_CHOICES:
+            for estado, _ in SolicitacaoAnalise.ESTADO_CHOICES:
+                gauge.add_metric([prioridade, estado], totais.get((prioridade, estado), 0))
+        yield gauge
+
+def exportar():
+    """Retorna (conteúdo, content_type) com todas as métricas"""
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+
+    registry_banco = CollectorRegistry()
+    registry_banco.register(ExamesPorStatusCollector())
+    registry_banco.register(FilaAnalisesCollector())
+
+    return generate_latest(registry) + generate_latest(registry_banco), CONTENT_TYPE_LATEST
@@ -0,0 +1,23 @@
+import time
+from . import metrics
+
+# Métodos fora desta lista viram 'other', para não criar uma série por valor arbitrário
+METODOS_CONHECIDOS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+class MetricasMiddleware:
+    """Mede a duração de cada requisição, rotulada pela view resolvida"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        inicio = time.perf_counter()
+        response = self.get_response(request)
+
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'nao_resolvida'
+        metodo = request.method if request.method in METODOS_CONHECIDOS else 'other'
+        metrics.REQUISICAO_SEGUNDOS.labels(
+            view, metodo, f'{response.status_code // 100}xx'
+        ).observe(time.perf_counter() - inicio)
+        return response
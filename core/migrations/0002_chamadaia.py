@@ -0,0 +1,42 @@
+# Generated by Django 5.2.6 on 2026-10-19 11:01
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChamadaIA',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('provedor_nome', models.CharField(max_length=100, verbose_name='Nome do Provedor')),
+                ('modelo', models.CharField(max_length=100, verbose_name='Modelo')),
+                ('versao_modelo', models.CharField(blank=True, max_length=100, verbose_name='Versão do Modelo')),
+                ('versao_prompt', models.CharField(max_length=40, verbose_name='Versão do Prompt')),
+                ('iniciado_em', models.DateTimeField(db_index=True, verbose_name='Início da Chamada')),
+                ('latencia_ms', models.PositiveIntegerField(verbose_name='Latência (ms)')),
+                ('tokens_entrada', models.PositiveIntegerField(blank=True, null=True, verbose_name='Tokens de Entrada')),
+                ('tokens_saida', models.PositiveIntegerField(blank=True, null=True, verbose_name='Tokens de Saída')),
+                ('bytes_enviados', models.PositiveBigIntegerField(default=0, verbose_name='Bytes Enviados')),
+                ('tentativas', models.PositiveSmallIntegerField(default=1, verbose_name='Tentativas')),
+                ('resultado', models.CharField(choices=[('sucesso', 'Sucesso'), ('vazio', 'Resposta vazia'), ('erro', 'Erro')], max_length=10, verbose_name='Resultado')),
+                ('erro', models.TextField(blank=True, verbose_name='Erro')),
+                ('exame', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='core.exameoct', verbose_name='Exame OCT')),
+                ('provedor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='core.provedoria', verbose_name='Provedor de IA')),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='Usuário')),
+            ],
+            options={
+                'verbose_name': 'Chamada de IA',
+                'verbose_name_plural': 'Chamadas de IA',
+                'ordering': ['-iniciado_em'],
+            },
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.2.6 on 2026-10-19 11:03
+
+import csv
+import logging
+import os
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+def prontuario_vazio_para_nulo(apps, schema_editor):
+    # Prontuários em branco viram NULL para não colidirem na restrição única
+    Paciente = apps.get_model('core', 'Paciente')
+    Paciente.objects.filter(prontuario='').update(prontuario=None)
+
+
+def separar_prontuarios_duplicados(apps, schema_editor):
+    """
+    Em cada grupo de pacientes com o mesmo prontuário, o cadastro mais antigo
+    mantém o prontuário e os demais ficam sem prontuário (NULL). Nada é apagado:
+    os cadastros afetados vão para um relatório CSV em IMPORTACAO_REJEITADOS_DIR
+    para revisão e, se for o caso, unificação manual.
+    """
+    Paciente = apps.get_model('core', 'Paciente')
+    duplicados = list(
+        Paciente.objects.exclude(prontuario__isnull=True).order_by()
+        .values_list('prontuario', flat=True).annotate(total=Count('id')).filter(total__gt=1)
+    )
+    if not duplicados:
+        return
+
+    os.makedirs(settings.IMPORTACAO_REJEITADOS_DIR, exist_ok=True)
+    caminho = os.path.join(
+        settings.IMPORTACAO_REJEITADOS_DIR,
+        f"prontuarios_duplicados_{timezone.now().strftime('%Y%m%d_%H%M%S')}.csv"
+    )
+    with open(caminho, 'w', newline='', encoding='utf-8') as arquivo:
+        escritor = csv.writer(arquivo)
+        escritor.writerow(['prontuario', 'paciente_mantido', 'paciente_sem_prontuario', 'nome', 'data_nascimento'])
+        for prontuario in duplicados:
+            mantido, *outros = Paciente.objects.filter(prontuario=prontuario).order_by('criado_em', 'id')
+            for paciente in outros:
+                escritor.writerow([prontuario, mantido.id, paciente.id, paciente.nome, paciente.data_nascimento])
+            Paciente.objects.filter(id__in=[p.id for p in outros]).update(prontuario=None)
+
+    logger.warning(f"{len(duplicados)} prontuário(s) duplicado(s); cadastros separados listados em {caminho}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_chamadaia'),
+    ]
+
+    operations = [
+        migrations.RunPython(prontuario_vazio_para_nulo, migrations.RunPython.noop),
+        migrations.RunPython(separar_prontuarios_duplicados, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='paciente',
+            name='prontuario',
+            field=models.CharField(blank=True, max_length=50, null=True, unique=True, verbose_name='Prontuário'),
+        ),
+    ]
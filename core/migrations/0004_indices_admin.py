@@ -0,0 +1,34 @@
+# Generated by Django 5.2.6 on 2026-10-19 11:13
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_paciente_prontuario_unico'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='exameoct',
+            name='data_exame',
+            field=models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Data do Exame'),
+        ),
+        migrations.AlterField(
+            model_name='paciente',
+            name='criado_em',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='paciente',
+            name='nome',
+            field=models.CharField(db_index=True, max_length=200, verbose_name='Nome do Paciente'),
+        ),
+        migrations.AddIndex(
+            model_name='exameoct',
+            index=models.Index(fields=['status', '-data_exame'], name='exame_status_data_idx'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.6 on 2026-10-19 11:15
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_indices_admin'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exameoct',
+            name='prioridade',
+            field=models.CharField(choices=[('urgente', 'Urgente'), ('rotina', 'Rotina'), ('lote', 'Lote / retroativo')], default='rotina', max_length=10, verbose_name='Prioridade'),
+        ),
+        migrations.CreateModel(
+            name='SolicitacaoAnalise',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('prioridade', models.CharField(choices=[('urgente', 'Urgente'), ('rotina', 'Rotina'), ('lote', 'Lote / retroativo')], max_length=10, verbose_name='Prioridade')),
+                ('marca_final', models.FloatField(db_index=True, verbose_name='Marca de Término')),
+                ('estado', models.CharField(choices=[('aguardando', 'Aguardando'), ('executando', 'Executando')], db_index=True, default='aguardando', max_length=10, verbose_name='Estado')),
+                ('criada_em', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Solicitada em')),
+                ('visto_em', models.DateTimeField(blank=True, null=True, verbose_name='Visto em')),
+                ('expira_em', models.DateTimeField(blank=True, null=True, verbose_name='Vaga expira em')),
+                ('exame', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='solicitacoes_analise', to='core.exameoct', verbose_name='Exame OCT')),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='Usuário')),
+            ],
+            options={
+                'verbose_name': 'Solicitação de análise',
+                'verbose_name_plural': 'Solicitações de análise',
+                'ordering': ['marca_final', 'id'],
+            },
+        ),
+    ]
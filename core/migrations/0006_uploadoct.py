@@ -0,0 +1,40 @@
+# Generated by Django 5.2.6 on 2026-10-19 11:20
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_agendamento_analises'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadOCT',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('prioridade', models.CharField(choices=[('urgente', 'Urgente'), ('rotina', 'Rotina'), ('lote', 'Lote / retroativo')], default='rotina', max_length=10, verbose_name='Prioridade')),
+                ('nome_original', models.CharField(max_length=255, verbose_name='Nome do Arquivo')),
+                ('tamanho', models.PositiveBigIntegerField(verbose_name='Tamanho (bytes)')),
+                ('sha256', models.CharField(blank=True, max_length=64, verbose_name='SHA-256 Declarado')),
+                ('recebidos', models.JSONField(default=list, verbose_name='Intervalos Recebidos')),
+                ('estado', models.CharField(choices=[('recebendo', 'Recebendo'), ('concluido', 'Concluído'), ('rejeitado', 'Rejeitado')], default='recebendo', max_length=10, verbose_name='Estado')),
+                ('erro', models.TextField(blank=True, verbose_name='Erro')),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+                ('atualizado_em', models.DateTimeField(auto_now=True, db_index=True)),
+                ('exame', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='core.exameoct', verbose_name='Exame OCT')),
+                ('paciente', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.paciente', verbose_name='Paciente')),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='Usuário')),
+            ],
+            options={
+                'verbose_name': 'Upload OCT',
+                'verbose_name_plural': 'Uploads OCT',
+                'ordering': ['-criado_em'],
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.6 on 2026-10-19 11:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_uploadoct'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArquivoFrio',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nome', models.CharField(max_length=255, unique=True, verbose_name='Nome no Storage')),
+                ('caminho_frio', models.CharField(max_length=500, verbose_name='Local na Camada Fria')),
+                ('tamanho', models.PositiveBigIntegerField(verbose_name='Tamanho Original (bytes)')),
+                ('tamanho_comprimido', models.PositiveBigIntegerField(verbose_name='Tamanho Comprimido (bytes)')),
+                ('arquivado_em', models.DateTimeField(auto_now_add=True, verbose_name='Arquivado em')),
+                ('restaurado_em', models.DateTimeField(blank=True, null=True, verbose_name='Restaurado em')),
+            ],
+            options={
+                'verbose_name': 'Arquivo na camada fria',
+                'verbose_name_plural': 'Arquivos na camada fria',
+                'ordering': ['-arquivado_em'],
+            },
+        ),
+    ]
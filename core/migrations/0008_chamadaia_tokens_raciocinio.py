@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-19 11:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_arquivofrio'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chamadaia',
+            name='tokens_raciocinio',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Tokens de Raciocínio'),
+        ),
+    ]
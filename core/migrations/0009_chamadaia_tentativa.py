@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-19 11:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_chamadaia_tokens_raciocinio'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='chamadaia',
+            name='tentativas',
+            field=models.PositiveSmallIntegerField(default=1, verbose_name='Tentativa'),
+        ),
+    ]
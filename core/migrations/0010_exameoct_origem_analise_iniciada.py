@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-19 11:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_chamadaia_tentativa'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exameoct',
+            name='analise_iniciada_em',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Análise Iniciada em'),
+        ),
+        migrations.AddField(
+            model_name='exameoct',
+            name='origem',
+            field=models.CharField(choices=[('web', 'Formulário web'), ('upload', 'Upload resumível'), ('pasta', 'Pasta monitorada')], default='web', max_length=10, verbose_name='Origem'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.6 on 2026-10-19 11:34
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def criar_trava(apps, schema_editor):
+    apps.get_model('core', 'TravaAgendamento').objects.get_or_create(id=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_exameoct_origem_analise_iniciada'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TravaAgendamento',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+            ],
+            options={
+                'verbose_name': 'Trava do agendamento',
+                'verbose_name_plural': 'Trava do agendamento',
+            },
+        ),
+        migrations.AddField(
+            model_name='solicitacaoanalise',
+            name='renovada_em',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='Renovada em'),
+        ),
+        migrations.RunPython(criar_trava, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-19 11:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_agendamento_trava_renovacao'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='uploadoct',
+            name='estado',
+            field=models.CharField(choices=[('recebendo', 'Recebendo'), ('concluindo', 'Em conclusão'), ('concluido', 'Concluído'), ('rejeitado', 'Rejeitado')], default='recebendo', max_length=10, verbose_name='Estado'),
+        ),
+    ]
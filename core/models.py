@@ -2,13 +2,14 @@ from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
 import os
+import uuid
 
 # Model para Pacientes
 class Paciente(models.Model):
-    nome = models.CharField(max_length=200, verbose_name="Nome do Paciente")
+    nome = models.CharField(max_length=200, db_index=True, verbose_name="Nome do Paciente")
     data_nascimento = models.DateField(verbose_name="Data de Nascimento")
-    prontuario = models.CharField(max_length=50, blank=True, null=True, verbose_name="Prontuário")
-    criado_em = models.DateTimeField(auto_now_add=True)
+    prontuario = models.CharField(max_length=50, blank=True, null=True, unique=True, verbose_name="Prontuário")
+    criado_em = models.DateTimeField(auto_now_add=True, db_index=True)
     
     class Meta:
         verbose_name = "Paciente"
@@ -51,6 +52,8 @@ class PromptIA(models.Model):
         return f"{self.provedor.nome} - {self.nome}"
 
 # Função para upload de imagens OCT
+# Com o storage endereçado por conteúdo (core.storage) o nome do arquivo é
+# trocado pelo hash; daqui só a pasta e a extensão são usadas.
 def upload_to_oct(instance, filename):
     """Define o caminho para upload das imagens OCT"""
     ext = filename.split('.')[-1]
@@ -68,7 +71,7 @@ class ExameOCT(models.Model):
     paciente = models.ForeignKey(Paciente, on_delete=models.CASCADE, verbose_name="Paciente")
     usuario = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="Usuário que realizou o upload")
     imagem = models.ImageField(upload_to=upload_to_oct, verbose_name="Imagem OCT")
-    data_exame = models.DateTimeField(auto_now_add=True, verbose_name="Data do Exame")
+    data_exame = models.DateTimeField(auto_now_add=True, db_index=True, verbose_name="Data do Exame")
     
     # Dados do diagnóstico
     provedor_ia = models.ForeignKey(ProvedorIA, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Provedor de IA")
@@ -88,11 +91,33 @@ class ExameOCT(models.Model):
         ('erro', 'Erro na Análise'),
     ]
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pendente', verbose_name="Status")
+    # Início da análise em andamento: 'analisando' há mais que o prazo indica processo interrompido
+    analise_iniciada_em = models.DateTimeField(null=True, blank=True, verbose_name="Análise Iniciada em")
+    
+    # Como o exame entrou no sistema; só os da pasta monitorada são analisados automaticamente
+    ORIGEM_CHOICES = [
+        ('web', 'Formulário web'),
+        ('upload', 'Upload resumível'),
+        ('pasta', 'Pasta monitorada'),
+    ]
+    origem = models.CharField(max_length=10, choices=ORIGEM_CHOICES, default='web', verbose_name="Origem")
+    
+    # Prioridade da análise na fila (core.agendador)
+    PRIORIDADE_CHOICES = [
+        ('urgente', 'Urgente'),
+        ('rotina', 'Rotina'),
+        ('lote', 'Lote / retroativo'),
+    ]
+    prioridade = models.CharField(max_length=10, choices=PRIORIDADE_CHOICES, default='rotina', verbose_name="Prioridade")
     
     class Meta:
         verbose_name = "Exame OCT"
         verbose_name_plural = "Exames OCT"
         ordering = ['-data_exame']
+        indexes = [
+            # Filtro por status na ordem padrão (admin, fila de análises)
+            models.Index(fields=['status', '-data_exame'], name='exame_status_data_idx'),
+        ]
     
     def __str__(self):
         return f"OCT - {self.paciente.nome} - {self.data_exame.strftime('%d/%m/%Y')}"
@@ -105,4 +130,133 @@ class ExameOCT(models.Model):
     @property
     def tem_laudo(self):
         """Verifica se o exame já tem laudo PDF"""
-        return bool(self.laudo_pdf)
\ No newline at end of file
+        return bool(self.laudo_pdf)
+
+# Registro append-only das chamadas aos provedores de IA (telemetria)
+class ChamadaIA(models.Model):
+    RESULTADO_CHOICES = [
+        ('sucesso', 'Sucesso'),
+        ('vazio', 'Resposta vazia'),
+        ('erro', 'Erro'),
+    ]
+
+    provedor = models.ForeignKey(ProvedorIA, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Provedor de IA")
+    provedor_nome = models.CharField(max_length=100, verbose_name="Nome do Provedor")
+    modelo = models.CharField(max_length=100, verbose_name="Modelo")
+    versao_modelo = models.CharField(max_length=100, blank=True, verbose_name="Versão do Modelo")
+    versao_prompt = models.CharField(max_length=40, verbose_name="Versão do Prompt")
+    usuario = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Usuário")
+    exame = models.ForeignKey(ExameOCT, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Exame OCT")
+    iniciado_em = models.DateTimeField(db_index=True, verbose_name="Início da Chamada")
+    latencia_ms = models.PositiveIntegerField(verbose_name="Latência (ms)")
+    tokens_entrada = models.PositiveIntegerField(null=True, blank=True, verbose_name="Tokens de Entrada")
+    # Tokens de saída cobrados: resposta mais raciocínio (thinking), que também é cobrado
+    tokens_saida = models.PositiveIntegerField(null=True, blank=True, verbose_name="Tokens de Saída")
+    tokens_raciocinio = models.PositiveIntegerField(null=True, blank=True, verbose_name="Tokens de Raciocínio")
+    bytes_enviados = models.PositiveBigIntegerField(default=0, verbose_name="Bytes Enviados")
+    # Um registro por tentativa: número da tentativa dentro da mesma análise
+    tentativas = models.PositiveSmallIntegerField(default=1, verbose_name="Tentativa")
+    resultado = models.CharField(max_length=10, choices=RESULTADO_CHOICES, verbose_name="Resultado")
+    erro = models.TextField(blank=True, verbose_name="Erro")
+
+    class Meta:
+        verbose_name = "Chamada de IA"
+        verbose_name_plural = "Chamadas de IA"
+        ordering = ['-iniciado_em']
+
+    def __str__(self):
+        return f"{self.provedor_nome} - {self.iniciado_em.strftime('%d/%m/%Y %H:%M:%S')} - {self.latencia_ms} ms"
+
+# Model para a fila de análises de IA (core.agendador)
+class SolicitacaoAnalise(models.Model):
+    """Análise aguardando ou ocupando uma vaga no agendador; removida ao terminar"""
+    ESTADO_CHOICES = [
+        ('aguardando', 'Aguardando'),
+        ('executando', 'Executando'),
+    ]
+    exame = models.ForeignKey(ExameOCT, on_delete=models.CASCADE, related_name='solicitacoes_analise', verbose_name="Exame OCT")
+    usuario = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Usuário")
+    prioridade = models.CharField(max_length=10, choices=ExameOCT.PRIORIDADE_CHOICES, verbose_name="Prioridade")
+    # Tempo virtual de término (weighted fair queueing): menor é atendido antes
+    marca_final = models.FloatField(db_index=True, verbose_name="Marca de Término")
+    estado = models.CharField(max_length=10, choices=ESTADO_CHOICES, default='aguardando', db_index=True, verbose_name="Estado")
+    criada_em = models.DateTimeField(default=timezone.now, verbose_name="Solicitada em")
+    # Última verificação de quem aguarda; sem ela a solicitação não disputa vaga
+    visto_em = models.DateTimeField(null=True, blank=True, verbose_name="Visto em")
+    # Fim da concessão da vaga, caso o processo morra sem liberá-la
+    expira_em = models.DateTimeField(null=True, blank=True, verbose_name="Vaga expira em")
+    # Sinal de vida do processo dono (inclusive de cargas em lote ainda sem
+    # ninguém aguardando); sem renovação a solicitação é descartada
+    renovada_em = models.DateTimeField(default=timezone.now, verbose_name="Renovada em")
+
+    class Meta:
+        verbose_name = "Solicitação de análise"
+        verbose_name_plural = "Solicitações de análise"
+        ordering = ['marca_final', 'id']
+
+    def __str__(self):
+        return f"{self.get_prioridade_display()} - exame {self.exame_id} ({self.estado})"
+
+# Linha única bloqueada (SELECT ... FOR UPDATE) ao conceder vagas de análise:
+# serializa a contagem das vagas ocupadas entre processos (core.agendador)
+class TravaAgendamento(models.Model):
+    class Meta:
+        verbose_name = "Trava do agendamento"
+        verbose_name_plural = "Trava do agendamento"
+
+# Model para uploads resumíveis de imagens OCT (core.upload_service)
+class UploadOCT(models.Model):
+    ESTADO_CHOICES = [
+        ('recebendo', 'Recebendo'),
+        ('concluindo', 'Em conclusão'),
+        ('concluido', 'Concluído'),
+        ('rejeitado', 'Rejeitado'),
+    ]
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    usuario = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="Usuário")
+    paciente = models.ForeignKey(Paciente, on_delete=models.CASCADE, verbose_name="Paciente")
+    prioridade = models.CharField(max_length=10, choices=ExameOCT.PRIORIDADE_CHOICES, default='rotina', verbose_name="Prioridade")
+    nome_original = models.CharField(max_length=255, verbose_name="Nome do Arquivo")
+    tamanho = models.PositiveBigIntegerField(verbose_name="Tamanho (bytes)")
+    sha256 = models.CharField(max_length=64, blank=True, verbose_name="SHA-256 Declarado")
+    # Intervalos [início, fim) já gravados, ordenados e sem sobreposição
+    recebidos = models.JSONField(default=list, verbose_name="Intervalos Recebidos")
+    estado = models.CharField(max_length=10, choices=ESTADO_CHOICES, default='recebendo', verbose_name="Estado")
+    erro = models.TextField(blank=True, verbose_name="Erro")
+    exame = models.OneToOneField(ExameOCT, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Exame OCT")
+    criado_em = models.DateTimeField(auto_now_add=True)
+    atualizado_em = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        verbose_name = "Upload OCT"
+        verbose_name_plural = "Uploads OCT"
+        ordering = ['-criado_em']
+
+    def __str__(self):
+        return f"{self.nome_original} ({self.get_estado_display()})"
+
+    @property
+    def bytes_recebidos(self):
+        return sum(fim - inicio for inicio, fim in self.recebidos)
+
+    @property
+    def completo(self):
+        return self.recebidos == [[0, self.tamanho]]
+
+# Model para arquivos de mídia movidos para a camada fria (core.arquivo_frio)
+class ArquivoFrio(models.Model):
+    nome = models.CharField(max_length=255, unique=True, verbose_name="Nome no Storage")
+    caminho_frio = models.CharField(max_length=500, verbose_name="Local na Camada Fria")
+    tamanho = models.PositiveBigIntegerField(verbose_name="Tamanho Original (bytes)")
+    tamanho_comprimido = models.PositiveBigIntegerField(verbose_name="Tamanho Comprimido (bytes)")
+    arquivado_em = models.DateTimeField(auto_now_add=True, verbose_name="Arquivado em")
+    # Última vez que a cópia quente foi recriada a partir do arquivo
+    restaurado_em = models.DateTimeField(null=True, blank=True, verbose_name="Restaurado em")
+
+    class Meta:
+        verbose_name = "Arquivo na camada fria"
+        verbose_name_plural = "Arquivos na camada fria"
+        ordering = ['-arquivado_em']
+
+    def __str__(self):
+        return self.nome
@@ -1,14 +1,31 @@
 
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image
+from reportlab.lib.units import inch, cm
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image, Table, TableStyle
 from reportlab.lib.enums import TA_CENTER, TA_JUSTIFY, TA_LEFT
 from django.conf import settings
+from django.core.cache import caches
 from django.utils import timezone
+from PIL import Image as PILImage, ImageOps
 import os
 import io
-#Teste
+import logging
+from .metrics import medir_laudo_pdf
+from . import cache_service
+
+logger = logging.getLogger(__name__)
+
+# Área de impressão (cm) da imagem principal e de cada corte-chave
+IMAGEM_PRINCIPAL_CM = (16, 11)
+CORTE_CHAVE_CM = (5, 4)
+
+# Qualidades JPEG tentadas, da maior para a menor, antes de reduzir a resolução
+QUALIDADES_JPEG = (85, 75, 65, 55, 45, 35)
+REDUCAO_EXTRA = 0.75
+LADO_MINIMO_PX = 200
+
+@medir_laudo_pdf
 def gerar_laudo_pdf(exame):
     """
     Gera um laudo PDF profissional para um exame OCT
@@ -81,6 +98,23 @@ def gerar_laudo_pdf(exame):
         story.append(Paragraph(f"<b>Sistema de Análise:</b> {exame.provedor_ia.nome}", data_style))
     story.append(Spacer(1, 20))
     
+    # Imagem do exame
+    imagens = obter_imagens_laudo(exame)
+    if imagens:
+        story.append(Paragraph("IMAGEM DO EXAME", section_style))
+        principal = imagens[0]
+        story.append(_flowable_imagem(principal))
+        if len(imagens) > 1:
+            story.append(Spacer(1, 8))
+            cortes = imagens[1:]
+            tabela = Table(
+                [[_flowable_imagem(c) for c in cortes], [Paragraph(c['legenda'], data_style) for c in cortes]],
+                colWidths=[CORTE_CHAVE_CM[0] * cm + 4] * len(cortes),
+            )
+            tabela.setStyle(TableStyle([('ALIGN', (0, 0), (-1, -1), 'CENTER')]))
+            story.append(tabela)
+        story.append(Spacer(1, 20))
+    
     # Diagnóstico por IA
     if exame.diagnostico_ia:
         story.append(Paragraph("ANÁLISE POR INTELIGÊNCIA ARTIFICIAL", section_style))
@@ -139,3 +173,105 @@ def processar_diagnostico_para_pdf(diagnostico_texto):
             paragrafos_formatados.append(linha)
     
     return paragrafos_formatados
+
+def _flowable_imagem(imagem):
+    """Image do ReportLab no tamanho de impressão; o JPEG é embutido sem recompressão"""
+    dpi = settings.LAUDO_IMAGEM_DPI
+    return Image(
+        io.BytesIO(imagem['jpeg']),
+        width=imagem['largura'] / dpi * inch,
+        height=imagem['altura'] / dpi * inch,
+    )
+
+def obter_imagens_laudo(exame):
+    """
+    Imagens do exame prontas para o laudo (principal e cortes-chave), via o
+    cache 'laudo_imagens' (em disco).
+    Retorna lista vazia se a imagem não puder ser lida.
+    """
+    if not exame.imagem:
+        return []
+
+    chave = cache_service.chave_imagens_laudo(exame.id, exame.imagem.name)
+    cache = caches['laudo_imagens']
+    imagens = cache.get(chave)
+    if imagens is None:
+        try:
+            imagens = preparar_imagens_laudo(exame.imagem)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Imagem do exame {exame.id} não incluída no laudo: {e}")
+            return []
+        cache.set(chave, imagens)
+    return imagens
+
+def preparar_imagens_laudo(arquivo):
+    """
+    Lê a imagem do exame e produz os JPEGs do laudo. Em pilhas multi-frame
+    (TIFF), o frame central é a imagem principal e até LAUDO_CORTES_CHAVE
+    frames igualmente espaçados entram como cortes-chave. O orçamento de
+    bytes é dividido entre as imagens, com metade reservada à principal.
+    """
+    dpi = settings.LAUDO_IMAGEM_DPI
+    orcamento = settings.LAUDO_ORCAMENTO_IMAGENS
+
+    with arquivo.open('rb') as f, PILImage.open(f) as origem:
+        total_frames = getattr(origem, 'n_frames', 1)
+        central = total_frames // 2
+
+        cortes = []
+        if total_frames > 1 and settings.LAUDO_CORTES_CHAVE > 0:
+            restantes = [f for f in range(total_frames) if f != central]
+            quantidade = min(settings.LAUDO_CORTES_CHAVE, len(restantes))
+            cortes = [restantes[int((i + 0.5) * len(restantes) / quantidade)] for i in range(quantidade)]
+
+        orcamento_corte = orcamento // 2 // len(cortes) if cortes else 0
+        orcamento_principal = orcamento - orcamento_corte * len(cortes)
+
+        imagens = [_preparar_frame(origem, central, IMAGEM_PRINCIPAL_CM, dpi, orcamento_principal)]
+        for frame in cortes:
+            imagem = _preparar_frame(origem, frame, CORTE_CHAVE_CM, dpi, orcamento_corte)
+            imagem['legenda'] = f"Corte {frame + 1}/{total_frames}"
+            imagens.append(imagem)
+
+    return imagens
+
+def _preparar_frame(origem, frame, area_cm, dpi, orcamento):
+    largura_max = round(area_cm[0] / 2.54 * dpi)
+    altura_max = round(area_cm[1] / 2.54 * dpi)
+
+    origem.seek(frame)
+    # JPEG: decodifica já reduzido (escala 1/2, 1/4, 1/8) quando possível
+    origem.draft('L', (largura_max, altura_max))
+    imagem = _tons_de_cinza(ImageOps.exif_transpose(origem))
+    imagem.thumbnail((largura_max, altura_max), PILImage.LANCZOS)
+
+    while True:
+        for qualidade in QUALIDADES_JPEG:
+            saida = io.BytesIO()
+            imagem.save(saida, 'JPEG', quality=qualidade, optimize=True, progressive=True)
+            if saida.tell() <= orcamento:
+                break
+        # Mesmo na menor qualidade não coube: reduzir a resolução e tentar de novo
+        if saida.tell() <= orcamento or min(imagem.size) <= LADO_MINIMO_PX:
+            break
+        imagem = imagem.resize(
+            (max(1, int(imagem.width * REDUCAO_EXTRA)), max(1, int(imagem.height * REDUCAO_EXTRA))),
+            PILImage.LANCZOS,
+        )
+
+    return {
+        'jpeg': saida.getvalue(),
+        'largura': imagem.width,
+        'altura': imagem.height,
+        'legenda': '',
+    }
+
+def _tons_de_cinza(imagem):
+    """Converte para 8 bits em tons de cinza, esticando o contraste de imagens de 16 bits/float"""
+    if imagem.mode in ('I', 'F') or imagem.mode.startswith('I;16'):
+        minimo, maximo = imagem.getextrema()
+        escala = 255 / (maximo - minimo) if maximo > minimo else 1
+        return imagem.convert('F').point(lambda v: (v - minimo) * escala).convert('L')
+    if imagem.mode != 'L':
+        return imagem.convert('L')
+    return imagem
@@ -0,0 +1,159 @@
+"""
+Camada de resiliência para chamadas aos provedores de IA: prazo total por
+requisição, novas tentativas com backoff exponencial e jitter apenas para
+erros transitórios, e um disjuntor (circuit breaker) por ProvedorIA.
+"""
+import sys
+import time
+import random
+import logging
+import threading
+from django.conf import settings
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# Códigos HTTP que indicam falha transitória do provedor
+CODIGOS_RETENTAVEIS = {408, 429, 500, 502, 503, 504}
+
+class CircuitoAberto(Exception):
+    """O provedor está indisponível e as chamadas são recusadas sem tentar"""
+
+class PrazoEsgotado(Exception):
+    """O prazo total da requisição terminou antes de uma resposta do provedor"""
+
+class Prazo:
+    """Orçamento de tempo de uma requisição, repassado a cada tentativa"""
+
+    def __init__(self, segundos):
+        self.limite = time.monotonic() + segundos
+
+    def restante(self):
+        return max(self.limite - time.monotonic(), 0)
+
+class Disjuntor:
+    """
+    Circuit breaker de um provedor. Fechado: chamadas passam. Após
+    IA_CIRCUITO_FALHAS falhas transitórias seguidas, abre e recusa chamadas por
+    IA_CIRCUITO_RECUPERACAO segundos. Depois disso fica semiaberto e deixa passar
+    uma única chamada de teste, que fecha ou reabre o circuito.
+    """
+    FECHADO = 'fechado'
+    ABERTO = 'aberto'
+    SEMIABERTO = 'semiaberto'
+
+    def __init__(self, nome):
+        self.nome = nome
+        self._estado = self.FECHADO
+        self._falhas = 0
+        self._aberto_em = 0
+        self._teste_em_andamento = False
+        self._lock = threading.Lock()
+
+    @property
+    def estado(self):
+        with self._lock:
+            if self._estado == self.ABERTO and self._recuperacao_expirada():
+                return self.SEMIABERTO
+            return self._estado
+
+    def permitir(self):
+        """Levanta CircuitoAberto se a chamada não deve ser feita agora"""
+        with self._lock:
+            if self._estado == self.ABERTO:
+                if not self._recuperacao_expirada():
+                    raise CircuitoAberto(f'Provedor {self.nome} temporariamente indisponível')
+                self._mudar_estado(self.SEMIABERTO)
+
+            if self._estado == self.SEMIABERTO:
+                if self._teste_em_andamento:
+                    raise CircuitoAberto(f'Provedor {self.nome} em verificação de recuperação')
+                self._teste_em_andamento = True
+
+    def registrar_sucesso(self):
+        with self._lock:
+            self._falhas = 0
+            self._teste_em_andamento = False
+            if self._estado != self.FECHADO:
+                self._mudar_estado(self.FECHADO)
+
+    def registrar_falha(self):
+        with self._lock:
+            self._falhas += 1
+            self._teste_em_andamento = False
+            if self._estado == self.SEMIABERTO or self._falhas >= settings.IA_CIRCUITO_FALHAS:
+                self._aberto_em = time.monotonic()
+                if self._estado != self.ABERTO:
+                    self._mudar_estado(self.ABERTO)
+
+    def liberar(self):
+        """Libera a chamada de teste sem julgar o provedor (erro não transitório)"""
+        with self._lock:
+            self._teste_em_andamento = False
+
+    def _recuperacao_expirada(self):
+        return time.monotonic() - self._aberto_em >= settings.IA_CIRCUITO_RECUPERACAO
+
+    def _mudar_estado(self, novo):
+        logger.warning(f"Circuito do provedor {self.nome}: {self._estado} -> {novo} (falhas seguidas: {self._falhas})")
+        self._estado = novo
+        metrics.CIRCUITO_ABERTO.labels(self.nome).set(1 if novo == self.ABERTO else 0)
+
+_disjuntores = {}
+_disjuntores_lock = threading.Lock()
+
+def obter_disjuntor(provedor):
+    """Disjuntor do provedor neste processo"""
+    with _disjuntores_lock:
+        if provedor.id not in _disjuntores:
+            _disjuntores[provedor.id] = Disjuntor(provedor.nome)
+        return _disjuntores[provedor.id]
+
+def erro_retentavel(erro):
+    """Timeouts, falhas de conexão e respostas 408/429/5xx valem nova tentativa"""
+    if isinstance(erro, PrazoEsgotado):
+        return True
+
+    # Erros do SDK só existem se ele já foi importado: uma falha anterior a ele
+    # (arquivo ilegível, provedor sem chave) não deve carregá-lo só para a checagem
+    genai_errors = sys.modules.get('google.genai.errors')
+    if genai_errors is not None and isinstance(erro, genai_errors.APIError):
+        return erro.code in CODIGOS_RETENTAVEIS
+    httpx = sys.modules.get('httpx')
+    return httpx is not None and isinstance(erro, (httpx.TimeoutException, httpx.TransportError))
+
+def executar_com_resiliencia(funcao, provedor, prazo):
+    """
+    Executa funcao(segundos_restantes) sob o disjuntor do provedor, repetindo
+    em erros transitórios com backoff exponencial e jitter total, sem
+    ultrapassar o prazo. A função deve repassar o tempo restante ao cliente HTTP.
+    """
+    disjuntor = obter_disjuntor(provedor)
+    tentativa = 0
+
+    while True:
+        restante = prazo.restante()
+        if restante <= 0:
+            raise PrazoEsgotado(f'Prazo de {settings.IA_PRAZO_SEGUNDOS}s esgotado após {tentativa} tentativa(s)')
+
+        disjuntor.permitir()
+        tentativa += 1
+        try:
+            resultado = funcao(restante)
+        except Exception as e:
+            if not erro_retentavel(e):
+                disjuntor.liberar()
+                raise
+
+            disjuntor.registrar_falha()
+            espera = random.uniform(0, min(settings.IA_BACKOFF_MAXIMO, settings.IA_BACKOFF_BASE * 2 ** (tentativa - 1)))
+            if tentativa >= settings.IA_MAX_TENTATIVAS or espera >= prazo.restante():
+                raise
+
+            logger.warning(f"Erro transitório no provedor {provedor.nome} (tentativa {tentativa}): {str(e)}. Nova tentativa em {espera:.1f}s")
+            metrics.ANALISE_RETENTATIVAS.labels(provedor.nome).inc()
+            time.sleep(espera)
+            continue
+
+        disjuntor.registrar_sucesso()
+        return resultado
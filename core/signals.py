@@ -0,0 +1,27 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import Paciente, ExameOCT
+from . import cache_service
+
+@receiver([post_save, post_delete], sender=Paciente)
+def invalidar_cache_paciente(sender, instance, created=False, **kwargs):
+    """Invalida lista de pacientes, contagens e os exames que exibem este paciente"""
+    cache_service.invalidar_pacientes()
+
+    if kwargs.get('signal') is post_save and not created:
+        # Nome/prontuário aparecem nos exames recentes e na página de análise
+        cache_service.invalidar_exames(
+            ExameOCT.objects.filter(paciente_id=instance.pk).values_list('id', 'usuario_id')
+        )
+        return
+
+    cache_service.invalidar_contagens()
+
+@receiver([post_save, post_delete], sender=ExameOCT)
+def invalidar_cache_exame(sender, instance, created=False, **kwargs):
+    """Invalida o exame, os exames recentes do seu usuário e, se mudou o total, as contagens"""
+    cache_service.invalidar_exame(instance.pk)
+    cache_service.invalidar_exames_recentes(instance.usuario_id)
+
+    if created or kwargs.get('signal') is post_delete:
+        cache_service.invalidar_contagens()
@@ -0,0 +1,175 @@
+import os
+import re
+import shutil
+import hashlib
+import logging
+import tempfile
+from django.core.files.storage import FileSystemStorage
+
+logger = logging.getLogger(__name__)
+
+# <pasta>/<ab>/<cd>/<sha256><ext>
+NOME_BLOB_RE = re.compile(r'^(?P<pasta>.+)/[0-9a-f]{2}/[0-9a-f]{2}/(?P<hash>[0-9a-f]{64})(?P<ext>\.[A-Za-z0-9]+)?$')
+
+PASTA_TEMPORARIA = '.tmp'
+
+class ArmazenamentoConteudo(FileSystemStorage):
+    """
+    Storage endereçado por conteúdo: cada arquivo é gravado sob o SHA-256 do
+    seu conteúdo, em subpastas de dois níveis dentro da pasta definida pelo
+    upload_to (ex.: exames_oct/3f/a2/3fa2...e1.jpeg).
+
+    Arquivos idênticos resolvem para o mesmo nome e são armazenados uma só vez;
+    cada linha do banco que aponta para o nome é uma referência ao blob. A
+    escrita vai para um temporário no mesmo volume e entra no lugar com um
+    rename atômico, então um blob visível está sempre completo.
+
+    delete() não remove blobs, que podem ser compartilhados por outros exames:
+    a remoção dos não referenciados é feita pelo comando gc_midia.
+
+    Blobs antigos podem estar só na camada fria (core.arquivo_frio): path(),
+    e portanto open(), size() e o .path dos campos, restauram o blob para o
+    disco antes de devolver o caminho. Se a cópia fria estiver ausente ou
+    corrompida, a falha é registrada e o caminho é devolvido sem arquivo,
+    como um arquivo ausente. exists() considera presente o blob com cópia fria.
+    """
+    TAMANHO_BLOCO = 1024 * 1024
+
+    @staticmethod
+    def nome_blob(pasta, digest, ext):
+        return f"{pasta}/{digest[:2]}/{digest[2:4]}/{digest}{ext.lower()}"
+
+    @staticmethod
+    def eh_blob(nome):
+        return bool(NOME_BLOB_RE.match(nome or ''))
+
+    def caminho_quente(self, name):
+        """Caminho no disco local, sem restaurar da camada fria"""
+        return super().path(name)
+
+    def path(self, name):
+        caminho = self.caminho_quente(name)
+        if self.eh_blob(name) and not os.path.exists(caminho):
+            from .arquivo_frio import RestauracaoFalhou, restaurar
+            from . import metrics
+            try:
+                restaurar(self, name)
+            except RestauracaoFalhou as e:
+                logger.error(f"Falha ao restaurar {name} da camada fria: {e}")
+                metrics.ARQUIVO_RESTAURACOES_FALHAS.inc()
+        return caminho
+
+    def exists(self, name):
+        if os.path.lexists(self.caminho_quente(name)):
+            return True
+        if not self.eh_blob(name):
+            return False
+        from .arquivo_frio import disponivel
+        return disponivel(name)
+
+    def get_available_name(self, name, max_length=None):
+        # O nome final é decidido em _save a partir do hash do conteúdo
+        return name
+
+    def _save(self, name, content):
+        pasta = os.path.dirname(name)
+        ext = os.path.splitext(name)[1]
+
+        temporario = self._temporario()
+        sha256 = hashlib.sha256()
+        try:
+            if hasattr(content, 'seek'):
+                content.seek(0)
+            with open(temporario, 'wb') as destino:
+                for bloco in content.chunks(self.TAMANHO_BLOCO):
+                    sha256.update(bloco)
+                    destino.write(bloco)
+                destino.flush()
+                os.fsync(destino.fileno())
+        except BaseException:
+            os.unlink(temporario)
+            raise
+
+        return self._instalar(temporario, self.nome_blob(pasta, sha256.hexdigest(), ext))
+
+    def importar_arquivo(self, caminho, name):
+        """
+        Move um arquivo já existente em disco para o blob correspondente ao seu
+        conteúdo, sem cópia quando estiver no mesmo volume. Retorna o nome do blob.
+        """
+        sha256 = hashlib.sha256()
+        with open(caminho, 'rb') as origem:
+            for bloco in iter(lambda: origem.read(self.TAMANHO_BLOCO), b''):
+                sha256.update(bloco)
+
+        nome = self.nome_blob(os.path.dirname(name), sha256.hexdigest(), os.path.splitext(name)[1])
+        if self.exists(nome):
+            os.unlink(caminho)
+            self._renovar(nome)
+            return nome
+
+        temporario = self._temporario()
+        shutil.move(caminho, temporario)
+        return self._instalar(temporario, nome)
+
+    def vincular_arquivo(self, caminho, name):
+        """
+        Como importar_arquivo, mas mantém o original: cria um hardlink para o
+        blob (ou copia, entre volumes). Retorna o nome do blob.
+        """
+        sha256 = hashlib.sha256()
+        with open(caminho, 'rb') as origem:
+            for bloco in iter(lambda: origem.read(self.TAMANHO_BLOCO), b''):
+                sha256.update(bloco)
+
+        nome = self.nome_blob(os.path.dirname(name), sha256.hexdigest(), os.path.splitext(name)[1])
+        if self.exists(nome):
+            self._renovar(nome)
+            return nome
+
+        temporario = self._temporario()
+        os.unlink(temporario)
+        try:
+            os.link(caminho, temporario)
+        except OSError:
+            shutil.copy2(caminho, temporario)
+        return self._instalar(temporario, nome)
+
+    def delete(self, name):
+        # Blobs podem ser compartilhados; ver gc_midia
+        pass
+
+    def _temporario(self):
+        pasta = self.caminho_quente(PASTA_TEMPORARIA)
+        os.makedirs(pasta, exist_ok=True)
+        fd, caminho = tempfile.mkstemp(dir=pasta, prefix='blob-')
+        os.close(fd)
+        return caminho
+
+    def _renovar(self, nome):
+        """
+        Atualiza o mtime de um blob reaproveitado: o gc_midia só remove blobs
+        sem modificação há --idade-minima, e o novo exame que o referencia pode
+        ainda não estar no banco.
+        """
+        try:
+            os.utime(self.caminho_quente(nome))
+        except FileNotFoundError:
+            # Só na camada fria (core.arquivo_frio)
+            pass
+
+    def _instalar(self, temporario, nome):
+        destino = self.caminho_quente(nome)
+        if os.path.exists(destino):
+            # Mesmo conteúdo já armazenado
+            os.unlink(temporario)
+            self._renovar(nome)
+            return nome
+
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        if self.file_permissions_mode is not None:
+            os.chmod(temporario, self.file_permissions_mode)
+        else:
+            os.chmod(temporario, 0o644)
+        os.replace(temporario, destino)
+        return nome
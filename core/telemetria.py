@@ -0,0 +1,156 @@
+"""
+Registro das chamadas aos provedores de IA (modelo ChamadaIA).
+
+As chamadas são acumuladas em memória e gravadas em lote por uma thread em
+segundo plano, fora do caminho da requisição: a cada TELEMETRIA_INTERVALO
+segundos ou assim que o lote atinge TELEMETRIA_LOTE registros.
+"""
+import os
+import math
+import atexit
+import logging
+import threading
+from collections import defaultdict
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models.functions import TruncDate
+from .models import ChamadaIA
+
+logger = logging.getLogger(__name__)
+
+_buffer = []
+_lock = threading.Lock()
+_evento = threading.Event()
+_thread = None
+_pid = None
+
+def registrar_chamada(**dados):
+    """Enfileira o registro de uma chamada de IA para gravação em lote"""
+    with _lock:
+        _buffer.append(ChamadaIA(**dados))
+        cheio = len(_buffer) >= settings.TELEMETRIA_LOTE
+        _garantir_thread()
+    if cheio:
+        _evento.set()
+
+def descarregar():
+    """Grava imediatamente os registros pendentes"""
+    with _lock:
+        lote = _buffer[:]
+        _buffer.clear()
+    if not lote:
+        return
+
+    try:
+        close_old_connections()
+        with transaction.atomic():
+            ChamadaIA.objects.bulk_create(lote, batch_size=500)
+    except Exception as e:
+        # Um registro inválido derruba o lote inteiro
+        logger.warning(f"Lote de {len(lote)} registros de telemetria de IA recusado ({str(e)}); gravando um a um")
+        _gravar_um_a_um(lote)
+
+def _gravar_um_a_um(lote):
+    for chamada in lote:
+        try:
+            with transaction.atomic():
+                chamada.save(force_insert=True)
+        except Exception as e:
+            logger.error(f"Registro de telemetria de IA descartado: {str(e)}")
+
+def _garantir_thread():
+    """Inicia a thread de gravação no processo atual (inclusive após fork)"""
+    global _thread, _pid
+    if _thread is not None and _pid == os.getpid() and _thread.is_alive():
+        return
+    _pid = os.getpid()
+    _thread = threading.Thread(target=_loop, name='telemetria-ia', daemon=True)
+    _thread.start()
+
+def _loop():
+    while True:
+        _evento.wait(settings.TELEMETRIA_INTERVALO)
+        _evento.clear()
+        descarregar()
+
+atexit.register(descarregar)
+
+# Relatórios
+
+class EsbocoLatencias:
+    """
+    Histograma com classes em progressão geométrica: percentis com erro
+    relativo de até FATOR - 1 em memória limitada, qualquer que seja o
+    número de chamadas.
+    """
+    FATOR = 1.02
+
+    def __init__(self):
+        self.contagens = defaultdict(int)
+        self.total = 0
+        self.maximo = 0
+
+    def adicionar(self, valor):
+        classe = math.ceil(math.log(valor, self.FATOR)) if valor > 1 else 0
+        self.contagens[classe] += 1
+        self.total += 1
+        self.maximo = max(self.maximo, valor)
+
+    def percentil(self, p):
+        """Limite superior da classe que contém o posto mais próximo"""
+        if not self.total:
+            return None
+        posto = max(math.ceil(p / 100 * self.total), 1)
+        acumulado = 0
+        for classe in sorted(self.contagens):
+            acumulado += self.contagens[classe]
+            if acumulado >= posto:
+                return min(round(self.FATOR ** classe), self.maximo)
+
+def _resumir(grupos):
+    linhas = []
+    for chave, dados in sorted(grupos.items()):
+        latencias = dados['latencias']
+        linhas.append({
+            'chave': chave,
+            'chamadas': latencias.total,
+            'erros': dados['erros'],
+            'p50': latencias.percentil(50),
+            'p95': latencias.percentil(95),
+            'p99': latencias.percentil(99),
+            'tokens_entrada': dados['tokens_entrada'],
+            'tokens_saida': dados['tokens_saida'],
+        })
+    return linhas
+
+def relatorio_chamadas(desde):
+    """
+    Latência (p50/p95/p99) e tokens consumidos desde a data informada,
+    agrupados por dia e provedor e por usuário. Percorre o ledger em streaming;
+    as latências vão para um EsbocoLatencias por grupo, não para listas.
+    """
+    def novo_grupo():
+        return {'latencias': EsbocoLatencias(), 'erros': 0, 'tokens_entrada': 0, 'tokens_saida': 0}
+
+    por_dia_provedor = defaultdict(novo_grupo)
+    por_usuario = defaultdict(novo_grupo)
+
+    registros = (
+        ChamadaIA.objects.filter(iniciado_em__gte=desde)
+        .annotate(dia=TruncDate('iniciado_em'))
+        .order_by()
+        .values_list('dia', 'provedor_nome', 'usuario__username', 'latencia_ms',
+                     'tokens_entrada', 'tokens_saida', 'resultado')
+    )
+
+    for dia, provedor, usuario, latencia, entrada, saida, resultado in registros.iterator(chunk_size=2000):
+        for grupo in (por_dia_provedor[(dia, provedor)], por_usuario[usuario or '-']):
+            grupo['latencias'].adicionar(latencia)
+            grupo['erros'] += resultado != 'sucesso'
+            grupo['tokens_entrada'] += entrada or 0
+            grupo['tokens_saida'] += saida or 0
+
+    return {
+        'por_dia_provedor': _resumir(por_dia_provedor),
+        'por_usuario': _resumir(por_usuario),
+    }
@@ -1,3 +1,938 @@
-from django.test import TestCase
+import hashlib
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from unittest import mock
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.http import Http404
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from google.genai import errors as genai_errors
+from PIL import Image
+from .models import Paciente, ExameOCT, ArquivoFrio, ChamadaIA, ProvedorIA, SolicitacaoAnalise, UploadOCT
+from . import (
+    agendador, ai_service, analise, arquivo_frio, cache_service, importacao, ingestao, metrics, pdf_service,
+    resiliencia, telemetria, upload_service,
+)
 
-# Create your tests here.
+CACHES_TESTE = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'testes'},
+    'laudo_imagens': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'testes-laudo'},
+}
+
+def ruido(modo, tamanho):
+    """Imagem de ruído: o pior caso para a compressão JPEG"""
+    bytes_por_pixel = {'L': 1, 'I;16': 2}[modo]
+    return Image.frombytes(modo, tamanho, os.urandom(tamanho[0] * tamanho[1] * bytes_por_pixel))
+
+class MidiaTemporariaMixin:
+    """MEDIA_ROOT e caches isolados por teste"""
+
+    def setUp(self):
+        super().setUp()
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        configuracao = override_settings(MEDIA_ROOT=self.media, CACHES=CACHES_TESTE)
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('medico', password='senha')
+        cls.paciente = Paciente.objects.create(
+            nome='Paciente Teste', data_nascimento=date(1960, 5, 17), prontuario='T-1'
+        )
+
+    def criar_exame(self, conteudo, nome):
+        return ExameOCT.objects.create(
+            paciente=self.paciente,
+            usuario=self.usuario,
+            imagem=ContentFile(conteudo, nome),
+            diagnostico_ia='### Achados\n- Sem fluido sub-retiniano\n- EPR preservado',
+        )
+
+class LaudoPDFTests(MidiaTemporariaMixin, TestCase):
+    """Tamanho e tempo de geração do laudo com imagens grandes"""
+
+    # Texto, fontes e estrutura do PDF além das imagens
+    MARGEM_BYTES = 64 * 1024
+    TEMPO_MAXIMO_S = 10
+
+    def gerar(self, exame):
+        inicio = time.perf_counter()
+        pdf = pdf_service.gerar_laudo_pdf(exame).getvalue()
+        return pdf, time.perf_counter() - inicio
+
+    def verificar_orcamento(self, pdf, segundos):
+        self.assertTrue(pdf.startswith(b'%PDF'))
+        self.assertLessEqual(len(pdf), settings.LAUDO_ORCAMENTO_IMAGENS + self.MARGEM_BYTES)
+        self.assertLess(segundos, self.TEMPO_MAXIMO_S)
+
+    def test_jpeg_grande_cabe_no_orcamento(self):
+        arquivo = io.BytesIO()
+        ruido('L', (4000, 3000)).convert('RGB').save(arquivo, 'JPEG', quality=95)
+        self.assertGreater(arquivo.tell(), 5 * 1024 * 1024)
+        exame = self.criar_exame(arquivo.getvalue(), 'scan.jpg')
+
+        pdf, segundos = self.gerar(exame)
+
+        self.verificar_orcamento(pdf, segundos)
+
+    def test_tiff_multiframe_16_bits_cabe_no_orcamento(self):
+        frames = [ruido('I;16', (1536, 1024)) for _ in range(8)]
+        arquivo = io.BytesIO()
+        frames[0].save(arquivo, 'TIFF', save_all=True, append_images=frames[1:])
+        exame = self.criar_exame(arquivo.getvalue(), 'pilha.tif')
+
+        pdf, segundos = self.gerar(exame)
+
+        self.verificar_orcamento(pdf, segundos)
+        imagens = pdf_service.obter_imagens_laudo(exame)
+        self.assertEqual(len(imagens), 1 + settings.LAUDO_CORTES_CHAVE)
+        self.assertLessEqual(sum(len(i['jpeg']) for i in imagens), settings.LAUDO_ORCAMENTO_IMAGENS)
+
+    def test_imagens_preparadas_sao_reaproveitadas(self):
+        arquivo = io.BytesIO()
+        ruido('L', (2000, 1500)).save(arquivo, 'PNG')
+        exame = self.criar_exame(arquivo.getvalue(), 'scan.png')
+        self.gerar(exame)
+
+        with mock.patch.object(pdf_service, 'preparar_imagens_laudo') as preparar:
+            pdf, segundos = self.gerar(exame)
+
+        preparar.assert_not_called()
+        self.verificar_orcamento(pdf, segundos)
+
+class ArquivoFrioTests(MidiaTemporariaMixin, TestCase):
+    """Arquivamento em camada fria, restauração sob demanda e liberação da cópia restaurada"""
+
+    def setUp(self):
+        super().setUp()
+        self.frio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.frio, ignore_errors=True)
+        configuracao = override_settings(ARQUIVO_FRIO_DIR=self.frio, ARQUIVO_IDADE_DIAS=365, ARQUIVO_CACHE_DIAS=30)
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+
+        arquivo = io.BytesIO()
+        ruido('L', (300, 200)).save(arquivo, 'PNG')
+        self.conteudo = arquivo.getvalue()
+        self.exame = self.criar_exame(self.conteudo, 'scan.png')
+        self.envelhecer(self.exame, dias=400)
+        self.nome = self.exame.imagem.name
+        self.quente = default_storage.caminho_quente(self.nome)
+
+    def envelhecer(self, exame, dias):
+        ExameOCT.objects.filter(id=exame.id).update(data_exame=timezone.now() - timedelta(days=dias))
+
+    def arquivar(self, *args):
+        call_command('arquivar_midia', *args, stdout=io.StringIO())
+
+    def ler(self):
+        # Instância nova, como numa requisição
+        exame = ExameOCT.objects.get(id=self.exame.id)
+        with exame.imagem.open('rb') as arquivo:
+            return arquivo.read()
+
+    def test_arquiva_e_restaura_sob_demanda(self):
+        self.arquivar()
+
+        self.assertFalse(os.path.exists(self.quente))
+        registro = ArquivoFrio.objects.get(nome=self.nome)
+        self.assertEqual(registro.tamanho, len(self.conteudo))
+        self.assertTrue(default_storage.exists(self.nome))
+
+        self.assertEqual(self.ler(), self.conteudo)
+        self.assertTrue(os.path.exists(self.quente))
+        registro.refresh_from_db()
+        self.assertIsNotNone(registro.restaurado_em)
+
+    def test_copia_restaurada_liberada_apos_cache(self):
+        self.arquivar()
+        self.ler()
+
+        # Restaurada há pouco: continua no disco
+        self.arquivar()
+        self.assertTrue(os.path.exists(self.quente))
+
+        ArquivoFrio.objects.update(restaurado_em=timezone.now() - timedelta(days=31))
+        self.arquivar()
+        self.assertFalse(os.path.exists(self.quente))
+        self.assertEqual(self.ler(), self.conteudo)
+
+    def test_blob_compartilhado_com_exame_recente_fica_no_disco(self):
+        self.criar_exame(self.conteudo, 'copia.png')
+
+        self.arquivar()
+
+        self.assertTrue(os.path.exists(self.quente))
+        self.assertFalse(ArquivoFrio.objects.exists())
+
+    def test_idade_zero_arquiva_exames_de_hoje(self):
+        recente = self.criar_exame(b'\x89PNG\r\n\x1a\n' + os.urandom(1024), 'hoje.png')
+
+        self.arquivar('--idade-dias', '0')
+
+        self.assertEqual(
+            set(ArquivoFrio.objects.values_list('nome', flat=True)), {self.nome, recente.imagem.name}
+        )
+
+    def test_copia_fria_ausente_responde_404(self):
+        self.arquivar()
+        registro = ArquivoFrio.objects.get(nome=self.nome)
+        os.unlink(arquivo_frio.caminho_frio(registro.caminho_frio))
+
+        self.assertFalse(default_storage.exists(self.nome))
+        self.client.force_login(self.usuario)
+        resposta = self.client.get(reverse('exame_imagem', args=[self.exame.id]))
+        self.assertEqual(resposta.status_code, 404)
+
+    def test_copia_fria_corrompida_nao_e_restaurada(self):
+        self.arquivar()
+        registro = ArquivoFrio.objects.get(nome=self.nome)
+        with open(arquivo_frio.caminho_frio(registro.caminho_frio), 'wb') as arquivo:
+            arquivo.write(b'corrompido')
+
+        self.assertFalse(os.path.exists(ExameOCT.objects.get(id=self.exame.id).imagem.path))
+        self.client.force_login(self.usuario)
+        resposta = self.client.get(reverse('exame_imagem', args=[self.exame.id]))
+        self.assertEqual(resposta.status_code, 404)
+        self.assertEqual(os.listdir(default_storage.caminho_quente('.tmp')), [])
+
+class PaginasTests(MidiaTemporariaMixin, TestCase):
+    """Páginas renderizam sem depender do manifest do collectstatic"""
+
+    def test_login_e_home_renderizam(self):
+        self.assertEqual(self.client.get(reverse('login')).status_code, 200)
+
+        self.client.force_login(self.usuario)
+        resposta = self.client.get(reverse('home'))
+
+        self.assertEqual(resposta.status_code, 200)
+        self.assertContains(resposta, settings.STATIC_URL)
+
+class CacheExameTests(MidiaTemporariaMixin, TestCase):
+    """Exame da página de análise servido do cache e invalidado quando muda"""
+
+    def setUp(self):
+        super().setUp()
+        self.exame = self.criar_exame(b'\x89PNG\r\n\x1a\n', 'scan.png')
+
+    def test_segunda_leitura_vem_do_cache(self):
+        cache_service.obter_exame(self.exame.id)
+
+        with self.assertNumQueries(0):
+            exame = cache_service.obter_exame(self.exame.id)
+
+        self.assertEqual(exame.paciente.nome, 'Paciente Teste')
+
+    def test_exame_inexistente_nao_e_cacheado(self):
+        with self.assertRaises(Http404):
+            cache_service.obter_exame(0)
+        self.assertIsNone(cache.get(cache_service.chave_exame(0)))
+
+    def test_save_do_exame_e_do_paciente_invalida(self):
+        cache_service.obter_exame(self.exame.id)
+        self.exame.status = 'concluido'
+        self.exame.save()
+        self.assertEqual(cache_service.obter_exame(self.exame.id).status, 'concluido')
+
+        self.paciente.nome = 'Nome Corrigido'
+        self.paciente.save()
+        self.assertEqual(cache_service.obter_exame(self.exame.id).paciente.nome, 'Nome Corrigido')
+
+    def test_recuperar_analises_interrompidas_invalida(self):
+        ExameOCT.objects.filter(id=self.exame.id).update(status='analisando', analise_iniciada_em=None)
+        self.assertEqual(cache_service.obter_exame(self.exame.id).status, 'analisando')
+
+        self.assertEqual(analise.recuperar_analises_interrompidas(), 1)
+
+        self.assertEqual(cache_service.obter_exame(self.exame.id).status, 'pendente')
+
+class EntregaMidiaTests(MidiaTemporariaMixin, TestCase):
+    """Range, 416, 304 e X-Accel-Redirect na entrega de mídia, e quem pode acessá-la"""
+
+    def setUp(self):
+        super().setUp()
+        self.conteudo = bytes(range(256)) * 4
+        self.exame = self.criar_exame(self.conteudo, 'scan.png')
+        self.url = reverse('exame_imagem', args=[self.exame.id])
+        self.client.force_login(self.usuario)
+
+    def test_arquivo_inteiro_com_validadores(self):
+        resposta = self.client.get(self.url)
+
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(b''.join(resposta.streaming_content), self.conteudo)
+        self.assertEqual(resposta['Accept-Ranges'], 'bytes')
+        self.assertIn('ETag', resposta)
+        self.assertIn('Last-Modified', resposta)
+
+    def test_range(self):
+        resposta = self.client.get(self.url, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(resposta.status_code, 206)
+        self.assertEqual(resposta['Content-Range'], f'bytes 10-19/{len(self.conteudo)}')
+        self.assertEqual(b''.join(resposta.streaming_content), self.conteudo[10:20])
+
+        resposta = self.client.get(self.url, HTTP_RANGE='bytes=-5')
+        self.assertEqual(b''.join(resposta.streaming_content), self.conteudo[-5:])
+
+    def test_range_fora_do_arquivo_responde_416(self):
+        resposta = self.client.get(self.url, HTTP_RANGE=f'bytes={len(self.conteudo)}-')
+
+        self.assertEqual(resposta.status_code, 416)
+        self.assertEqual(resposta['Content-Range'], f'bytes */{len(self.conteudo)}')
+
+    def test_if_range_divergente_envia_arquivo_inteiro(self):
+        resposta = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"outro"')
+
+        self.assertEqual(resposta.status_code, 200)
+
+    def test_304_repete_validadores(self):
+        etag = self.client.get(self.url)['ETag']
+
+        resposta = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(resposta.status_code, 304)
+        self.assertEqual(resposta['ETag'], etag)
+        self.assertIn('Last-Modified', resposta)
+        self.assertIn('must-revalidate', resposta['Cache-Control'])
+
+    @override_settings(MEDIA_ACCEL_MODE='nginx')
+    def test_x_accel_redirect(self):
+        resposta = self.client.get(self.url)
+
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.content, b'')
+        self.assertEqual(
+            resposta['X-Accel-Redirect'], settings.MEDIA_ACCEL_PREFIX + self.exame.imagem.name
+        )
+        self.assertEqual(resposta['Content-Type'], 'image/png')
+
+    def test_outro_usuario_recebe_403_e_equipe_acessa(self):
+        outro = User.objects.create_user('outro', password='senha')
+        self.client.force_login(outro)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+        outro.is_staff = True
+        outro.save()
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+class MetricasTests(MidiaTemporariaMixin, TestCase):
+    """Autenticação do /metrics e rótulos das métricas de requisição"""
+
+    @override_settings(METRICS_TOKEN='segredo')
+    def test_token(self):
+        url = reverse('metrics')
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer segredo').status_code, 200)
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer errado').status_code, 401)
+        # Cabeçalho fora do ASCII não pode virar 500
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer sénha').status_code, 401)
+
+    @override_settings(METRICS_TOKEN='')
+    def test_sem_token_exige_staff(self):
+        url = reverse('metrics')
+        self.client.force_login(self.usuario)
+        self.assertEqual(self.client.get(url).status_code, 401)
+
+        staff = User.objects.create_user('equipe', password='senha', is_staff=True)
+        self.client.force_login(staff)
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_metodo_desconhecido_vira_other(self):
+        self.client.generic('FOOBAR', reverse('login'))
+
+        amostra = metrics.REGISTRY.get_sample_value(
+            'oct_requisicao_segundos_count', {'view': 'login', 'metodo': 'other', 'status': '4xx'}
+        )
+        self.assertGreaterEqual(amostra, 1)
+        self.assertIsNone(metrics.REGISTRY.get_sample_value(
+            'oct_requisicao_segundos_count', {'view': 'login', 'metodo': 'FOOBAR', 'status': '4xx'}
+        ))
+
+class TelemetriaTests(TestCase):
+    """Gravação em lote do ledger de chamadas de IA e relatório de latência"""
+
+    def chamada(self, latencia_ms, **dados):
+        return {
+            'provedor_nome': 'Gemini', 'modelo': 'gemini', 'versao_prompt': 'v1',
+            'iniciado_em': timezone.now(), 'latencia_ms': latencia_ms, 'resultado': 'sucesso', **dados,
+        }
+
+    def test_registro_invalido_nao_derruba_o_lote(self):
+        telemetria.registrar_chamada(**self.chamada(100))
+        telemetria.registrar_chamada(**self.chamada(None))
+        telemetria.registrar_chamada(**self.chamada(300))
+
+        with self.assertLogs('core.telemetria', 'ERROR'):
+            telemetria.descarregar()
+
+        self.assertEqual(sorted(ChamadaIA.objects.values_list('latencia_ms', flat=True)), [100, 300])
+
+    def test_percentis_do_esboco(self):
+        latencias = list(range(1, 10001))
+        esboco = telemetria.EsbocoLatencias()
+        for latencia in latencias:
+            esboco.adicionar(latencia)
+
+        for p, exato in ((50, 5000), (95, 9500), (99, 9900)):
+            self.assertAlmostEqual(esboco.percentil(p), exato, delta=exato * (esboco.FATOR - 1))
+        self.assertEqual(esboco.percentil(100), 10000)
+        self.assertLess(len(esboco.contagens), 500)
+        self.assertIsNone(telemetria.EsbocoLatencias().percentil(50))
+
+    def test_relatorio_agrupa_por_dia_provedor_e_usuario(self):
+        usuario = User.objects.create_user('medico', password='senha')
+        ChamadaIA.objects.bulk_create([
+            ChamadaIA(**self.chamada(latencia, usuario=usuario, tokens_entrada=10, tokens_saida=5))
+            for latencia in (100, 200, 300)
+        ] + [ChamadaIA(**self.chamada(50, resultado='erro'))])
+
+        relatorio = telemetria.relatorio_chamadas(timezone.now() - timedelta(days=1))
+
+        [dia] = relatorio['por_dia_provedor']
+        self.assertEqual((dia['chamadas'], dia['erros'], dia['tokens_entrada']), (4, 1, 30))
+        por_usuario = {linha['chave']: linha for linha in relatorio['por_usuario']}
+        self.assertAlmostEqual(por_usuario['medico']['p50'], 200, delta=200 * (telemetria.EsbocoLatencias.FATOR - 1))
+        self.assertEqual(por_usuario['medico']['p99'], 300)
+        self.assertEqual(por_usuario['-']['chamadas'], 1)
+
+    @override_settings(TELEMETRIA_RELATORIO_DIAS_MAX=90)
+    def test_periodo_do_relatorio_limitado(self):
+        admin = User.objects.create_superuser('admin', password='senha')
+        self.client.force_login(admin)
+
+        resposta = self.client.get(reverse('admin:core_chamadaia_relatorio'), {'dias': 100000})
+
+        self.assertEqual(resposta.context['dias'], 90)
+
+class RelogioFalso:
+    """Substitui o módulo time em core.resiliencia: sleep avança o relógio"""
+
+    def __init__(self):
+        self.agora = 1000.0
+
+    def monotonic(self):
+        return self.agora
+
+    def sleep(self, segundos):
+        self.agora += segundos
+
+@override_settings(IA_CIRCUITO_FALHAS=3, IA_CIRCUITO_RECUPERACAO=30, IA_MAX_TENTATIVAS=3)
+class ResilienciaTests(TestCase):
+    """Disjuntor, novas tentativas só em erros transitórios e prazo total"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.provedor = ProvedorIA.objects.create(nome='Gemini', api_url='https://exemplo', api_key='chave')
+
+    def setUp(self):
+        self.relogio = RelogioFalso()
+        for alvo, valor in (('time', self.relogio), ('random.uniform', lambda a, b: b)):
+            patcher = mock.patch(f'core.resiliencia.{alvo}', valor)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(resiliencia._disjuntores.clear)
+        self.disjuntor = resiliencia.obter_disjuntor(self.provedor)
+
+    def executar(self, funcao, segundos=120):
+        return resiliencia.executar_com_resiliencia(funcao, self.provedor, resiliencia.Prazo(segundos))
+
+    def abrir(self):
+        for _ in range(3):
+            self.disjuntor.registrar_falha()
+
+    def test_abre_apos_falhas_seguidas(self):
+        self.disjuntor.registrar_falha()
+        self.disjuntor.registrar_falha()
+        self.disjuntor.registrar_sucesso()
+        self.disjuntor.registrar_falha()
+        self.disjuntor.registrar_falha()
+        self.assertEqual(self.disjuntor.estado, resiliencia.Disjuntor.FECHADO)
+
+        self.disjuntor.registrar_falha()
+
+        self.assertEqual(self.disjuntor.estado, resiliencia.Disjuntor.ABERTO)
+        with self.assertRaises(resiliencia.CircuitoAberto):
+            self.disjuntor.permitir()
+
+    def test_semiaberto_deixa_passar_uma_chamada_de_teste(self):
+        self.abrir()
+        self.relogio.sleep(30)
+        self.assertEqual(self.disjuntor.estado, resiliencia.Disjuntor.SEMIABERTO)
+
+        self.disjuntor.permitir()
+        with self.assertRaises(resiliencia.CircuitoAberto):
+            self.disjuntor.permitir()
+
+        self.disjuntor.registrar_sucesso()
+        self.assertEqual(self.disjuntor.estado, resiliencia.Disjuntor.FECHADO)
+
+    def test_falha_no_teste_reabre(self):
+        self.abrir()
+        self.relogio.sleep(30)
+        self.disjuntor.permitir()
+
+        self.disjuntor.registrar_falha()
+
+        self.assertEqual(self.disjuntor.estado, resiliencia.Disjuntor.ABERTO)
+
+    def test_repete_erros_transitorios(self):
+        respostas = [genai_errors.APIError(503, {}), genai_errors.APIError(429, {}), 'ok']
+
+        def funcao(restante):
+            resposta = respostas.pop(0)
+            if isinstance(resposta, Exception):
+                raise resposta
+            return resposta
+
+        self.assertEqual(self.executar(funcao), 'ok')
+        self.assertEqual(respostas, [])
+        self.assertEqual(self.disjuntor.estado, resiliencia.Disjuntor.FECHADO)
+
+    def test_nao_repete_erros_definitivos(self):
+        for erro in (genai_errors.APIError(400, {}), ValueError('imagem ilegível')):
+            funcao = mock.Mock(side_effect=erro)
+
+            with self.assertRaises(type(erro)):
+                self.executar(funcao)
+
+            self.assertEqual(funcao.call_count, 1)
+        # Erros definitivos não contam como falha do provedor
+        self.assertEqual(self.disjuntor._falhas, 0)
+
+    def test_limite_de_tentativas(self):
+        funcao = mock.Mock(side_effect=genai_errors.APIError(503, {}))
+
+        with self.assertRaises(genai_errors.APIError):
+            self.executar(funcao)
+
+        self.assertEqual(funcao.call_count, 3)
+
+    def test_prazo_repassado_a_cada_tentativa(self):
+        restantes = []
+
+        def funcao(restante):
+            restantes.append(restante)
+            self.relogio.sleep(4)
+            raise genai_errors.APIError(504, {})
+
+        with self.assertRaises(genai_errors.APIError):
+            self.executar(funcao, segundos=10)
+
+        # 10s; 4s na chamada e 1s de espera (backoff base) deixam 5s; a próxima espera (2s) não cabe
+        self.assertEqual(restantes, [10, 5])
+
+    def test_prazo_esgotado_nao_chama_o_provedor(self):
+        funcao = mock.Mock()
+
+        with self.assertRaises(resiliencia.PrazoEsgotado):
+            self.executar(funcao, segundos=0)
+
+        funcao.assert_not_called()
+
+    def test_erro_fora_do_sdk_nao_importa_o_sdk(self):
+        with mock.patch.dict(sys.modules):
+            for modulo in [m for m in sys.modules if m == 'httpx' or m.startswith(('httpx.', 'google.genai'))]:
+                del sys.modules[modulo]
+
+            self.assertFalse(resiliencia.erro_retentavel(FileNotFoundError('scan.png')))
+
+            self.assertNotIn('httpx', sys.modules)
+            self.assertNotIn('google.genai.errors', sys.modules)
+
+class ImportacaoPacientesTests(TestCase):
+    """Upsert pelo prontuário, reimportação idempotente e codificação do arquivo"""
+
+    CSV = (
+        'nome,data_nascimento,prontuario\n'
+        'Ana Souza,1950-01-02,P-1\n'
+        'João Lima,02/03/1961,P-2\n'
+        'Sem Prontuário,1970-04-05,\n'
+        'Linha Ruim,31/02/1970,P-3\n'
+    )
+
+    def setUp(self):
+        self.pasta = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.pasta, ignore_errors=True)
+        configuracao = override_settings(IMPORTACAO_REJEITADOS_DIR=self.pasta, CACHES=CACHES_TESTE)
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+
+    def importar(self, texto, tamanho_lote=None):
+        rejeitados = importacao.ArquivoRejeitados(os.path.join(self.pasta, 'rejeitados.csv'))
+        return importacao.importar_pacientes(importacao.ler_csv(io.StringIO(texto)), rejeitados, tamanho_lote)
+
+    def test_insere_e_atualiza_pelo_prontuario(self):
+        Paciente.objects.create(nome='Ana S.', data_nascimento=date(1950, 1, 1), prontuario='P-1')
+
+        resumo = self.importar(self.CSV)
+
+        self.assertEqual(resumo, {'lidos': 4, 'gravados': 3, 'rejeitados': 1})
+        ana = Paciente.objects.get(prontuario='P-1')
+        self.assertEqual((ana.nome, ana.data_nascimento), ('Ana Souza', date(1950, 1, 2)))
+        self.assertEqual(Paciente.objects.count(), 3)
+
+    def test_reimportacao_nao_duplica(self):
+        self.importar(self.CSV, tamanho_lote=2)
+        cadastrados = set(Paciente.objects.values_list('id', 'nome', 'prontuario'))
+
+        resumo = self.importar(self.CSV, tamanho_lote=2)
+
+        self.assertEqual(set(Paciente.objects.values_list('id', 'nome', 'prontuario')), cadastrados)
+        self.assertEqual(resumo, {'lidos': 4, 'gravados': 2, 'rejeitados': 2})
+        with open(os.path.join(self.pasta, 'rejeitados.csv'), encoding='utf-8') as arquivo:
+            self.assertIn('Paciente sem prontuário já cadastrado', arquivo.read())
+
+    def test_repetidos_no_mesmo_arquivo(self):
+        resumo = self.importar(
+            'nome,data_nascimento,prontuario\n'
+            'Ana,1950-01-02,P-1\nAna Souza,1950-01-02,P-1\nSem,1970-04-05,\nSem,1970-04-05,\n'
+        )
+
+        self.assertEqual(resumo, {'lidos': 4, 'gravados': 2, 'rejeitados': 2})
+        self.assertEqual(Paciente.objects.get(prontuario='P-1').nome, 'Ana Souza')
+
+    def test_cabecalho_sem_colunas_obrigatorias(self):
+        with self.assertRaises(importacao.ArquivoInvalido):
+            importacao.ler_csv(io.StringIO('nome;data_nascimento\nAna;1950-01-02\n'))
+
+    def test_admin_latin1(self):
+        self.client.force_login(User.objects.create_superuser('admin', password='senha'))
+        url = reverse('admin:core_paciente_importar')
+        conteudo = self.CSV.encode('latin-1')
+
+        def enviar(encoding):
+            return self.client.post(url, {
+                'arquivo': SimpleUploadedFile('pacientes.csv', conteudo), 'formato': 'csv',
+                'delimitador': ',', 'encoding': encoding,
+            })
+
+        resposta = enviar('utf-8-sig')
+        self.assertEqual(resposta.status_code, 200)
+        self.assertTrue(resposta.context['form'].has_error('encoding'))
+
+        resposta = enviar('latin-1')
+        self.assertRedirects(resposta, reverse('admin:core_paciente_changelist'))
+        self.assertEqual(Paciente.objects.get(prontuario='P-2').nome, 'João Lima')
+
+class AnaliseConcorrenteTests(MidiaTemporariaMixin, TestCase):
+    """Uma análise por exame, envio no formato aceito pelo provedor e ingestão idempotente"""
+
+    def setUp(self):
+        super().setUp()
+        arquivo = io.BytesIO()
+        ruido('L', (64, 48)).save(arquivo, 'PNG')
+        self.exame = self.criar_exame(arquivo.getvalue(), 'scan.png')
+        ExameOCT.objects.filter(id=self.exame.id).update(diagnostico_ia='')
+        self.exame.refresh_from_db()
+
+    def test_view_recusa_exame_em_analise(self):
+        ExameOCT.objects.filter(id=self.exame.id).update(status='analisando')
+        self.client.force_login(self.usuario)
+
+        with mock.patch.object(analise, 'analyze_oct_image') as analisar:
+            resposta = self.client.post(reverse('exame_analyze_ai', args=[self.exame.id]))
+
+        self.assertEqual(resposta.status_code, 409)
+        analisar.assert_not_called()
+
+    def test_so_uma_analise_reivindica_o_exame(self):
+        # Outra análise reivindicou o exame depois que esta instância foi lida
+        ExameOCT.objects.filter(id=self.exame.id).update(status='analisando')
+
+        with mock.patch.object(analise, 'analyze_oct_image') as analisar:
+            resultado = analise.executar_analise(self.exame, self.usuario)
+
+        self.assertTrue(resultado['em_andamento'])
+        analisar.assert_not_called()
+        self.assertEqual(ExameOCT.objects.get(id=self.exame.id).status, 'analisando')
+        self.assertFalse(SolicitacaoAnalise.objects.filter(estado__in=('aguardando', 'executando')).exists())
+
+    def test_analise_concluida(self):
+        resultado = {'success': True, 'diagnostico': 'Sem alterações', 'error': None}
+        with mock.patch.object(analise, 'analyze_oct_image', return_value=resultado):
+            analise.executar_analise(self.exame, self.usuario)
+
+        exame = ExameOCT.objects.get(id=self.exame.id)
+        self.assertEqual((exame.status, exame.diagnostico_ia), ('concluido', 'Sem alterações'))
+
+    def test_formatos_enviados_ao_provedor(self):
+        caminho = self.exame.imagem.path
+        dados, mime_type = ai_service.imagem_para_envio(caminho)
+        self.assertEqual(mime_type, 'image/png')
+        with open(caminho, 'rb') as arquivo:
+            self.assertEqual(dados, arquivo.read())
+
+        frames = [Image.new('I;16', (32, 16), valor) for valor in (100, 30000, 60000)]
+        tiff = os.path.join(self.media, 'pilha.tif')
+        frames[0].save(tiff, 'TIFF', save_all=True, append_images=frames[1:])
+
+        dados, mime_type = ai_service.imagem_para_envio(tiff)
+
+        self.assertEqual(mime_type, 'image/png')
+        with Image.open(io.BytesIO(dados)) as imagem:
+            self.assertEqual(imagem.format, 'PNG')
+            self.assertEqual(imagem.getpixel((0, 0)), 30000)
+
+    def test_ingestao_repetida_nao_duplica(self):
+        pasta = tempfile.mkdtemp(dir=self.media)
+        origem = os.path.join(pasta, f'{self.paciente.prontuario}_OD.png')
+        with open(self.exame.imagem.path, 'rb') as arquivo:
+            conteudo = arquivo.read()
+
+        def exportar():
+            with open(origem, 'wb') as arquivo:
+                arquivo.write(conteudo)
+
+        exportar()
+        [criado] = ingestao.ingerir_lote([origem], self.usuario)
+        # Processo interrompido entre o commit e a remoção do original
+        exportar()
+
+        self.assertEqual(ingestao.ingerir_lote([origem], self.usuario), [])
+
+        self.assertFalse(os.path.exists(origem))
+        self.assertEqual(ExameOCT.objects.filter(origem='pasta').count(), 1)
+        self.assertEqual(criado.imagem.name, self.exame.imagem.name)
+
+class InicializacaoTests(TestCase):
+    """SDK do Gemini e ReportLab fora da partida do processo"""
+
+    def test_views_e_urls_nao_importam_modulos_sob_demanda(self):
+        # Processo novo: neste, outros testes já importaram os SDKs
+        codigo = (
+            "import django, json; django.setup()\n"
+            "import core.views, core.urls\n"
+            "from core.inicializacao import carregados_sob_demanda\n"
+            "print(json.dumps(carregados_sob_demanda()))\n"
+        )
+        processo = subprocess.run(
+            [sys.executable, '-c', codigo], cwd=settings.BASE_DIR, capture_output=True, text=True,
+            env={**os.environ, 'DJANGO_SETTINGS_MODULE': 'oct_system.settings'}, timeout=60,
+        )
+
+        self.assertEqual(processo.returncode, 0, processo.stderr)
+        self.assertEqual(json.loads(processo.stdout.splitlines()[-1]), [])
+
+@override_settings(IA_CONCORRENCIA_MAXIMA=2)
+class AgendadorTests(TestCase):
+    """Fila justa ponderada, limite de vagas entre processos, expiração e abandono"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.paciente = Paciente.objects.create(nome='Paciente Teste', data_nascimento=date(1960, 5, 17))
+        cls.usuarios = [User.objects.create_user(f'medico{i}', password='senha') for i in range(3)]
+
+    def exames(self, usuario, prioridade, quantidade=1):
+        return [
+            ExameOCT.objects.create(
+                paciente=self.paciente, usuario=usuario, imagem='exames_oct/scan.png', prioridade=prioridade
+            )
+            for _ in range(quantidade)
+        ]
+
+    def solicitar(self, usuario, prioridade='rotina', quantidade=1, ativa=True):
+        return agendador.solicitar(self.exames(usuario, prioridade, quantidade), usuario, ativa)
+
+    def ordem(self):
+        return list(
+            SolicitacaoAnalise.objects.filter(estado='aguardando')
+            .order_by('marca_final', 'id').values_list('id', flat=True)
+        )
+
+    def test_ordem_ponderada_e_justa(self):
+        a, b, c = self.usuarios
+        lote_a = self.solicitar(a, 'lote', 3)
+        [urgente_b] = self.solicitar(b, 'urgente')
+        [lote_c] = self.solicitar(c, 'lote')
+
+        # O urgente passa à frente da carga em lote, e o lote de outro usuário
+        # não espera a carga inteira de A
+        self.assertEqual(
+            self.ordem(), [lote_a[0].id, urgente_b.id, lote_a[1].id, lote_c.id, lote_a[2].id]
+        )
+
+    def test_limite_de_vagas_entre_solicitantes(self):
+        solicitacoes = [self.solicitar(usuario)[0] for usuario in self.usuarios]
+
+        concedidas = [agendador._tentar_conceder(s) for s in solicitacoes]
+
+        self.assertEqual(concedidas, [True, True, False])
+        agendador.liberar(solicitacoes[0])
+        self.assertTrue(agendador._tentar_conceder(solicitacoes[2]))
+        self.assertEqual(SolicitacaoAnalise.objects.filter(estado='executando').count(), 2)
+
+    def test_espera_esgotada_sai_da_fila(self):
+        for usuario in self.usuarios[:2]:
+            agendador.aguardar_vaga(self.solicitar(usuario)[0])
+        [terceira] = self.solicitar(self.usuarios[2])
+
+        with self.assertRaises(agendador.FilaEsgotada):
+            agendador.aguardar_vaga(terceira, espera=0)
+
+        self.assertFalse(SolicitacaoAnalise.objects.filter(id=terceira.id).exists())
+
+    def test_vaga_expirada_e_liberada(self):
+        primeiras = [self.solicitar(usuario)[0] for usuario in self.usuarios[:2]]
+        for solicitacao in primeiras:
+            agendador.aguardar_vaga(solicitacao)
+        # Processo que ocupava a vaga morreu sem liberá-la
+        SolicitacaoAnalise.objects.filter(id=primeiras[0].id).update(
+            expira_em=timezone.now() - timedelta(seconds=1)
+        )
+
+        [terceira] = self.solicitar(self.usuarios[2])
+
+        self.assertTrue(agendador._tentar_conceder(terceira))
+        self.assertFalse(SolicitacaoAnalise.objects.filter(id=primeiras[0].id).exists())
+
+    def test_solicitacao_sem_renovacao_e_descartada(self):
+        renovada, abandonada = self.solicitar(self.usuarios[0], 'lote', 2, ativa=False)
+        SolicitacaoAnalise.objects.update(renovada_em=timezone.now() - agendador.ABANDONO - timedelta(seconds=1))
+        agendador.renovar([renovada.id])
+
+        self.solicitar(self.usuarios[1])
+
+        restantes = set(SolicitacaoAnalise.objects.values_list('id', flat=True))
+        self.assertIn(renovada.id, restantes)
+        self.assertNotIn(abandonada.id, restantes)
+
+class UploadResumivelTests(MidiaTemporariaMixin, TestCase):
+    """Content-Range, partes fora de ordem, conclusão única e conferência do SHA-256"""
+
+    def setUp(self):
+        super().setUp()
+        arquivo = io.BytesIO()
+        ruido('L', (64, 48)).save(arquivo, 'PNG')
+        self.conteudo = arquivo.getvalue()
+        self.client.force_login(self.usuario)
+
+    def iniciar(self, **dados):
+        resposta = self.client.post(
+            reverse('upload_iniciar'),
+            json.dumps({'paciente': self.paciente.id, 'nome': 'scan.png', 'tamanho': len(self.conteudo), **dados}),
+            content_type='application/json',
+        )
+        self.assertEqual(resposta.status_code, 201)
+        return resposta.json()['id']
+
+    def enviar(self, upload_id, inicio, fim, content_range=None):
+        return self.client.put(
+            reverse('upload_detalhe', args=[upload_id]),
+            self.conteudo[inicio:fim],
+            content_type='application/octet-stream',
+            HTTP_CONTENT_RANGE=content_range or f'bytes {inicio}-{fim - 1}/{len(self.conteudo)}',
+        )
+
+    def concluir(self, upload_id):
+        return self.client.post(reverse('upload_concluir', args=[upload_id]))
+
+    def test_content_range(self):
+        upload_id = self.iniciar()
+        total = len(self.conteudo)
+
+        for content_range, status in (
+            ('', 400),
+            ('bytes 0-9', 400),
+            ('items 0-9/10', 400),
+            (f'bytes 0-9/{total + 1}', 416),
+            (f'bytes 9-0/{total}', 416),
+            (f'bytes 0-{total}/{total}', 416),
+        ):
+            with self.subTest(content_range=content_range):
+                self.assertEqual(self.enviar(upload_id, 0, 10, content_range or ' ').status_code, status)
+
+        self.assertEqual(self.enviar(upload_id, 0, 10).json()['recebidos'], [[0, 10]])
+
+    def test_partes_fora_de_ordem(self):
+        upload_id = self.iniciar()
+        meio = len(self.conteudo) // 2
+
+        self.assertEqual(self.enviar(upload_id, meio, len(self.conteudo)).status_code, 200)
+        # Primeira parte menor que qualquer assinatura: o cabeçalho espera o restante
+        self.assertEqual(self.enviar(upload_id, 0, 1).status_code, 200)
+        self.assertEqual(self.concluir(upload_id).status_code, 409)
+        situacao = self.enviar(upload_id, 1, meio).json()
+
+        self.assertEqual(situacao['recebidos'], [[0, len(self.conteudo)]])
+        self.assertTrue(situacao['completo'])
+        resposta = self.concluir(upload_id)
+        self.assertEqual(resposta.status_code, 201)
+        with ExameOCT.objects.get(id=resposta.json()['exame_id']).imagem.open('rb') as arquivo:
+            self.assertEqual(arquivo.read(), self.conteudo)
+
+    def test_cabecalho_invalido_recusado(self):
+        self.conteudo = b'%PDF-1.4' + os.urandom(1000)
+        upload_id = self.iniciar()
+
+        self.assertEqual(self.enviar(upload_id, 500, len(self.conteudo)).status_code, 200)
+        self.assertEqual(self.enviar(upload_id, 0, 500).status_code, 415)
+
+        self.assertEqual(UploadOCT.objects.get(id=upload_id).estado, 'rejeitado')
+        self.assertEqual(self.enviar(upload_id, 0, 500).status_code, 409)
+
+    def test_parte_apos_rejeicao_com_instancia_antiga(self):
+        upload_id = self.iniciar()
+        upload = UploadOCT.objects.get(id=upload_id)
+        upload_service.rejeitar(UploadOCT.objects.get(id=upload_id), 'Expirado')
+
+        with self.assertRaises(upload_service.UploadInvalido) as erro:
+            upload_service.receber_parte(upload, f'bytes 0-9/{len(self.conteudo)}', io.BytesIO(self.conteudo))
+
+        self.assertEqual(erro.exception.status, 409)
+
+    def test_concluir_duas_vezes(self):
+        upload_id = self.iniciar()
+        self.enviar(upload_id, 0, len(self.conteudo))
+
+        primeira = self.concluir(upload_id)
+        segunda = self.concluir(upload_id)
+
+        self.assertEqual(primeira.status_code, 201)
+        self.assertEqual(segunda.json()['exame_id'], primeira.json()['exame_id'])
+        self.assertEqual(ExameOCT.objects.filter(origem='upload').count(), 1)
+
+    def test_conclusao_em_andamento_responde_409(self):
+        upload_id = self.iniciar()
+        self.enviar(upload_id, 0, len(self.conteudo))
+        UploadOCT.objects.filter(id=upload_id).update(estado='concluindo')
+
+        self.assertEqual(self.concluir(upload_id).status_code, 409)
+        self.assertEqual(self.enviar(upload_id, 0, 10).status_code, 409)
+
+    def test_sha256_divergente(self):
+        upload_id = self.iniciar(sha256='0' * 64)
+        self.enviar(upload_id, 0, len(self.conteudo))
+
+        resposta = self.concluir(upload_id)
+
+        self.assertEqual(resposta.status_code, 422)
+        self.assertEqual(UploadOCT.objects.get(id=upload_id).estado, 'rejeitado')
+        self.assertFalse(ExameOCT.objects.filter(origem='upload').exists())
+
+    def test_sha256_da_parte(self):
+        upload_id = self.iniciar()
+
+        resposta = self.client.put(
+            reverse('upload_detalhe', args=[upload_id]), self.conteudo,
+            content_type='application/octet-stream',
+            HTTP_CONTENT_RANGE=f'bytes 0-{len(self.conteudo) - 1}/{len(self.conteudo)}',
+            HTTP_X_CHUNK_SHA256=hashlib.sha256(b'outro').hexdigest(),
+        )
+
+        self.assertEqual(resposta.status_code, 422)
+        self.assertEqual(UploadOCT.objects.get(id=upload_id).recebidos, [])
@@ -0,0 +1,281 @@
+"""
+Upload resumível de imagens OCT em partes.
+
+Protocolo (JSON):
+  POST /api/uploads/                   inicia: paciente, nome, tamanho [, prioridade, sha256]
+  PUT  /api/uploads/<id>/              parte: Content-Range: bytes início-fim/total,
+                                       X-Chunk-SHA256 opcional com o hash da parte
+  GET  /api/uploads/<id>/              intervalos já recebidos
+  POST /api/uploads/<id>/concluir/     valida, cria o ExameOCT e retorna o exame
+
+Cada parte é gravada com pwrite na posição indicada, diretamente no arquivo
+parcial dentro de MEDIA_ROOT; na conclusão ele entra no storage endereçado
+por conteúdo com um rename, sem cópia. O cabeçalho é conferido assim que os
+primeiros TAMANHO_CABECALHO bytes chegam, em uma ou mais partes e em qualquer
+ordem, então um arquivo que não é imagem é recusado antes do restante da
+transferência.
+"""
+import io
+import os
+import re
+import hashlib
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image
+from .models import ExameOCT, UploadOCT
+from .storage import PASTA_TEMPORARIA
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# Assinaturas dos formatos aceitos: (prefixo, formato do Pillow)
+ASSINATURAS = (
+    (b'\xff\xd8\xff', 'JPEG'),
+    (b'\x89PNG\r\n\x1a\n', 'PNG'),
+    (b'II*\x00', 'TIFF'),
+    (b'MM\x00*', 'TIFF'),
+    (b'BM', 'BMP'),
+)
+
+EXTENSOES = {'JPEG': '.jpg', 'PNG': '.png', 'TIFF': '.tif', 'BMP': '.bmp'}
+
+CONTENT_RANGE_RE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+
+# Início do arquivo conferido (assinatura e dimensões) assim que recebido por inteiro
+TAMANHO_CABECALHO = 64 * 1024
+
+class UploadInvalido(Exception):
+    """Requisição ou arquivo recusado; status é o código HTTP da resposta"""
+
+    def __init__(self, mensagem, status=400):
+        super().__init__(mensagem)
+        self.status = status
+
+def caminho_parcial(upload):
+    return default_storage.path(f"{PASTA_TEMPORARIA}/uploads/{upload.id}.part")
+
+def mesclar_intervalo(intervalos, inicio, fim):
+    """Acrescenta [inicio, fim) à lista ordenada de intervalos, unindo os contíguos"""
+    resultado = []
+    for atual_inicio, atual_fim in intervalos:
+        if atual_fim < inicio or atual_inicio > fim:
+            resultado.append([atual_inicio, atual_fim])
+        else:
+            inicio, fim = min(inicio, atual_inicio), max(fim, atual_fim)
+    resultado.append([inicio, fim])
+    return sorted(resultado)
+
+def identificar_formato(cabecalho):
+    """Formato pela assinatura (magic bytes) ou None"""
+    for prefixo, formato in ASSINATURAS:
+        if cabecalho.startswith(prefixo):
+            return formato
+    return None
+
+def iniciar(usuario, paciente, nome, tamanho, prioridade='rotina', sha256=''):
+    if tamanho <= 0:
+        raise UploadInvalido('Tamanho inválido')
+    if tamanho > settings.UPLOAD_TAMANHO_MAXIMO:
+        raise UploadInvalido(
+            f'Arquivo maior que o limite de {settings.UPLOAD_TAMANHO_MAXIMO // (1024 * 1024)} MB', status=413
+        )
+    if prioridade not in dict(ExameOCT.PRIORIDADE_CHOICES):
+        raise UploadInvalido('Prioridade inválida')
+    if sha256 and not re.fullmatch(r'[0-9a-f]{64}', sha256):
+        raise UploadInvalido('SHA-256 inválido')
+
+    upload = UploadOCT.objects.create(
+        usuario=usuario,
+        paciente=paciente,
+        prioridade=prioridade,
+        nome_original=os.path.basename(nome)[:255],
+        tamanho=tamanho,
+        sha256=sha256,
+    )
+    caminho = caminho_parcial(upload)
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    open(caminho, 'wb').close()
+    return upload
+
+def _ler_parte(fluxo, tamanho):
+    """Lê exatamente `tamanho` bytes do corpo da requisição"""
+    partes = []
+    restante = tamanho
+    while restante:
+        bloco = fluxo.read(min(restante, 64 * 1024))
+        if not bloco:
+            raise UploadInvalido('Corpo menor que o indicado em Content-Range')
+        partes.append(bloco)
+        restante -= len(bloco)
+    return b''.join(partes)
+
+def _validar_cabecalho(dados):
+    formato = identificar_formato(dados)
+    if formato is None:
+        raise UploadInvalido('O arquivo não é uma imagem JPEG, PNG, TIFF ou BMP', status=415)
+
+    # Com o cabeçalho completo nesses bytes, confere também dimensões e limite de pixels
+    try:
+        with Image.open(io.BytesIO(dados)) as imagem:
+            largura, altura = imagem.size
+    except Image.DecompressionBombError as e:
+        raise UploadInvalido(str(e), status=415)
+    except Exception:
+        # Cabeçalho além desses bytes (ex.: TIFF com IFD no fim): verificado na conclusão
+        return
+    if not largura or not altura:
+        raise UploadInvalido('Imagem sem dimensões válidas', status=415)
+
+def receber_parte(upload, content_range, fluxo, sha256_parte=None):
+    """Grava uma parte do corpo da requisição e retorna o upload atualizado"""
+    if upload.estado != 'recebendo':
+        raise UploadInvalido(f'Upload {upload.get_estado_display().lower()}', status=409)
+
+    match = CONTENT_RANGE_RE.match(content_range or '')
+    if not match:
+        raise UploadInvalido('Cabeçalho Content-Range ausente ou inválido (bytes início-fim/total)')
+    inicio, ultimo, total = map(int, match.groups())
+    if total != upload.tamanho or inicio > ultimo or ultimo >= total:
+        raise UploadInvalido('Content-Range fora do arquivo', status=416)
+    if ultimo - inicio + 1 > settings.UPLOAD_TAMANHO_CHUNK:
+        raise UploadInvalido(
+            f'Parte maior que {settings.UPLOAD_TAMANHO_CHUNK // (1024 * 1024)} MB', status=413
+        )
+
+    dados = _ler_parte(fluxo, ultimo - inicio + 1)
+    if sha256_parte and hashlib.sha256(dados).hexdigest() != sha256_parte.lower():
+        raise UploadInvalido('SHA-256 da parte não confere', status=422)
+
+    cabecalho = min(TAMANHO_CABECALHO, upload.tamanho)
+    with transaction.atomic():
+        upload = UploadOCT.objects.select_for_update().get(id=upload.id)
+        # O estado lido antes da trava pode ter mudado (conclusão, rejeição, expiração)
+        if upload.estado != 'recebendo':
+            raise UploadInvalido(f'Upload {upload.get_estado_display().lower()}', status=409)
+        try:
+            fd = os.open(caminho_parcial(upload), os.O_WRONLY)
+        except FileNotFoundError:
+            raise UploadInvalido('Arquivo parcial do upload não existe mais', status=409)
+        try:
+            os.pwrite(fd, dados, inicio)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        upload.recebidos = mesclar_intervalo(upload.recebidos, inicio, ultimo + 1)
+        upload.save(update_fields=['recebidos', 'atualizado_em'])
+
+    # Partes podem chegar fora de ordem e ser pequenas: o cabeçalho é conferido
+    # no arquivo quando a parte que o completa (ou o altera) é gravada
+    if inicio < cabecalho and upload.recebidos[0][0] == 0 and upload.recebidos[0][1] >= cabecalho:
+        try:
+            with open(caminho_parcial(upload), 'rb') as arquivo:
+                dados = arquivo.read(cabecalho)
+        except FileNotFoundError:
+            raise UploadInvalido('Arquivo parcial do upload não existe mais', status=409)
+        try:
+            _validar_cabecalho(dados)
+        except UploadInvalido as e:
+            rejeitar(upload, str(e))
+            raise
+    return upload
+
+def rejeitar(upload, motivo):
+    logger.warning(f"Upload {upload.id} ({upload.nome_original}) rejeitado: {motivo}")
+    upload.estado = 'rejeitado'
+    upload.erro = motivo
+    upload.save(update_fields=['estado', 'erro', 'atualizado_em'])
+    try:
+        os.unlink(caminho_parcial(upload))
+    except FileNotFoundError:
+        pass
+
+def _sha256_arquivo(caminho):
+    sha256 = hashlib.sha256()
+    with open(caminho, 'rb') as arquivo:
+        for bloco in iter(lambda: arquivo.read(1024 * 1024), b''):
+            sha256.update(bloco)
+    return sha256.hexdigest()
+
+def concluir(upload):
+    """Valida o arquivo completo, move-o para o storage e cria o ExameOCT"""
+    # Só uma conclusão por upload: a linha bloqueada passa a 'concluindo' e uma
+    # segunda requisição simultânea recebe 409 (ou o exame, se já concluído)
+    with transaction.atomic():
+        upload = UploadOCT.objects.select_for_update().get(pk=upload.pk)
+        if upload.estado == 'concluido':
+            return upload.exame
+        if upload.estado != 'recebendo':
+            raise UploadInvalido(f'Upload {upload.get_estado_display().lower()}', status=409)
+        if not upload.completo:
+            raise UploadInvalido('Ainda há partes não recebidas', status=409)
+        upload.estado = 'concluindo'
+        upload.save(update_fields=['estado', 'atualizado_em'])
+
+    caminho = caminho_parcial(upload)
+    try:
+        with Image.open(caminho) as imagem:
+            formato = imagem.format
+            imagem.verify()
+    except Exception as e:
+        rejeitar(upload, f'Imagem inválida: {e}')
+        raise UploadInvalido('Imagem inválida ou corrompida', status=415)
+    if formato not in EXTENSOES:
+        rejeitar(upload, f'Formato não aceito: {formato}')
+        raise UploadInvalido('Formato de imagem não aceito', status=415)
+
+    # Antes de mover para o storage: um arquivo divergente não vira blob
+    if upload.sha256 and _sha256_arquivo(caminho) != upload.sha256:
+        rejeitar(upload, 'SHA-256 do arquivo não confere')
+        raise UploadInvalido('SHA-256 do arquivo não confere', status=422)
+
+    exame = ExameOCT(
+        paciente=upload.paciente, usuario=upload.usuario, prioridade=upload.prioridade, origem='upload'
+    )
+    campo_imagem = ExameOCT._meta.get_field('imagem')
+    try:
+        nome = default_storage.importar_arquivo(
+            caminho, campo_imagem.generate_filename(exame, f"upload{EXTENSOES[formato]}")
+        )
+        with transaction.atomic():
+            exame.imagem.name = nome
+            exame.save()
+            upload.exame = exame
+            upload.estado = 'concluido'
+            upload.save(update_fields=['exame', 'estado', 'atualizado_em'])
+    except Exception:
+        # Falha inesperada (disco, banco): com o arquivo ainda no lugar, o cliente pode concluir de novo
+        if os.path.exists(caminho):
+            UploadOCT.objects.filter(pk=upload.pk).update(estado='recebendo')
+        raise
+
+    metrics.UPLOAD_BYTES.observe(upload.tamanho)
+    return exame
+
+def expirar(dias=None):
+    """
+    Remove uploads não concluídos sem atividade há `dias` e seus arquivos
+    parciais (inclusive conclusões interrompidas pela queda do processo)
+    """
+    limite = timezone.now() - timedelta(days=dias or settings.UPLOAD_EXPIRACAO_DIAS)
+    antigos = UploadOCT.objects.filter(estado__in=['recebendo', 'concluindo'], atualizado_em__lt=limite)
+    total = 0
+    for upload in antigos.iterator():
+        rejeitar(upload, 'Expirado')
+        total += 1
+    return total
+
+def situacao(upload):
+    return {
+        'id': str(upload.id),
+        'estado': upload.estado,
+        'tamanho': upload.tamanho,
+        'recebidos': upload.recebidos,
+        'bytes_recebidos': upload.bytes_recebidos,
+        'completo': upload.completo,
+        'tamanho_chunk': settings.UPLOAD_TAMANHO_CHUNK,
+        'erro': upload.erro,
+    }
@@ -11,4 +11,12 @@ urlpatterns = [
     path('exames/<int:exame_id>/analise-ia/', views.exame_analyze_ai, name='exame_analyze_ai'),
     path('api/check-gemini-key/', views.check_gemini_key, name='check_gemini_key'),
     path('exames/<int:exame_id>/gerar-laudo-pdf/', views.gerar_laudo_pdf_view, name='gerar_laudo_pdf'),
+    path('exames/<int:exame_id>/imagem/', views.exame_imagem, name='exame_imagem'),
+    path('exames/<int:exame_id>/laudo/', views.exame_laudo, name='exame_laudo'),
+    path('metrics', views.metrics_view, name='metrics'),
+    path('exportar/exames/', views.exportar_exames, name='exportar_exames'),
+    path('api/fila-analises/', views.fila_analises, name='fila_analises'),
+    path('api/uploads/', views.upload_iniciar, name='upload_iniciar'),
+    path('api/uploads/<uuid:upload_id>/', views.upload_detalhe, name='upload_detalhe'),
+    path('api/uploads/<uuid:upload_id>/concluir/', views.upload_concluir, name='upload_concluir'),
 ]
\ No newline at end of file
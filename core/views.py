@@ -1,30 +1,40 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import login
 from django.contrib import messages
-from django.http import HttpResponse, JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
 import json
 import os
+import hmac
 from .models import Paciente, ExameOCT, ProvedorIA, PromptIA
 from .forms import CustomUserCreationForm, PacienteForm, ExameOCTForm
-from .ai_service import analyze_oct_image
-from .pdf_service import gerar_laudo_pdf
-from django.http import FileResponse
+from .analise import executar_analise
 from django.core.files.base import ContentFile
+from django.core.paginator import Paginator
+from django.conf import settings
+from django.utils.functional import SimpleLazyObject
+from . import cache_service
+from .media_service import servir_arquivo
+from . import metrics
+from .resiliencia import obter_disjuntor
+from . import exportacao
+from . import agendador
+from . import upload_service
+from .models import UploadOCT
 
 @login_required
 def home(request):
     """Página inicial do sistema"""
-    exames_recentes = ExameOCT.objects.filter(usuario=request.user).order_by('-data_exame')[:5]
-    pacientes_count = Paciente.objects.count()
-    exames_count = ExameOCT.objects.count()
+    # Queryset preguiçoso: só é avaliado se o fragmento não estiver no cache
+    exames_recentes = ExameOCT.objects.filter(usuario=request.user).select_related('paciente').order_by('-data_exame')[:5]
 
     context = {
         'exames_recentes': exames_recentes,
-        'pacientes_count': pacientes_count,
-        'exames_count': exames_count,
+        'cache_timeout': settings.OCT_CACHE_TIMEOUT,
+        **cache_service.obter_contagens(),
     }
     return render(request, 'core/home.html', context)
 
@@ -44,8 +54,21 @@ def register(request):
 @login_required
 def paciente_list(request):
     """Lista de pacientes"""
-    pacientes = Paciente.objects.all().order_by('nome')
-    return render(request, 'core/paciente_list.html', {'pacientes': pacientes})
+    try:
+        pagina = max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        pagina = 1
+
+    paginator = Paginator(Paciente.objects.all().order_by('nome', 'id'), settings.PACIENTES_POR_PAGINA)
+
+    context = {
+        # Página avaliada apenas quando o fragmento não estiver no cache
+        'pacientes': SimpleLazyObject(lambda: paginator.get_page(pagina)),
+        'pagina': pagina,
+        'versao': cache_service.versao_pacientes(),
+        'cache_timeout': settings.OCT_CACHE_TIMEOUT,
+    }
+    return render(request, 'core/paciente_list.html', context)
 
 @login_required
 def paciente_create(request):
@@ -69,6 +92,7 @@ def exame_create(request):
             exame = form.save(commit=False)
             exame.usuario = request.user
             exame.save()
+            metrics.UPLOAD_BYTES.observe(exame.imagem.size)
             messages.success(request, 'Exame OCT enviado com sucesso!')
             return redirect('exame_analyze', exame.id)
     else:
@@ -78,7 +102,7 @@ def exame_create(request):
 @login_required
 def exame_analyze(request, exame_id):
     """Página de análise do exame"""
-    exame = get_object_or_404(ExameOCT, id=exame_id)
+    exame = cache_service.obter_exame(exame_id)
     return render(request, 'core/exame_analyze.html', {'exame': exame})
 
 @login_required
@@ -97,59 +121,36 @@ def exame_analyze_ai(request, exame_id):
     if exame.diagnostico_ia:
         return JsonResponse({'error': 'Este exame já foi analisado'}, status=400)
 
-    try:
-        # Atualizar status para "analisando"
-        exame.status = 'analisando'
-        exame.save()
+    if exame.status == 'analisando':
+        return JsonResponse({'error': 'Este exame já está em análise'}, status=409)
 
-        # Obter caminho da imagem
-        image_path = exame.imagem.path
+    resultado = executar_analise(exame, request.user, espera=settings.AGENDAMENTO_ESPERA_MAXIMA)
 
-        # Verificar se o arquivo existe
-        if not os.path.exists(image_path):
-            exame.status = 'erro'
-            exame.save()
-            return JsonResponse({'error': 'Arquivo de imagem não encontrado'}, status=404)
-
-        # Buscar provedor Gemini ativo para salvar no exame
-        provedor = ProvedorIA.objects.filter(
-            nome__icontains="gemini",
-            ativo=True
-        ).first()
-
-        # Analisar com IA
-        resultado = analyze_oct_image(image_path)
-
-        if resultado['success']:
-            # Salvar resultado
-            exame.diagnostico_ia = resultado['diagnostico']
-            exame.data_diagnostico = timezone.now()
-            exame.status = 'concluido'
-            exame.provedor_ia = provedor
-            exame.save()
+    if resultado['success']:
+        return JsonResponse({
+            'success': True,
+            'diagnostico': resultado['diagnostico'],
+            'data_diagnostico': exame.data_diagnostico.strftime('%d/%m/%Y %H:%M')
+        })
 
-            return JsonResponse({
-                'success': True,
-                'diagnostico': resultado['diagnostico'],
-                'data_diagnostico': exame.data_diagnostico.strftime('%d/%m/%Y %H:%M')
-            })
-        else:
-            # Erro na análise
-            exame.status = 'erro'
-            exame.save()
-            return JsonResponse({
-                'success': False,
-                'error': resultado['error'] or 'Erro desconhecido na análise'
-            })
+    if resultado.get('arquivo_ausente'):
+        return JsonResponse({'error': resultado['error']}, status=404)
 
-    except Exception as e:
-        # Erro inesperado
-        exame.status = 'erro'
-        exame.save()
-        return JsonResponse({
+    if resultado.get('em_andamento'):
+        return JsonResponse({'error': resultado['error']}, status=409)
+
+    if resultado.get('retentavel'):
+        response = JsonResponse({
             'success': False,
-            'error': f'Erro interno: {str(e)}'
-        })
+            'error': resultado['error'] or 'Provedor de IA temporariamente indisponível'
+        }, status=503)
+        response['Retry-After'] = str(settings.IA_CIRCUITO_RECUPERACAO)
+        return response
+
+    return JsonResponse({
+        'success': False,
+        'error': resultado['error'] or 'Erro desconhecido na análise'
+    })
 
 @login_required
 def gerar_laudo_pdf_view(request, exame_id):
@@ -164,29 +165,36 @@ def gerar_laudo_pdf_view(request, exame_id):
     if not exame.diagnostico_ia:
         return JsonResponse({'error': 'Exame ainda não foi analisado'}, status=400)
 
+    # Laudo já gerado para o diagnóstico atual: reaproveitar em vez de gerar outro
+    if (
+        exame.laudo_pdf
+        and exame.data_laudo
+        and exame.data_diagnostico
+        and exame.data_laudo >= exame.data_diagnostico
+        and exame.laudo_pdf.storage.exists(exame.laudo_pdf.name)
+    ):
+        filename = f"laudo_{exame.paciente_id}_{timezone.localtime(exame.data_laudo).strftime('%Y%m%d_%H%M%S')}.pdf"
+        return servir_arquivo(request, exame.laudo_pdf, as_attachment=True, filename=filename)
+
+    # ReportLab é carregado só quando algum laudo é gerado
+    from .pdf_service import gerar_laudo_pdf
+
     try:
         # Gerar PDF
         pdf_buffer = gerar_laudo_pdf(exame)
 
         # Salvar PDF no modelo
-        filename = f"laudo_{exame.paciente.id}_{timezone.now().strftime('%Y%m%d_%H%M%S')}.pdf"
+        exame.data_laudo = timezone.now()
+        filename = f"laudo_{exame.paciente_id}_{timezone.localtime(exame.data_laudo).strftime('%Y%m%d_%H%M%S')}.pdf"
         exame.laudo_pdf.save(
             filename,
             ContentFile(pdf_buffer.getvalue()),
-            save=True
+            save=False
         )
-        exame.data_laudo = timezone.now()
-        exame.save()
-
-        # Retornar o PDF
-        pdf_buffer.seek(0)
-        response = FileResponse(
-            pdf_buffer,
-            as_attachment=True,
-            filename=filename,
-            content_type='application/pdf'
-        )
-        return response
+        exame.save(update_fields=['laudo_pdf', 'data_laudo'])
+
+        # Retornar o PDF salvo (delegado ao proxy quando configurado)
+        return servir_arquivo(request, exame.laudo_pdf, as_attachment=True, filename=filename)
 
     except Exception as e:
         return JsonResponse({'error': f'Erro ao gerar PDF: {str(e)}'}, status=500)
@@ -202,5 +210,163 @@ def check_gemini_key(request):
     ).first()
 
     return JsonResponse({
-        'key_configured': bool(provedor and provedor.api_key)
-    })
\ No newline at end of file
+        'key_configured': bool(provedor and provedor.api_key),
+        'circuito': obter_disjuntor(provedor).estado if provedor else None
+    })
+
+def pode_acessar_exame(usuario, exame):
+    """
+    O responsável pelo exame ou a equipe (staff/superusuário): exames da
+    ingestão de pastas pertencem à conta de serviço do watch_oct.
+    """
+    return exame.usuario_id == usuario.id or usuario.is_staff or usuario.is_superuser
+
+@login_required
+def exame_imagem(request, exame_id):
+    """Entrega a imagem OCT de um exame ao usuário responsável ou à equipe"""
+    exame = cache_service.obter_exame(exame_id)
+
+    if not pode_acessar_exame(request.user, exame):
+        return JsonResponse({'error': 'Sem permissão para acessar este exame'}, status=403)
+
+    if not exame.imagem:
+        return JsonResponse({'error': 'Exame sem imagem'}, status=404)
+
+    return servir_arquivo(request, exame.imagem)
+
+@login_required
+def exame_laudo(request, exame_id):
+    """Entrega o laudo PDF de um exame ao usuário responsável ou à equipe"""
+    exame = cache_service.obter_exame(exame_id)
+
+    if not pode_acessar_exame(request.user, exame):
+        return JsonResponse({'error': 'Sem permissão para acessar este exame'}, status=403)
+
+    if not exame.laudo_pdf:
+        return JsonResponse({'error': 'Exame ainda não possui laudo'}, status=404)
+
+    return servir_arquivo(request, exame.laudo_pdf)
+
+def metrics_view(request):
+    """
+    Exposição das métricas no formato do Prometheus. Com METRICS_TOKEN o
+    coletor se autentica pelo cabeçalho Authorization; sem ele, só usuários
+    staff logados têm acesso.
+    """
+    token = settings.METRICS_TOKEN
+    if token:
+        # compare_digest só aceita str ASCII; o servidor entrega o cabeçalho decodificado em latin-1
+        recebido = request.headers.get('Authorization', '').encode('latin-1', 'replace')
+        if not hmac.compare_digest(recebido, f'Bearer {token}'.encode()):
+            return HttpResponse('Não autorizado', status=401)
+    elif not (request.user.is_authenticated and request.user.is_staff):
+        return HttpResponse('Não autorizado', status=401)
+
+    conteudo, content_type = metrics.exportar()
+    return HttpResponse(conteudo, content_type=content_type)
+
+@login_required
+def exportar_exames(request):
+    """Exportação em streaming de exames e diagnósticos (CSV ou JSON Lines)"""
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'Sem permissão para exportar exames'}, status=403)
+
+    formato = request.GET.get('formato', 'csv')
+    if formato not in exportacao.FORMATOS:
+        return JsonResponse({'error': f'Formato inválido. Use: {", ".join(exportacao.FORMATOS)}'}, status=400)
+
+    try:
+        colunas, filtros = exportacao.interpretar_parametros(request.GET)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    gerar, content_type, extensao = exportacao.FORMATOS[formato]
+    linhas = exportacao.linhas_exportacao(colunas, filtros, pseudonimizar=request.GET.get('pseudonimizar') == '1')
+
+    filename = f"exames_{timezone.now().strftime('%Y%m%d_%H%M%S')}.{extensao}"
+    response = StreamingHttpResponse(gerar(colunas, linhas), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+@login_required
+def fila_analises(request):
+    """Situação da fila de análises de IA por prioridade"""
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'Sem permissão para consultar a fila'}, status=403)
+
+    return JsonResponse(agendador.situacao())
+
+@login_required
+def upload_iniciar(request):
+    """Inicia um upload resumível de imagem OCT"""
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Método não permitido'}, status=405)
+
+    try:
+        dados = json.loads(request.body or b'{}')
+        tamanho = int(dados.get('tamanho') or 0)
+    except (ValueError, TypeError):
+        return JsonResponse({'error': 'Corpo JSON inválido'}, status=400)
+
+    paciente = Paciente.objects.filter(id=dados.get('paciente')).first()
+    if paciente is None:
+        return JsonResponse({'error': 'Paciente não encontrado'}, status=400)
+
+    try:
+        upload = upload_service.iniciar(
+            request.user,
+            paciente,
+            str(dados.get('nome') or 'imagem'),
+            tamanho,
+            prioridade=dados.get('prioridade') or 'rotina',
+            sha256=str(dados.get('sha256') or '').lower(),
+        )
+    except upload_service.UploadInvalido as e:
+        return JsonResponse({'error': str(e)}, status=e.status)
+
+    return JsonResponse(upload_service.situacao(upload), status=201)
+
+@login_required
+def upload_detalhe(request, upload_id):
+    """GET: intervalos recebidos; PUT: grava uma parte (Content-Range)"""
+    upload = get_object_or_404(UploadOCT, id=upload_id)
+
+    if upload.usuario_id != request.user.id:
+        return JsonResponse({'error': 'Sem permissão para acessar este upload'}, status=403)
+
+    if request.method == 'PUT':
+        try:
+            upload = upload_service.receber_parte(
+                upload,
+                request.headers.get('Content-Range'),
+                request,
+                request.headers.get('X-Chunk-SHA256'),
+            )
+        except upload_service.UploadInvalido as e:
+            return JsonResponse({'error': str(e)}, status=e.status)
+    elif request.method != 'GET':
+        return JsonResponse({'error': 'Método não permitido'}, status=405)
+
+    return JsonResponse(upload_service.situacao(upload))
+
+@login_required
+def upload_concluir(request, upload_id):
+    """Conclui o upload e cria o exame OCT"""
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Método não permitido'}, status=405)
+
+    upload = get_object_or_404(UploadOCT, id=upload_id)
+
+    if upload.usuario_id != request.user.id:
+        return JsonResponse({'error': 'Sem permissão para acessar este upload'}, status=403)
+
+    try:
+        exame = upload_service.concluir(upload)
+    except upload_service.UploadInvalido as e:
+        return JsonResponse({'error': str(e)}, status=e.status)
+
+    return JsonResponse({
+        'success': True,
+        'exame_id': exame.id,
+        'url': reverse('exame_analyze', args=[exame.id]),
+    }, status=201)
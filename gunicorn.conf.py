@@ -0,0 +1,34 @@
+"""
+Configuração do gunicorn (pip install -e .[producao]):
+
+    gunicorn oct_system.wsgi -c gunicorn.conf.py
+"""
+import os
+import threading
+from decouple import config
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+# Análise síncrona: espera por vaga na fila (AGENDAMENTO_ESPERA_MAXIMA) mais o
+# prazo da análise (IA_PRAZO_SEGUNDOS) mais margem; um timeout menor mata o
+# worker no meio da análise
+timeout = int(os.environ.get(
+    'GUNICORN_TIMEOUT',
+    config('AGENDAMENTO_ESPERA_MAXIMA', default=60, cast=int) + config('IA_PRAZO_SEGUNDOS', default=120, cast=int) + 30,
+))
+
+
+def post_worker_init(worker):
+    """Após o fork e o carregamento da aplicação: pré-carrega os SDKs sem atrasar o worker"""
+    from django.conf import settings
+
+    if settings.PREAQUECER_SDKS:
+        from core.inicializacao import aquecer
+        threading.Thread(target=aquecer, name='aquecer-sdks', daemon=True).start()
+
+
+def child_exit(server, worker):
+    """Remove os arquivos de métricas do worker encerrado (PROMETHEUS_MULTIPROC_DIR)"""
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 from pathlib import Path
+from decouple import config
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -36,12 +37,15 @@ INSTALLED_APPS = [
     'django.contrib.contenttypes',
     'django.contrib.sessions',
     'django.contrib.messages',
+    'whitenoise.runserver_nostatic',
     'django.contrib.staticfiles',
     'core',
 ]
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'core.middleware.MetricasMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -81,6 +85,56 @@ DATABASES = {
 }
 
 
+# Cache
+# A invalidação é feita por signals no processo que grava; para que os demais
+# workers do gunicorn e o watch_oct vejam a invalidação, o cache precisa ser
+# compartilhado. Padrão: arquivos em disco (um host). Com mais de um host, use
+# CACHE_BACKEND=redis ou memcached (com CACHE_LOCATION). locmem só serve para
+# um único processo (desenvolvimento com runserver).
+
+CACHE_BACKEND = config('CACHE_BACKEND', default='file')
+
+CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'redis': 'django.core.cache.backends.redis.RedisCache',
+    'memcached': 'django.core.cache.backends.memcached.PyMemcacheCache',
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKENDS[CACHE_BACKEND],
+        'LOCATION': config(
+            'CACHE_LOCATION',
+            default=str(BASE_DIR / 'cache') if CACHE_BACKEND == 'file' else 'oct-system',
+        ),
+        'TIMEOUT': 300,
+    }
+}
+
+if CACHE_BACKEND in ('locmem', 'file'):
+    CACHES['default']['OPTIONS'] = {'MAX_ENTRIES': 5000}
+
+# Imagens já preparadas para o laudo PDF (core.pdf_service): até
+# LAUDO_ORCAMENTO_IMAGENS bytes por exame, então ficam sempre em disco e
+# com número limitado de entradas, nunca na memória dos workers.
+CACHES['laudo_imagens'] = {
+    'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+    'LOCATION': config('LAUDO_IMAGENS_CACHE_DIR', default=str(BASE_DIR / 'cache' / 'laudo_imagens')),
+    'TIMEOUT': 7 * 24 * 3600,
+    'OPTIONS': {'MAX_ENTRIES': config('LAUDO_IMAGENS_CACHE_ENTRADAS', default=1000, cast=int)},
+}
+
+# Tempo de vida (segundos) dos fragmentos e consultas cacheados pelas views
+OCT_CACHE_TIMEOUT = config('OCT_CACHE_TIMEOUT', default=300, cast=int)
+
+# Itens por página na lista de pacientes
+PACIENTES_POR_PAGINA = 50
+
+# Sessões no cache com persistência no banco: leituras sem ida ao banco
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -117,11 +171,38 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 STATICFILES_DIRS = [BASE_DIR / 'static']
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+# collectstatic gera nomes com hash de conteúdo (manifest) e variantes .gz/.br;
+# o WhiteNoise escolhe a variante conforme Accept-Encoding e envia os arquivos
+# com hash com Cache-Control imutável de longo prazo. O manifest só existe após
+# o collectstatic, então em desenvolvimento e nos testes os estáticos são
+# servidos sem hash (STATICFILES_MANIFEST=True em produção).
+STATICFILES_MANIFEST = config('STATICFILES_MANIFEST', default=not DEBUG, cast=bool)
+
+STORAGES = {
+    # Arquivos de mídia endereçados pelo SHA-256 do conteúdo (ver core/storage.py)
+    'default': {
+        'BACKEND': 'core.storage.ArmazenamentoConteudo',
+    },
+    'staticfiles': {
+        'BACKEND': (
+            'whitenoise.storage.CompressedManifestStaticFilesStorage'
+            if STATICFILES_MANIFEST else 'django.contrib.staticfiles.storage.StaticFilesStorage'
+        ),
+    },
+}
 
 # Media files (uploads)
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Entrega de mídia protegida (core.media_service)
+# '' serve pelo Django com ETag/Range; 'nginx' usa X-Accel-Redirect; 'sendfile' usa X-Sendfile.
+# No nginx, MEDIA_ACCEL_PREFIX deve ser uma location `internal` apontando para MEDIA_ROOT.
+MEDIA_ACCEL_MODE = config('MEDIA_ACCEL_MODE', default='')
+MEDIA_ACCEL_PREFIX = '/protected-media/'
+
 # Login/Logout URLs
 LOGIN_URL = '/accounts/login/'
 LOGIN_REDIRECT_URL = '/'
@@ -145,6 +226,82 @@ CSRF_TRUSTED_ORIGINS = [
 SECURE_CROSS_ORIGIN_OPENER_POLICY = None
 SECURE_REFERRER_POLICY = "same-origin"
 
+# Métricas (/metrics). Se definido, o coletor deve enviar "Authorization: Bearer <token>";
+# sem token, /metrics só responde a usuários staff logados.
+# Com vários workers, exporte PROMETHEUS_MULTIPROC_DIR (ver core/metrics.py).
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+
+# Telemetria das chamadas de IA: gravação em lote fora do caminho da requisição
+TELEMETRIA_LOTE = 50
+TELEMETRIA_INTERVALO = 5  # segundos
+# Período máximo do relatório de chamadas no admin (um grupo por dia e provedor)
+TELEMETRIA_RELATORIO_DIAS_MAX = config('TELEMETRIA_RELATORIO_DIAS_MAX', default=90, cast=int)
+
+# Resiliência das chamadas de IA (core/resiliencia.py)
+IA_PRAZO_SEGUNDOS = config('IA_PRAZO_SEGUNDOS', default=120, cast=int)  # prazo total por análise
+IA_MAX_TENTATIVAS = 3
+IA_BACKOFF_BASE = 1.0  # segundos; dobra a cada tentativa, com jitter
+IA_BACKOFF_MAXIMO = 10.0
+IA_CIRCUITO_FALHAS = 5  # falhas transitórias seguidas para abrir o circuito
+IA_CIRCUITO_RECUPERACAO = 30  # segundos com o circuito aberto antes de testar o provedor
+
+# Importação em massa de pacientes (manage.py import_pacientes / admin)
+IMPORTACAO_TAMANHO_LOTE = 1000
+IMPORTACAO_REJEITADOS_DIR = BASE_DIR / 'importacoes'
+
+# Ingestão de pastas dos aparelhos OCT (manage.py watch_oct)
+INGESTAO_PADRAO_PRONTUARIO = r'^(?P<prontuario>[^_\s]+)_'  # ex.: 12345_OD_20250917.jpg
+INGESTAO_ESTABILIDADE = 10  # segundos sem alteração para considerar o arquivo completo
+INGESTAO_PASTA_NAO_IDENTIFICADOS = 'nao_identificados'
+
+# Threads para análises disparadas fora de requisições
+ANALISE_WORKERS = 2
+
+# Exportação de exames (manage.py exportar_exames / /exportar/exames/)
+EXPORTACAO_CHUNK = 2000
+# Chave do HMAC usado nos pseudônimos de pacientes; mantenha-a fixa para pseudônimos estáveis
+EXPORTACAO_CHAVE_PSEUDONIMO = config('EXPORTACAO_CHAVE_PSEUDONIMO', default=SECRET_KEY)
+
+# Agendamento das análises de IA (core.agendador)
+# Fila justa ponderada por (prioridade, usuário), com no máximo
+# IA_CONCORRENCIA_MAXIMA análises simultâneas somando todos os processos;
+# ajuste à cota de requisições simultâneas do provedor.
+IA_CONCORRENCIA_MAXIMA = config('IA_CONCORRENCIA_MAXIMA', default=4, cast=int)
+AGENDAMENTO_PESOS = {'urgente': 8, 'rotina': 4, 'lote': 1}
+# Espera máxima por uma vaga numa análise pedida pela interface (segundos);
+# o timeout do gunicorn (gunicorn.conf.py) soma esta espera ao IA_PRAZO_SEGUNDOS
+AGENDAMENTO_ESPERA_MAXIMA = config('AGENDAMENTO_ESPERA_MAXIMA', default=60, cast=int)
+AGENDAMENTO_INTERVALO = 0.25
+
+# Upload resumível em partes (core.upload_service)
+UPLOAD_TAMANHO_CHUNK = 8 * 1024 * 1024
+UPLOAD_TAMANHO_MAXIMO = config('UPLOAD_TAMANHO_MAXIMO', default=2 * 1024 * 1024 * 1024, cast=int)
+# Uploads não concluídos sem atividade são removidos pelo gc_midia
+UPLOAD_EXPIRACAO_DIAS = 7
+
+# Arquivamento em camada fria (core.arquivo_frio)
+# O comando arquivar_midia comprime para ARQUIVO_FRIO_DIR os scans e laudos de
+# exames com mais de ARQUIVO_IDADE_DIAS e apaga a cópia do disco de mídia; o
+# acesso pelo campo restaura o arquivo, que fica no disco por ARQUIVO_CACHE_DIAS.
+ARQUIVO_FRIO_DIR = config('ARQUIVO_FRIO_DIR', default=str(BASE_DIR / 'arquivo_frio'))
+ARQUIVO_IDADE_DIAS = config('ARQUIVO_IDADE_DIAS', default=365, cast=int)
+ARQUIVO_CACHE_DIAS = config('ARQUIVO_CACHE_DIAS', default=30, cast=int)
+
+# Imagens do laudo PDF (core.pdf_service)
+# A imagem do exame (e, em pilhas TIFF, alguns cortes-chave) é reduzida para a
+# resolução de impressão, convertida para tons de cinza e comprimida em JPEG
+# até que todas as imagens do laudo caibam em LAUDO_ORCAMENTO_IMAGENS bytes.
+LAUDO_IMAGEM_DPI = config('LAUDO_IMAGEM_DPI', default=150, cast=int)
+LAUDO_ORCAMENTO_IMAGENS = config('LAUDO_ORCAMENTO_IMAGENS', default=400 * 1024, cast=int)
+LAUDO_CORTES_CHAVE = config('LAUDO_CORTES_CHAVE', default=3, cast=int)
+
+# Inicialização (core.inicializacao)
+# PREAQUECER_SDKS: importa o SDK do Gemini e o ReportLab logo após o fork de cada
+# worker do gunicorn, em segundo plano, para que a primeira análise não pague por isso.
+PREAQUECER_SDKS = config('PREAQUECER_SDKS', default=False, cast=bool)
+# Orçamento do comando benchmark_inicializacao (processo novo até a primeira resposta)
+INICIALIZACAO_ORCAMENTO_MS = config('INICIALIZACAO_ORCAMENTO_MS', default=1500, cast=int)
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -0,0 +1,170 @@
+/*
+ * Upload resumível de imagens OCT (core/upload_service.py).
+ *
+ * O arquivo é enviado em partes com Content-Range; se a conexão cair, um novo
+ * envio do mesmo arquivo consulta os intervalos já recebidos e continua de
+ * onde parou. Sem suporte a fetch/Blob.slice, o formulário é enviado normalmente.
+ */
+(function () {
+    'use strict';
+
+    const form = document.querySelector('form[data-upload-resumivel]');
+    if (!form || !window.fetch || !window.Blob || !Blob.prototype.slice) {
+        return;
+    }
+
+    const urlIniciar = form.dataset.uploadResumivel;
+    const campoArquivo = form.querySelector('input[type=file]');
+    const progresso = document.getElementById('upload-progresso');
+    const barra = progresso && progresso.querySelector('.progress-bar');
+    const mensagem = document.getElementById('upload-mensagem');
+    const csrf = form.querySelector('[name=csrfmiddlewaretoken]').value;
+    const TENTATIVAS = 5;
+
+    function chaveLocal(arquivo) {
+        return `upload-oct:${arquivo.name}:${arquivo.size}:${arquivo.lastModified}`;
+    }
+
+    function mostrar(texto, classe) {
+        if (mensagem) {
+            mensagem.className = `alert alert-${classe || 'info'} mt-3`;
+            mensagem.textContent = texto;
+        }
+    }
+
+    function atualizarProgresso(recebidos, total) {
+        if (!barra) {
+            return;
+        }
+        const porcentagem = Math.floor((recebidos / total) * 100);
+        progresso.classList.remove('d-none');
+        barra.style.width = `${porcentagem}%`;
+        barra.textContent = `${porcentagem}%`;
+    }
+
+    async function requisitar(url, opcoes) {
+        const resposta = await fetch(url, {
+            credentials: 'same-origin',
+            ...opcoes,
+            headers: {'X-CSRFToken': csrf, ...(opcoes && opcoes.headers)},
+        });
+        const dados = await resposta.json().catch(() => ({}));
+        if (!resposta.ok) {
+            const erro = new Error(dados.error || `Erro ${resposta.status}`);
+            erro.status = resposta.status;
+            throw erro;
+        }
+        return dados;
+    }
+
+    async function sha256(blob) {
+        // crypto.subtle só existe em contexto seguro (HTTPS ou localhost)
+        if (!window.crypto || !crypto.subtle) {
+            return null;
+        }
+        const hash = await crypto.subtle.digest('SHA-256', await blob.arrayBuffer());
+        return Array.from(new Uint8Array(hash)).map((b) => b.toString(16).padStart(2, '0')).join('');
+    }
+
+    function faltantes(recebidos, tamanho, tamanhoChunk) {
+        const partes = [];
+        let posicao = 0;
+        for (const [inicio, fim] of recebidos.concat([[tamanho, tamanho]])) {
+            for (let p = posicao; p < inicio; p += tamanhoChunk) {
+                partes.push([p, Math.min(p + tamanhoChunk, inicio)]);
+            }
+            posicao = Math.max(posicao, fim);
+        }
+        return partes;
+    }
+
+    async function enviarParte(url, arquivo, inicio, fim) {
+        const parte = arquivo.slice(inicio, fim);
+        const cabecalhos = {'Content-Range': `bytes ${inicio}-${fim - 1}/${arquivo.size}`};
+        const hash = await sha256(parte);
+        if (hash) {
+            cabecalhos['X-Chunk-SHA256'] = hash;
+        }
+
+        for (let tentativa = 1; ; tentativa++) {
+            try {
+                return await requisitar(url, {method: 'PUT', headers: cabecalhos, body: parte});
+            } catch (erro) {
+                // Erros do servidor (4xx) não mudam numa nova tentativa
+                if ((erro.status && erro.status < 500) || tentativa >= TENTATIVAS) {
+                    throw erro;
+                }
+                await new Promise((r) => setTimeout(r, Math.min(1000 * 2 ** tentativa, 15000)));
+            }
+        }
+    }
+
+    async function enviar(arquivo) {
+        const chave = chaveLocal(arquivo);
+        let situacao = null;
+        let url = null;
+
+        const anterior = localStorage.getItem(chave);
+        if (anterior) {
+            try {
+                url = anterior;
+                situacao = await requisitar(url);
+                if (situacao.estado !== 'recebendo') {
+                    situacao = null;
+                }
+            } catch (erro) {
+                situacao = null;
+            }
+        }
+
+        if (!situacao) {
+            situacao = await requisitar(urlIniciar, {
+                method: 'POST',
+                headers: {'Content-Type': 'application/json'},
+                body: JSON.stringify({
+                    paciente: form.querySelector('[name=paciente]').value,
+                    prioridade: (form.querySelector('[name=prioridade]') || {}).value,
+                    nome: arquivo.name,
+                    tamanho: arquivo.size,
+                }),
+            });
+            url = `${urlIniciar}${situacao.id}/`;
+            localStorage.setItem(chave, url);
+        } else {
+            mostrar('Retomando envio interrompido...');
+        }
+
+        atualizarProgresso(situacao.bytes_recebidos, arquivo.size);
+        for (const [inicio, fim] of faltantes(situacao.recebidos, arquivo.size, situacao.tamanho_chunk)) {
+            situacao = await enviarParte(url, arquivo, inicio, fim);
+            atualizarProgresso(situacao.bytes_recebidos, arquivo.size);
+        }
+
+        const resultado = await requisitar(`${url}concluir/`, {method: 'POST'});
+        localStorage.removeItem(chave);
+        return resultado;
+    }
+
+    form.addEventListener('submit', async (evento) => {
+        const arquivo = campoArquivo.files[0];
+        if (!arquivo || !form.checkValidity()) {
+            return;
+        }
+        evento.preventDefault();
+
+        const botao = form.querySelector('[type=submit]');
+        botao.disabled = true;
+        mostrar('Enviando imagem...');
+        try {
+            const resultado = await enviar(arquivo);
+            mostrar('Exame OCT enviado com sucesso!', 'success');
+            window.location.href = resultado.url;
+        } catch (erro) {
+            if (erro.status >= 400 && erro.status < 500) {
+                localStorage.removeItem(chaveLocal(arquivo));
+            }
+            mostrar(`${erro.message}. Envie o mesmo arquivo novamente para continuar.`, 'danger');
+            botao.disabled = false;
+        }
+    });
+})();